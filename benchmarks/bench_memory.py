@@ -0,0 +1,73 @@
+"""Per-entity memory of the agent's device list, delta cache and rate limiter.
+
+Run from the repository root:
+
+    python benchmarks/bench_memory.py [entity counts...]
+
+Compares the traced Python heap of plain dicts (one dict per device, a
+value dict and bucket lists per entity, as before the state registry) with
+Device records plus one StateRegistry shared by DeltaCache and RateLimiter.
+"""
+
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "custom_components", "wizsmith-home-assistant"))
+
+from delta_cache import DeltaCache  # noqa: E402
+from rate_limiter import RateLimiter  # noqa: E402
+from state_registry import Device, StateRegistry  # noqa: E402
+
+
+def make_rows(count):
+    # ids and states come from JSON parsing in practice, so they are not shared strings
+    return [
+        (f"sensor_power_{i}", f"Power {i}", "sensor", "power", f"{random.uniform(0, 3000):.1f}")
+        for i in range(count)
+    ]
+
+
+def build_dicts(rows):
+    devices = [{"id": i, "name": n, "domain": d, "device_class": c, "state": s} for i, n, d, c, s in rows]
+    last = {d["id"]: d["state"] for d in devices}
+    now = time.monotonic()
+    buckets = {d["id"]: [1.0, now] for d in devices}
+    return devices, last, buckets
+
+
+def build_registry(rows):
+    devices = [Device(i, n, d, c, s) for i, n, d, c, s in rows]
+    registry = StateRegistry()
+    delta = DeltaCache(registry=registry)
+    limiter = RateLimiter({"power": 1.0}, registry=registry)
+    for d in devices:
+        delta.should_publish(d.id, d.state, d.device_class, limiter=limiter, domain=d.domain)
+    return devices, delta, limiter
+
+
+def traced(build, rows):
+    tracemalloc.start()
+    try:
+        kept = build(rows)  # noqa: F841
+        return tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    counts = [int(c) for c in sys.argv[1:]] or [1000, 5000]
+    for count in counts:
+        rows = make_rows(count)
+        plain = traced(build_dicts, rows)
+        compact = traced(build_registry, rows)
+        print(
+            f"{count:6d} entities: dicts {plain / 1024:7.0f} KiB ({plain / count:5.0f} B/entity), "
+            f"registry {compact / 1024:7.0f} KiB ({compact / count:5.0f} B/entity)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Microbenchmark for snapshot building and serialization.
+
+Run from the repository root:
+
+    python benchmarks/bench_snapshot.py [entity counts...]
+
+Times the delta pass plus snapshot serialization used by HubPublisher,
+with orjson (if installed) and with the stdlib fallback, then the size and
+encode time of compact full snapshots and 1% deltas.
+"""
+
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "custom_components", "wizsmith-home-assistant"))
+
+import snapshot  # noqa: E402
+from delta_cache import DeltaCache  # noqa: E402
+
+DOMAINS = ("sensor", "binary_sensor", "switch", "light")
+
+
+def make_states(count):
+    rows = []
+    for i in range(count):
+        domain = DOMAINS[i % len(DOMAINS)]
+        if domain == "sensor":
+            value = f"{random.uniform(0, 100):.2f}"
+        else:
+            value = random.choice(("on", "off"))
+        rows.append((f"{domain}.bench_{i}", value, "temperature" if domain == "sensor" else None))
+    return rows
+
+
+def publish_cycle(rows, delta):
+    changed = []
+    for entity_id, value, device_class in rows:
+        if delta.should_publish(entity_id, value, device_class, force=True):
+            changed.append((entity_id, value))
+    return snapshot.encode_snapshot("bench", delta.snapshot())
+
+
+def run(count, number=20):
+    rows = make_states(count)
+    delta = DeltaCache()
+    publish_cycle(rows, delta)
+    states = delta.snapshot()
+    results = {}
+    results["cycle"] = timeit.timeit(lambda: publish_cycle(rows, delta), number=number) / number
+    results["serialize"] = timeit.timeit(lambda: snapshot.encode_snapshot("bench", states), number=number) / number
+    size = len(snapshot.encode_snapshot("bench", states))
+    return results, size
+
+
+def run_compact(count, number=20):
+    rows = make_states(count)
+    states = {entity_id: value for entity_id, value, _ in rows}
+    changed = dict(list(states.items())[: max(1, count // 100)])
+    encoder = snapshot.CompactSnapshotEncoder("bench")
+    full = encoder.encode(states, full=True)
+    delta = encoder.encode(changed)
+    seconds = timeit.timeit(lambda: encoder.encode(states, full=True), number=number) / number
+    return seconds, len(full), len(delta)
+
+
+def main():
+    counts = [int(c) for c in sys.argv[1:]] or [1000, 10000]
+    fast = snapshot.orjson
+    encoders = [("orjson", fast), ("stdlib", None)] if fast else [("stdlib", None)]
+    for name, module in encoders:
+        snapshot.orjson = module
+        for count in counts:
+            results, size = run(count)
+            print(
+                f"{name:7s} {count:6d} entities: serialize {results['serialize'] * 1000:7.2f} ms, "
+                f"full cycle {results['cycle'] * 1000:7.2f} ms, snapshot {size / 1024:.0f} KiB"
+            )
+    snapshot.orjson = fast
+    body = "msgpack" if snapshot.msgpack else "json"
+    for count in counts:
+        seconds, full, delta = run_compact(count)
+        print(
+            f"compact {count:6d} entities ({body}): encode {seconds * 1000:7.2f} ms, "
+            f"full {full / 1024:.0f} KiB, 1% delta {delta} bytes"
+        )
+
+
+if __name__ == "__main__":
+    main()
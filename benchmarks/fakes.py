@@ -0,0 +1,436 @@
+"""In-process stand-ins for the MQTT broker and the OpenRemote/Keycloak server.
+
+Both run on background threads and only use the standard library, so the
+load tests can drive the real paho/aiohttp clients against them without any
+external service. They implement just enough of each protocol for the agent
+and the integration:
+
+* ``FakeBroker``: MQTT 3.1.1 CONNECT, SUBSCRIBE/UNSUBSCRIBE with wildcards,
+  PUBLISH at QoS 0/1, PING and DISCONNECT. Retained messages and QoS 2 are
+  not supported.
+* ``FakeOpenRemote``: the Keycloak token endpoint plus the asset query,
+  create, update, attribute and bulk attribute write calls, with optional
+  added latency and an error rate, and the ``/websocket/events`` stream:
+  ``EVENT-SUBSCRIBE`` with an asset filter, answered by ``EVENT-SUBSCRIBED``,
+  and ``TRIGGERED`` frames for every attribute write matching a filter.
+"""
+
+import asyncio
+import base64
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+import struct
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+
+
+def topic_matches(pattern: str, topic: str) -> bool:
+    p_levels = pattern.split("/")
+    t_levels = topic.split("/")
+    for i, level in enumerate(p_levels):
+        if level == "#":
+            return True
+        if i >= len(t_levels) or (level != "+" and level != t_levels[i]):
+            return False
+    return len(p_levels) == len(t_levels)
+
+
+def _encode_length(n: int) -> bytes:
+    out = bytearray()
+    while True:
+        digit, n = n % 128, n // 128
+        out.append(digit | (0x80 if n else 0))
+        if not n:
+            return bytes(out)
+
+
+def _utf8(s: bytes) -> bytes:
+    return len(s).to_bytes(2, "big") + s
+
+
+class FakeBroker:
+    """Minimal MQTT broker; ``on_publish(topic, payload, received_at)`` hooks see every PUBLISH."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host = host
+        self.port = port
+        self.on_publish: List[Callable[[str, bytes, float], None]] = []
+        self.published = 0
+        self.delivered = 0
+        self.bytes_in = 0
+        self._subs: Dict[asyncio.StreamWriter, List[str]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._server = None
+        self._ready = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> int:
+        self._thread = threading.Thread(target=self._run, name="fake-broker", daemon=True)
+        self._thread.start()
+        self._ready.wait(5)
+        return self.port
+
+    def stop(self) -> None:
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        if self._thread is not None:
+            self._thread.join(5)
+
+    def _run(self) -> None:
+        self._loop = asyncio.new_event_loop()
+        self._server = self._loop.run_until_complete(asyncio.start_server(self._client, self.host, self.port))
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._ready.set()
+        self._loop.run_forever()
+
+    async def _client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._subs[writer] = []
+        try:
+            while True:
+                header = await reader.readexactly(1)
+                length, multiplier = 0, 1
+                while True:
+                    byte = (await reader.readexactly(1))[0]
+                    length += (byte & 0x7F) * multiplier
+                    multiplier *= 128
+                    if not byte & 0x80:
+                        break
+                body = await reader.readexactly(length) if length else b""
+                kind = header[0] >> 4
+                if kind == 1:  # CONNECT
+                    writer.write(b"\x20\x02\x00\x00")
+                elif kind == 3:  # PUBLISH
+                    self._publish(header[0], body, writer)
+                elif kind == 8:  # SUBSCRIBE
+                    self._subscribe(body, writer)
+                elif kind == 10:  # UNSUBSCRIBE
+                    pos, filters = 2, []
+                    while pos < len(body):
+                        n = int.from_bytes(body[pos:pos + 2], "big")
+                        filters.append(body[pos + 2:pos + 2 + n].decode())
+                        pos += 2 + n
+                    self._subs[writer] = [f for f in self._subs[writer] if f not in filters]
+                    writer.write(b"\xb0\x02" + body[:2])
+                elif kind == 12:  # PINGREQ
+                    writer.write(b"\xd0\x00")
+                elif kind == 14:  # DISCONNECT
+                    break
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._subs.pop(writer, None)
+            writer.close()
+
+    def _subscribe(self, body: bytes, writer: asyncio.StreamWriter) -> None:
+        packet_id, pos, granted = body[:2], 2, bytearray()
+        while pos < len(body):
+            n = int.from_bytes(body[pos:pos + 2], "big")
+            self._subs[writer].append(body[pos + 2:pos + 2 + n].decode())
+            pos += 3 + n
+            granted.append(0)
+        writer.write(b"\x90" + _encode_length(2 + len(granted)) + packet_id + bytes(granted))
+
+    def _publish(self, flags: int, body: bytes, writer: asyncio.StreamWriter) -> None:
+        received_at = time.time()
+        qos = (flags >> 1) & 3
+        n = int.from_bytes(body[:2], "big")
+        topic = body[2:2 + n].decode()
+        pos = 2 + n
+        if qos:
+            writer.write(b"\x40\x02" + body[pos:pos + 2])
+            pos += 2
+        payload = body[pos:]
+        self.published += 1
+        self.bytes_in += len(body)
+        for hook in self.on_publish:
+            hook(topic, payload, received_at)
+        packet = None
+        for sub_writer, filters in list(self._subs.items()):
+            if any(topic_matches(f, topic) for f in filters):
+                if packet is None:
+                    rest = _utf8(topic.encode()) + payload
+                    packet = b"\x30" + _encode_length(len(rest)) + rest
+                sub_writer.write(packet)
+                self.delivered += 1
+
+
+def _fake_jwt(lifetime: int) -> str:
+    def part(obj):
+        return base64.urlsafe_b64encode(json.dumps(obj).encode()).rstrip(b"=").decode()
+    return f"{part({'alg': 'none'})}.{part({'exp': int(time.time()) + lifetime, 'jti': uuid.uuid4().hex})}.sig"
+
+
+class FakeOpenRemote:
+    """Fake OpenRemote manager plus Keycloak; ``requests`` counts calls per route."""
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, token_lifetime: int = 300):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.token_lifetime = token_lifetime
+        self.assets: Dict[str, dict] = {}
+        self.requests: Dict[str, int] = {}
+        self.attribute_writes = 0
+        self.bytes_in = 0
+        # hook for command deliveries: on_command(body, received_at)
+        self.on_command: List[Callable[[dict, float], None]] = []
+        # open event subscriptions: (socket, filter) per EVENT-SUBSCRIBE
+        self.subscriptions: List[tuple] = []
+        self.events_sent = 0
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def start(self) -> str:
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _handle(self):
+                if self.headers.get("Upgrade", "").lower() == "websocket":
+                    fake._websocket(self)
+                    self.close_connection = True
+                    return
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b""
+                status, body = fake._route(self.command, self.path, raw, self.headers.get("Content-Type", ""))
+                data = json.dumps(body).encode() if body is not None else b""
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = do_PUT = _handle
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="fake-openremote", daemon=True).start()
+        return self.url
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def _count(self, route: str, nbytes: int) -> None:
+        with self._lock:
+            self.requests[route] = self.requests.get(route, 0) + 1
+            self.bytes_in += nbytes
+
+    def _route(self, method: str, path: str, raw: bytes, content_type: str):
+        received_at = time.time()
+        parts = path.split("?", 1)[0].strip("/").split("/")
+        if self.latency:
+            time.sleep(self.latency)
+        if parts[:1] == ["auth"]:
+            self._count("token", len(raw))
+            return 200, {
+                "access_token": _fake_jwt(self.token_lifetime),
+                "expires_in": self.token_lifetime,
+                "refresh_token": uuid.uuid4().hex,
+                "refresh_expires_in": self.token_lifetime * 6,
+            }
+        if self.error_rate and random.random() < self.error_rate:
+            self._count("error", len(raw))
+            return 503, {"error": "injected"}
+        body = json.loads(raw) if raw and "json" in content_type else None
+        route = "/".join(parts[2:])  # drop "api/<realm>"
+        if route == "asset/query":
+            self._count("query", len(raw))
+            return 200, self._query(body or {})
+        if route == "asset" and method == "POST":
+            self._count("create", len(raw))
+            asset = dict(body, id=uuid.uuid4().hex[:22], attributes={})
+            if "parent" in asset:
+                asset["parentId"] = asset.pop("parent").get("id")
+            with self._lock:
+                self.assets[asset["id"]] = asset
+            return 200, asset
+        if route == "asset/attributes" and method == "PUT":
+            self._count("attributes", len(raw))
+            states = json.loads(raw)
+            with self._lock:
+                self.attribute_writes += len(states)
+            for state in states:
+                ref = state.get("ref") or {}
+                self.write_attribute(ref.get("id"), ref.get("name"), state.get("value"))
+            return 200, [{"ref": s.get("ref"), "success": True} for s in states]
+        if route == "asset/attribute/update":
+            self._count("command", len(raw))
+            for hook in self.on_command:
+                hook(body or {}, received_at)
+            return 200, None
+        if len(parts) == 5 and parts[2] == "asset" and parts[4] == "attribute":
+            self._count("attribute", len(raw))
+            with self._lock:
+                asset = self.assets.get(parts[3])
+                if asset is None:
+                    return 404, {"error": "not found"}
+                asset["attributes"][body["name"]] = body
+            return 200, body
+        if len(parts) == 4 and parts[2] == "asset" and method == "PUT":
+            self._count("update", len(raw))
+            with self._lock:
+                self.assets[parts[3]] = dict(body, id=parts[3])
+            return 200, self.assets[parts[3]]
+        self._count("unknown", len(raw))
+        return 404, {"error": f"no route for {method} {path}"}
+
+    def _query(self, query: dict) -> list:
+        def name_ok(name: str) -> bool:
+            preds = query.get("names")
+            if not preds:
+                return True
+            for p in preds:
+                if isinstance(p, str) and p == name:
+                    return True
+                if isinstance(p, dict):
+                    value = p.get("value", "")
+                    if (p.get("match") == "BEGIN" and name.startswith(value)) or name == value:
+                        return True
+            return False
+
+        ids = set(query.get("ids") or ())
+        parents = {p.get("id") for p in query.get("parents") or ()}
+        with self._lock:
+            found = [
+                a for a in self.assets.values()
+                if (not ids or a["id"] in ids)
+                and (not parents or a.get("parentId") in parents)
+                and name_ok(a.get("name", ""))
+            ]
+        offset = int(query.get("offset") or 0)
+        limit = int(query.get("limit") or 0)
+        return found[offset:offset + limit] if limit else found[offset:]
+
+    def write_attribute(self, asset_id: str, name: str, value) -> int:
+        """Write an attribute as a user or rule in the manager would; returns events delivered."""
+        event = {
+            "eventType": "attribute",
+            "ref": {"id": asset_id, "name": name},
+            "value": value,
+            "timestamp": int(time.time() * 1000),
+        }
+        with self._lock:
+            asset = self.assets.get(asset_id)
+            if asset is not None and name in asset["attributes"]:
+                asset["attributes"][name]["value"] = value
+            targets = [(sock, flt) for sock, flt in self.subscriptions if _event_matches(flt, asset_id, name)]
+        sent = 0
+        for sock, flt in targets:
+            frame = "TRIGGERED:" + json.dumps({"subscriptionId": flt.get("subscriptionId"), "events": [event]})
+            if sock.send_text(frame):
+                sent += 1
+        with self._lock:
+            self.events_sent += sent
+        return sent
+
+    def _websocket(self, handler: BaseHTTPRequestHandler) -> None:
+        self._count("websocket", 0)
+        key = handler.headers.get("Sec-WebSocket-Key", "")
+        accept = base64.b64encode(hashlib.sha1((key + _WS_GUID).encode()).digest()).decode()
+        handler.send_response(101)
+        handler.send_header("Upgrade", "websocket")
+        handler.send_header("Connection", "Upgrade")
+        handler.send_header("Sec-WebSocket-Accept", accept)
+        handler.end_headers()
+        handler.wfile.flush()
+        sock = _WebSocket(handler.rfile, handler.wfile)
+        try:
+            while True:
+                opcode, payload = sock.recv()
+                if opcode is None or opcode == 0x8:
+                    sock.send(0x8, payload or b"")
+                    return
+                if opcode == 0x9:
+                    sock.send(0xA, payload)
+                elif opcode == 0x1:
+                    prefix, _, data = payload.decode().partition(":")
+                    if prefix == "EVENT-SUBSCRIBE":
+                        subscription = json.loads(data)
+                        with self._lock:
+                            self.subscriptions.append((sock, subscription))
+                        sock.send_text("EVENT-SUBSCRIBED:" + json.dumps(
+                            {"subscriptionId": subscription.get("subscriptionId")}
+                        ))
+        except (ConnectionError, OSError, ValueError):
+            pass
+        finally:
+            sock.closed = True
+            with self._lock:
+                self.subscriptions = [(s, f) for s, f in self.subscriptions if s is not sock]
+
+
+_WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+def _event_matches(subscription: dict, asset_id: str, name: str) -> bool:
+    flt = subscription.get("filter") or {}
+    ids = flt.get("assetIds")
+    names = flt.get("attributeNames")
+    return (not ids or asset_id in ids) and (not names or name in names)
+
+
+class _WebSocket:
+    """Server side of RFC 6455 framing: masked frames in, unmasked frames out, no fragmentation."""
+
+    def __init__(self, rfile, wfile):
+        self.rfile = rfile
+        self.wfile = wfile
+        self.closed = False
+        self._send_lock = threading.Lock()
+
+    def _read(self, n: int) -> bytes:
+        data = self.rfile.read(n)
+        if len(data) < n:
+            raise ConnectionError("websocket closed")
+        return data
+
+    def recv(self):
+        head = self.rfile.read(2)
+        if len(head) < 2:
+            return None, None
+        opcode, length = head[0] & 0x0F, head[1] & 0x7F
+        if length == 126:
+            length = struct.unpack("!H", self._read(2))[0]
+        elif length == 127:
+            length = struct.unpack("!Q", self._read(8))[0]
+        mask = self._read(4) if head[1] & 0x80 else None
+        payload = self._read(length)
+        if mask:
+            payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+        return opcode, payload
+
+    def send(self, opcode: int, payload: bytes) -> bool:
+        n = len(payload)
+        if n < 126:
+            header = struct.pack("!BB", 0x80 | opcode, n)
+        elif n < 1 << 16:
+            header = struct.pack("!BBH", 0x80 | opcode, 126, n)
+        else:
+            header = struct.pack("!BBQ", 0x80 | opcode, 127, n)
+        with self._send_lock:
+            if self.closed:
+                return False
+            try:
+                self.wfile.write(header + payload)
+                self.wfile.flush()
+                return True
+            except OSError:
+                self.closed = True
+                return False
+
+    def send_text(self, text: str) -> bool:
+        return self.send(0x1, text.encode())
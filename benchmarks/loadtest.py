@@ -0,0 +1,322 @@
+"""Load tests for the agent and OpenRemoteClient against in-process stand-ins.
+
+Run from the repository root (needs the agent's requirements: paho-mqtt,
+requests and aiohttp):
+
+    python benchmarks/loadtest.py [all|publish|commands|openremote|provision] [options]
+
+The scenarios are:
+
+* publish: main.py's state publishing for ``--entities`` changing entities
+  over ``--cycles`` cycles, through paho to the fake broker.
+* commands: ``--rate`` commands/s for ``--duration`` seconds into the
+  agent's MQTT command path, forwarded to the fake OpenRemote.
+* openremote: OpenRemoteClient provisioning, snapshot writes and bulk
+  attribute flushes.
+* provision: fleet.py provisioning ``--pis`` hubs, then a second no-op run.
+
+Each reports throughput, p50/p99 latency and memory (peak RSS, plus the
+traced Python heap with ``--memory``, which slows everything down).
+``--json`` prints the results as one JSON object for comparing runs.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "custom_components", "wizsmith-home-assistant"))
+
+from fakes import FakeBroker, FakeOpenRemote  # noqa: E402
+
+
+def percentiles(values):
+    if not values:
+        return {"count": 0, "p50_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0}
+    values = sorted(values)
+    pick = lambda q: values[min(len(values) - 1, int(len(values) * q))] * 1000  # noqa: E731
+    return {"count": len(values), "p50_ms": round(pick(0.5), 3), "p99_ms": round(pick(0.99), 3),
+            "max_ms": round(values[-1] * 1000, 3)}
+
+
+def wait_for(predicate, timeout):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+class _MemoryStore:
+    """Stands in for Home Assistant's Store so OpenRemoteClient.setup() runs outside HA."""
+
+    def __init__(self):
+        self.data = None
+
+    async def async_load(self):
+        return self.data
+
+    async def async_save(self, data):
+        self.data = data
+
+
+def load_agent(broker, openremote, workdir):
+    """Import main.py configured for the stand-ins (its settings are read at import time)."""
+    os.environ.update({
+        "MQTT_HOST": "127.0.0.1",
+        "MQTT_PORT": str(broker.port),
+        "OPENREMOTE_URL": openremote.url,
+        "OPENREMOTE_USER": "bench",
+        "OPENREMOTE_PASS": "bench",
+        "BUFFER_DIR": os.path.join(workdir, "buffer"),
+        "DISCOVERY_INDEX_PATH": os.path.join(workdir, "discovery_index.json"),
+        "HA_TOKEN": "",
+        "SUPERVISOR_TOKEN": "",
+        # the commands scenario measures the agent's forwarding path, which is off by default
+        "FORWARD_COMMANDS": "true",
+    })
+    import main as agent
+    logging.getLogger().setLevel(logging.WARNING)
+    return agent
+
+
+def connect(agent, client_id, on_message=None):
+    client = agent.mqtt.Client(client_id=client_id, clean_session=True)
+    connected = threading.Event()
+    client.on_connect = lambda c, u, f, rc: connected.set()
+    if on_message is not None:
+        client.on_message = on_message
+    client.connect(agent.MQTT_HOST, agent.MQTT_PORT, 60)
+    client.loop_start()
+    if not connected.wait(5):
+        raise RuntimeError("could not connect to the fake broker")
+    return client
+
+
+def bench_publish(agent, broker, args):
+    agent.DEVICES = [
+        agent.Device(f"bench_{i}", f"Bench {i}", "sensor", "temperature", "0") for i in range(args.entities)
+    ]
+    client = connect(agent, "bench-publisher")
+    sent, latencies = {}, []
+
+    def on_publish(topic, payload, received_at):
+        started = sent.pop(topic, None)
+        if started is not None:
+            latencies.append(received_at - started)
+
+    broker.on_publish.append(on_publish)
+    cycle_times = []
+    expected = broker.published + args.entities * args.cycles
+    started = time.perf_counter()
+    try:
+        for cycle in range(args.cycles):
+            for device in agent.DEVICES:
+                device.state = str(cycle + 1)
+            t0 = time.perf_counter()
+            for topic, payload in agent._state_messages():
+                sent[topic] = time.time()
+                agent.safe_publish(client, topic, payload)
+            cycle_times.append(time.perf_counter() - t0)
+            # let the previous cycle land before reusing its topics
+            wait_for(lambda: not sent, 10)
+        wait_for(lambda: broker.published >= expected, 10)
+        elapsed = time.perf_counter() - started
+    finally:
+        broker.on_publish.remove(on_publish)
+        client.loop_stop()
+        client.disconnect()
+    messages = args.entities * args.cycles
+    return {
+        "messages": messages,
+        "received": len(latencies),
+        "msgs_per_s": round(messages / elapsed, 1),
+        "cycle": percentiles(cycle_times),
+        "latency": percentiles(latencies),
+    }
+
+
+def bench_commands(agent, openremote, args):
+    latencies = []
+    openremote.on_command.append(lambda body, at: latencies.append(at - (body.get("payload") or {}).get("ts", at)))
+    agent.COMMAND_DISPATCHER.start()
+    receiver = connect(agent, "bench-agent", agent.on_message)
+    receiver.subscribe("wizsmith/commands/#", qos=0)
+    sender = connect(agent, "bench-commands")
+    time.sleep(0.2)
+    total = int(args.rate * args.duration)
+    interval = 1.0 / args.rate
+    started = time.perf_counter()
+    try:
+        for seq in range(total):
+            due = started + seq * interval
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            payload = json.dumps({"seq": seq, "ts": time.time()})
+            sender.publish(f"wizsmith/commands/bench_{seq % args.devices}/set", payload, qos=0)
+        wait_for(lambda: len(latencies) >= total, 30)
+        elapsed = time.perf_counter() - started
+    finally:
+        sender.loop_stop()
+        sender.disconnect()
+        receiver.loop_stop()
+        receiver.disconnect()
+        agent.COMMAND_DISPATCHER.stop()
+        openremote.on_command.clear()
+    return {
+        "sent": total,
+        "forwarded": len(latencies),
+        "commands_per_s": round(len(latencies) / elapsed, 1),
+        "latency": percentiles(latencies),
+        "dispatcher": agent.COMMAND_DISPATCHER.stats(),
+    }
+
+
+async def bench_openremote(agent, openremote, args):
+    from const import CONF_OR_BATCH_DELAY, CONF_OR_PASS, CONF_OR_REALM, CONF_OR_URL, CONF_OR_USER
+    from openremote_client import OpenRemoteClient
+    from snapshot import encode_snapshot
+
+    cfg = {CONF_OR_URL: openremote.url, CONF_OR_USER: "bench", CONF_OR_PASS: "bench",
+           CONF_OR_REALM: "master", CONF_OR_BATCH_DELAY: 0}
+    client = OpenRemoteClient(agent._AgentRuntime(asyncio.get_running_loop()), cfg, f"bench-{int(time.time())}")
+    client._store = _MemoryStore()
+    try:
+        t0 = time.perf_counter()
+        await client.setup()
+        provision = time.perf_counter() - t0
+        if not client.ready.is_set():
+            raise RuntimeError("OpenRemoteClient provisioning against the fake server failed")
+
+        snapshot_times = []
+        states = {f"sensor.bench_{i}": "0" for i in range(args.entities)}
+        for cycle in range(args.cycles):
+            for entity_id in states:
+                states[entity_id] = str(cycle)
+            t0 = time.perf_counter()
+            client.queue_sensors_json(encode_snapshot(client.pi_id, states))
+            await client.async_flush_attributes()
+            snapshot_times.append(time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        for i in range(args.entities):
+            client.queue_attribute(client.child_id, f"bench_{i}", i)
+        await client.async_flush_attributes()
+        bulk = time.perf_counter() - t0
+        writes = client.metrics.stage("openremote_write")
+        return {
+            "provision_ms": round(provision * 1000, 3),
+            "snapshot_write": percentiles(snapshot_times),
+            "bulk_attributes_per_s": round(args.entities / bulk, 1),
+            "openremote_write": writes,
+            "bytes_sent": client.metrics.counter("openremote_bytes"),
+            "requests": dict(openremote.requests),
+        }
+    finally:
+        await client.async_close()
+
+
+async def bench_provision(openremote, args):
+    import aiohttp
+    import fleet
+
+    pi_ids = [f"load-{i}" for i in range(args.pis)]
+    fleet_args = fleet.parse_args([
+        *pi_ids, "--url", openremote.url, "--user", "bench", "--password", "bench",
+        "--concurrency", str(args.concurrency), "--rate", "0",
+    ])
+    results = {}
+    async with aiohttp.ClientSession() as session:
+        for run in ("create", "noop"):
+            before = sum(openremote.requests.values())
+            t0 = time.perf_counter()
+            provisioner = fleet.FleetProvisioner(session, fleet_args)
+            ok = await provisioner.run(pi_ids)
+            elapsed = time.perf_counter() - t0
+            results[run] = {
+                "ok": ok,
+                "seconds": round(elapsed, 3),
+                "pis_per_s": round(len(pi_ids) / elapsed, 1),
+                "requests": sum(openremote.requests.values()) - before,
+                "counts": provisioner.counts,
+            }
+    return results
+
+
+def measure(fn, memory):
+    if memory:
+        tracemalloc.start()
+    try:
+        result = fn()
+        if memory:
+            result["heap_peak_kib"] = tracemalloc.get_traced_memory()[1] // 1024
+    finally:
+        if memory:
+            tracemalloc.stop()
+    # ru_maxrss is KiB on Linux
+    result["max_rss_kib"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return result
+
+
+def report(name, result):
+    print(f"== {name}")
+    for key, value in result.items():
+        print(f"  {key}: {json.dumps(value) if isinstance(value, dict) else value}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="WizSmith publish/command/provisioning load tests")
+    parser.add_argument("scenario", nargs="?", default="all",
+                        choices=("all", "publish", "commands", "openremote", "provision"))
+    parser.add_argument("--entities", type=int, default=1000)
+    parser.add_argument("--cycles", type=int, default=10)
+    parser.add_argument("--rate", type=float, default=200.0, help="commands per second")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds of command load")
+    parser.add_argument("--devices", type=int, default=50, help="distinct command targets")
+    parser.add_argument("--pis", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.0, help="added fake OpenRemote latency (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of fake OpenRemote 503s")
+    parser.add_argument("--memory", action="store_true", help="trace the Python heap (slow)")
+    parser.add_argument("--json", action="store_true", help="print one JSON object instead of a report")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+    broker = FakeBroker()
+    broker.start()
+    openremote = FakeOpenRemote(latency=args.latency, error_rate=args.error_rate)
+    openremote.start()
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        agent = load_agent(broker, openremote, workdir)
+        scenarios = {
+            "publish": lambda: bench_publish(agent, broker, args),
+            "commands": lambda: bench_commands(agent, openremote, args),
+            "openremote": lambda: asyncio.run(bench_openremote(agent, openremote, args)),
+            "provision": lambda: asyncio.run(bench_provision(openremote, args)),
+        }
+        try:
+            for name, fn in scenarios.items():
+                if args.scenario in ("all", name):
+                    results[name] = measure(fn, args.memory)
+                    if not args.json:
+                        report(name, results[name])
+        finally:
+            broker.stop()
+            openremote.stop()
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
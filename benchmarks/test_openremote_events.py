@@ -0,0 +1,160 @@
+"""OpenRemote commands over the event WebSocket, end to end against FakeOpenRemote.
+
+Run from the repository root (needs aiohttp and Home Assistant installed):
+
+    python -m pytest benchmarks/test_openremote_events.py
+
+OpenRemoteClient provisions the hub's assets on the fake manager and opens
+its event subscription; a write to the child asset's commands attribute
+then reaches LocalCommandHandler as a real ``TRIGGERED`` frame and must turn
+into exactly one service call on the addressed entity.
+"""
+
+import asyncio
+import importlib
+import os
+import sys
+import types
+
+import pytest
+
+pytest.importorskip("aiohttp")
+pytest.importorskip("homeassistant.components.mqtt")
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from fakes import FakeOpenRemote  # noqa: E402
+
+PACKAGE_DIR = os.path.join(os.path.dirname(__file__), "..", "custom_components", "wizsmith-home-assistant")
+
+
+def load_integration(module):
+    """Import one integration module without running its __init__ (which needs a running HA)."""
+    if "wizsmith" not in sys.modules:
+        package = types.ModuleType("wizsmith")
+        package.__path__ = [PACKAGE_DIR]
+        sys.modules["wizsmith"] = package
+    return importlib.import_module(f"wizsmith.{module}")
+
+
+class _MemoryStore:
+    def __init__(self):
+        self.data = None
+
+    async def async_load(self):
+        return self.data
+
+    async def async_save(self, data):
+        self.data = data
+
+
+class _Services:
+    def __init__(self, services):
+        self.services = set(services)
+        self.calls = []
+        self.called = asyncio.Event()
+
+    def has_service(self, domain, service):
+        return (domain, service) in self.services
+
+    async def async_call(self, domain, service, data, blocking=False):
+        self.calls.append((domain, service, data))
+        self.called.set()
+
+
+class _Hass:
+    """The parts of HomeAssistant that OpenRemoteClient and LocalCommandHandler use."""
+
+    def __init__(self, config_dir, entity_ids, services):
+        self.loop = asyncio.get_running_loop()
+        self.config = types.SimpleNamespace(path=lambda *parts: os.path.join(config_dir, *parts))
+        self.states = types.SimpleNamespace(get=lambda entity_id: object() if entity_id in entity_ids else None)
+        self.services = _Services(services)
+        self._tasks = set()
+
+    def async_create_task(self, coro):
+        task = self.loop.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def async_create_background_task(self, coro, name):
+        return self.async_create_task(coro)
+
+    def async_add_executor_job(self, func, *args):
+        return self.loop.run_in_executor(None, func, *args)
+
+
+async def _until(predicate, timeout=5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        if asyncio.get_running_loop().time() > deadline:
+            raise AssertionError("timed out")
+        await asyncio.sleep(0.01)
+
+
+@pytest.fixture
+def openremote():
+    fake = FakeOpenRemote()
+    fake.start()
+    yield fake
+    fake.stop()
+
+
+def test_command_attribute_write_runs_service_call(openremote, tmp_path):
+    asyncio.run(_command_attribute_write_runs_service_call(openremote, str(tmp_path)))
+
+
+async def _command_attribute_write_runs_service_call(openremote, config_dir):
+    const = load_integration("const")
+    client_module = load_integration("openremote_client")
+    handler_module = load_integration("command_handler")
+    loop = asyncio.get_running_loop()
+
+    hass = _Hass(config_dir, {"light.kitchen", "light.hall"}, {("light", "turn_on"), ("light", "turn_off")})
+    cfg = {
+        const.CONF_OR_URL: openremote.url,
+        const.CONF_OR_USER: "test",
+        const.CONF_OR_PASS: "test",
+        const.CONF_OR_REALM: "master",
+        const.CONF_OR_BATCH_DELAY: 0,
+    }
+    client = client_module.OpenRemoteClient(hass, cfg, "test-pi")
+    client._store = _MemoryStore()
+    handler = handler_module.LocalCommandHandler(hass, client, cfg)
+    try:
+        await client.setup()
+        assert client.ready.is_set()
+        assert const.COMMANDS_ATTRIBUTE in openremote.assets[client.child_id]["attributes"]
+
+        client.subscribe_attribute_events(handler._on_attribute_event)
+        await _until(lambda: client.events_connected)
+
+        # the hub's own snapshot writes are not commands
+        client.queue_sensors_json('{"pi_id": "test-pi", "states": {}}')
+        await client.async_flush_attributes()
+        assert openremote.events_sent == 0
+
+        command = {
+            "device_id": "light_kitchen",
+            "action": "on",
+            "payload": {"brightness": 80, "entity_id": "light.hall"},
+        }
+        sent = await loop.run_in_executor(
+            None, openremote.write_attribute, client.child_id, const.COMMANDS_ATTRIBUTE, command
+        )
+        assert sent == 1
+        await asyncio.wait_for(hass.services.called.wait(), 5)
+        # the payload adds service data but cannot retarget the call
+        assert hass.services.calls == [("light", "turn_on", {"brightness": 80, "entity_id": "light.kitchen"})]
+        assert handler.remote == 1
+
+        await loop.run_in_executor(
+            None, openremote.write_attribute, client.child_id, const.COMMANDS_ATTRIBUTE,
+            {"device_id": "light.kitchen", "action": "light.turn_off"},
+        )
+        await _until(lambda: handler.rejected == 1)
+        assert len(hass.services.calls) == 1
+    finally:
+        handler.async_stop()
+        await client.async_close()
@@ -0,0 +1,46 @@
+"""SegmentBuffer behaviour that the replay loops depend on.
+
+Run from the repository root:
+
+    python -m pytest benchmarks/test_store_forward.py
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "custom_components", "wizsmith-home-assistant"))
+
+from store_forward import SegmentBuffer  # noqa: E402
+
+
+def test_commit_after_eviction_keeps_the_buffer_readable(tmp_path):
+    buffer = SegmentBuffer(str(tmp_path), max_bytes=300, segment_bytes=100)
+    for i in range(5):
+        buffer.append(b"old-%02d-" % i + b"x" * 20)
+    records = buffer.read(2)
+    # appends while those two are being delivered evict the segment they came from
+    for i in range(10):
+        buffer.append(b"new-%02d-" % i + b"x" * 20)
+    assert buffer.evicted_segments
+    buffer.commit(records[-1][1], len(records))
+
+    replayed = []
+    while not buffer.empty:
+        batch = buffer.read(4)
+        assert batch
+        replayed.extend(line for line, _ in batch)
+        buffer.commit(batch[-1][1], len(batch))
+    assert replayed[-1].startswith(b"new-09-")
+    assert not any(line in replayed for line, _ in records)
+    buffer.close()
+
+
+def test_reopen_reuses_the_newest_segment(tmp_path):
+    for i in range(3):
+        buffer = SegmentBuffer(str(tmp_path))
+        buffer.append(b"record-%d" % i)
+        buffer.close()
+    assert sorted(os.listdir(tmp_path)) == ["000000000000.seg"]
+    buffer = SegmentBuffer(str(tmp_path))
+    assert [line for line, _ in buffer.read(10)] == [b"record-0", b"record-1", b"record-2"]
+    buffer.close()
@@ -1,26 +1,36 @@
 """WizSmith Home Integration - zero-touch OpenRemote registration + MQTT publishing."""
 
 from __future__ import annotations
-import asyncio
 import json
 import logging
 import os
+import pathlib
+import time
 import uuid
 from typing import Any, Dict, Optional
 
 import aiohttp
+import voluptuous as vol
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.core import HomeAssistant
-from homeassistant.components import mqtt as ha_mqtt
+from homeassistant.core import HomeAssistant, ServiceCall
+from homeassistant.helpers.aiohttp_client import async_get_clientsession
 
 from .const import *
 
 _LOGGER = logging.getLogger(__name__)
 
+# below ~0.5 ms the sampler thread spins and the profile measures itself
+PROFILE_CYCLE_SCHEMA = vol.Schema({
+    vol.Optional("interval_ms", default=2): vol.All(vol.Coerce(float), vol.Range(min=0.5)),
+})
+
 def _load_config(entry: ConfigEntry) -> Dict[str, Any]:
     cfg = {}
     if entry and entry.data:
         cfg.update(entry.data)
+    # options flow values win over the initial setup
+    if entry and entry.options:
+        cfg.update(entry.options)
 
     options_path = "/data/options.json"
     try:
@@ -40,35 +50,55 @@ def _load_config(entry: ConfigEntry) -> Dict[str, Any]:
 
     return cfg
 
+def _load_pi_id(pi_id_path: str) -> str:
+    try:
+        if os.path.exists(pi_id_path):
+            with open(pi_id_path, "r") as f:
+                return f.read().strip()
+        pi_id = str(uuid.uuid4())
+        with open(pi_id_path, "w") as f:
+            f.write(pi_id)
+        return pi_id
+    except Exception:
+        _LOGGER.exception("Could not read/write pi_id file; generating ephemeral id")
+        return str(uuid.uuid4())
+
+def _read_manifest_version() -> Optional[str]:
+    try:
+        manifest_path = pathlib.Path(__file__).parent / "manifest.json"
+        with open(manifest_path, "r") as mf:
+            return json.load(mf).get("version")
+    except Exception:
+        return None
+
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
-    cfg = _load_config(entry)
+    # file reads run in the executor; nothing on the setup path waits on the network
+    cfg = await hass.async_add_executor_job(_load_config, entry)
 
     mqtt_host = cfg.get(CONF_MQTT_HOST)
     mqtt_port = int(cfg.get(CONF_MQTT_PORT, DEFAULT_MQTT_PORT))
     mqtt_user = cfg.get(CONF_MQTT_USER)
     mqtt_pass = cfg.get(CONF_MQTT_PASS)
-    sync_interval = int(cfg.get(CONF_SYNC_INTERVAL, DEFAULT_SYNC_INTERVAL))
     openremote_url = cfg.get(CONF_OR_URL)
     realm = cfg.get(CONF_OR_REALM)
     github_repo = cfg.get(CONF_GITHUB_REPO, DEFAULT_GITHUB_REPO)
 
-    # persistent pi_id
+    # persistent pi_id, loaded once per hub
     pi_id_path = "/config/wizsmith_home_assistant_pi_id"
-    if "pi_id" in hass.data:
-        pi_id = hass.data["pi_id"]
+    if DATA_HUB in hass.data:
+        pi_id = hass.data[DATA_HUB].pi_id
     else:
-        try:
-            if os.path.exists(pi_id_path):
-                with open(pi_id_path, "r") as f:
-                    pi_id = f.read().strip()
-            else:
-                pi_id = str(uuid.uuid4())
-                with open(pi_id_path, "w") as f:
-                    f.write(pi_id)
-        except Exception:
-            _LOGGER.exception("Could not read/write pi_id file; generating ephemeral id")
-            pi_id = str(uuid.uuid4())
-        hass.data["pi_id"] = pi_id
+        pi_id = await hass.async_add_executor_job(_load_pi_id, pi_id_path)
+
+    # One publishing core per hub: the first entry creates it, every entry adds its destinations
+    from .publisher import BrokerSink, HubPublisher, MqttSink, OpenRemoteSink
+    hub = hass.data.get(DATA_HUB)
+    created_hub = hub is None
+    if created_hub:
+        hub = hass.data[DATA_HUB] = HubPublisher(hass, cfg, pi_id, entry.entry_id)
+    elif not hub.has_entry(hub.entry_id):
+        # the entry the hub took its settings from was reloaded (options changed) or removed
+        hub.async_reconfigure(cfg, entry.entry_id)
 
     _LOGGER.info("WizSmith integration starting for pi_id=%s", pi_id)
 
@@ -77,61 +107,112 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     hass.data[DOMAIN][entry.entry_id] = {
         "cfg": cfg,
         "pi_id": pi_id,
+        "hub": hub,
     }
 
-    # OpenRemote auth + ensure assets
-    from .openremote_client import OpenRemoteClient
-    or_client = OpenRemoteClient(hass, cfg, pi_id)
-    await or_client.setup()
-    
-    hass.data[DOMAIN][entry.entry_id]["or_client"] = or_client
-
-    # Publish loop using Home Assistant's built-in MQTT
-    async def _publish_loop() -> None:
-        while True:
-            try:
-                from .sensor import publish_sensors
-                # Use Home Assistant's MQTT instead of paho-mqtt
-                await publish_sensors(hass, or_client)
-            except Exception as e:
-                _LOGGER.exception("Error in publish loop: %s", e)
-            await asyncio.sleep(sync_interval)
-
-    hass.data[DOMAIN][entry.entry_id]["publish_task"] = hass.async_create_task(_publish_loop())
+    # One OpenRemote client per realm, owned by its sink: entries for the same realm share it
+    or_key = f"openremote:{openremote_url}:{realm}"
+    or_sink = hub.sink(or_key)
+    if or_sink is None:
+        from .openremote_client import OpenRemoteClient
+        or_client = OpenRemoteClient(hass, cfg, pi_id)
+        # Commands for entities on this instance run as service calls instead of a trip through
+        # OpenRemote; one handler per hub, or every command would run once per realm
+        command_handler = None
+        if cfg.get(CONF_LOCAL_COMMANDS, DEFAULT_LOCAL_COMMANDS) and not hub.has_status_source("local_commands"):
+            from .command_handler import LocalCommandHandler
+            command_handler = LocalCommandHandler(hass, or_client, cfg)
+            hub.add_status_source(or_key, "local_commands", command_handler.stats)
+        or_sink = OpenRemoteSink(hass, or_key, or_client, command_handler)
+
+    # Compact MQTT snapshots for metered uplinks
+    encoder = None
+    if cfg.get(CONF_SNAPSHOT_ENCODING, DEFAULT_SNAPSHOT_ENCODING) == SNAPSHOT_ENCODING_COMPACT:
+        from .snapshot import ENCODING_MSGPACK, CompactSnapshotEncoder, msgpack
+        if msgpack is None:
+            _LOGGER.warning("msgpack is not installed; compact snapshots fall back to JSON bodies")
+        encoder = CompactSnapshotEncoder(
+            pi_id, ENCODING_MSGPACK, int(cfg.get(CONF_COMPRESS_MIN_BYTES, DEFAULT_COMPRESS_MIN_BYTES))
+        )
+
+    if cfg.get(CONF_MQTT_DIRECT, DEFAULT_MQTT_DIRECT):
+        hub.add_sink(entry.entry_id, BrokerSink(hass, f"mqtt:{mqtt_host}:{mqtt_port}", pi_id, cfg, encoder))
+    else:
+        # Home Assistant's built-in MQTT
+        hub.add_sink(entry.entry_id, MqttSink(hass, "mqtt", pi_id, encoder))
+    hub.add_sink(entry.entry_id, or_sink)
+    if created_hub:
+        hub.async_start()
 
     # GitHub release checker
     async def _check_github_release():
         try:
             gh_api = f"https://api.github.com/repos/{github_repo}/releases/latest"
-            async with aiohttp.ClientSession() as s:
-                async with s.get(gh_api, timeout=aiohttp.ClientTimeout(total=10)) as resp:
-                    if resp.status == 200:
-                        r = await resp.json()
-                        latest_tag = r.get("tag_name")
-                        curr_version = None
-                        try:
-                            import pathlib
-                            manifest_path = pathlib.Path(__file__).parent / "manifest.json"
-                            with open(manifest_path, "r") as mf:
-                                m = json.load(mf)
-                                curr_version = m.get("version")
-                        except Exception:
-                            pass
-                        if latest_tag and curr_version and latest_tag != curr_version:
-                            _LOGGER.info("New integration release available on GitHub: %s (current=%s)", latest_tag, curr_version)
+            s = async_get_clientsession(hass)
+            async with s.get(gh_api, timeout=aiohttp.ClientTimeout(total=10)) as resp:
+                if resp.status == 200:
+                    r = await resp.json()
+                    latest_tag = r.get("tag_name")
+                    curr_version = await hass.async_add_executor_job(_read_manifest_version)
+                    if latest_tag and curr_version and latest_tag != curr_version:
+                        _LOGGER.info("New integration release available on GitHub: %s (current=%s)", latest_tag, curr_version)
         except Exception:
             _LOGGER.debug("GitHub release check failed")
 
-    hass.async_create_task(_check_github_release())
+    hass.async_create_background_task(_check_github_release(), f"{DOMAIN} release check")
+
+    await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
+    entry.async_on_unload(entry.add_update_listener(_async_options_updated))
+    if not hass.services.has_service(DOMAIN, SERVICE_PROFILE_CYCLE):
+        async def _async_profile_cycle(call: ServiceCall) -> None:
+            await _async_profile_publish_cycle(hass, call.data["interval_ms"] / 1000)
+
+        hass.services.async_register(DOMAIN, SERVICE_PROFILE_CYCLE, _async_profile_cycle, schema=PROFILE_CYCLE_SCHEMA)
     return True
 
+async def _async_options_updated(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    await hass.config_entries.async_reload(entry.entry_id)
+
+def _write_text(path: str, text: str) -> None:
+    with open(path, "w") as f:
+        f.write(text)
+
+async def _async_profile_publish_cycle(hass: HomeAssistant, interval: float) -> None:
+    """Run one full publish cycle under the sampling profiler and save collapsed stacks."""
+    from .profiler import SamplingProfiler
+
+    hub = hass.data.get(DATA_HUB)
+    if hub is None:
+        return
+    profiler = SamplingProfiler(interval=interval)
+    profiler.start()
+    start = time.perf_counter()
+    try:
+        await hub.async_publish(full=True)
+        await hub.async_drain()
+    finally:
+        elapsed = time.perf_counter() - start
+        await hass.async_add_executor_job(profiler.stop)
+    path = hass.config.path(f"wizsmith_profile_{int(time.time())}.txt")
+    await hass.async_add_executor_job(_write_text, path, profiler.collapsed())
+    _LOGGER.info(
+        "Profiled publish cycle: %.1f ms, %d samples, stacks in %s; hottest frames: %s",
+        elapsed * 1000, profiler.total, path, profiler.top(5),
+    )
+
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     _LOGGER.info("Unloading WizSmith Home Integration")
+    if not await hass.config_entries.async_unload_platforms(entry, PLATFORMS):
+        return False
     
     # Cancel the publish loop task
     if DOMAIN in hass.data and entry.entry_id in hass.data[DOMAIN]:
         data = hass.data[DOMAIN].pop(entry.entry_id)
-        if "publish_task" in data:
-            data["publish_task"].cancel()
+        # shared sinks (and the OpenRemote clients they own) close with their last entry
+        if "hub" in data and await data["hub"].async_remove_entry(entry.entry_id):
+            await data["hub"].async_stop()
+            hass.data.pop(DATA_HUB, None)
+    if not hass.data.get(DOMAIN):
+        hass.services.async_remove(DOMAIN, SERVICE_PROFILE_CYCLE)
     
     return True
\ No newline at end of file
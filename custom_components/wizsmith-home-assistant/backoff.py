@@ -0,0 +1,24 @@
+"""Jittered exponential backoff shared by the add-on agent and the integration.
+
+Randomising each delay keeps a fleet of hubs that lost the same broker or
+OpenRemote server (e.g. after a power cut) from retrying in lockstep.
+"""
+
+import random
+
+
+class Backoff:
+    """Full-jitter exponential backoff between ``base`` and ``cap`` seconds."""
+
+    def __init__(self, base: float = 1.0, cap: float = 300.0):
+        self.base = base
+        self.cap = cap
+        self.attempt = 0
+
+    def next_delay(self) -> float:
+        ceiling = min(self.cap, self.base * 2 ** min(self.attempt, 32))
+        self.attempt += 1
+        return random.uniform(self.base, max(self.base, ceiling))
+
+    def reset(self) -> None:
+        self.attempt = 0
@@ -0,0 +1,150 @@
+"""Bounded, per-device ordered command dispatch for the add-on agent.
+
+The MQTT network thread only enqueues; a small pool of worker threads runs
+the (blocking) handler. Commands for one device always go to the same
+worker, so they are handled in the order they arrived.
+"""
+
+import collections
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List
+
+_LOGGER = logging.getLogger("wizsmith_agent")
+
+# What submit() does when a device's queue is full
+POLICY_COALESCE = "coalesce"        # replace a pending command for the same device/action, else drop oldest
+POLICY_DROP_OLDEST = "drop_oldest"
+POLICY_DROP_NEWEST = "drop_newest"
+POLICIES = (POLICY_COALESCE, POLICY_DROP_OLDEST, POLICY_DROP_NEWEST)
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * pct))]
+
+
+class _Shard:
+    """One worker's queue."""
+
+    def __init__(self, maxlen: int):
+        self.maxlen = maxlen
+        self.queue = collections.deque()
+        self.cond = threading.Condition()
+
+
+class CommandDispatcher:
+    """Run ``handler(device_id, action, payload)`` on a bounded worker pool."""
+
+    def __init__(self, handler: Callable[[str, str, Any], None], workers: int = 4,
+                 max_queue: int = 1000, policy: str = POLICY_COALESCE, latency_window: int = 1000):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown command queue policy: {policy}")
+        workers = max(1, int(workers))
+        self.handler = handler
+        self.policy = policy
+        self._shards = [_Shard(max(1, int(max_queue) // workers)) for _ in range(workers)]
+        self._threads: List[threading.Thread] = []
+        self._stopping = False
+        self._lock = threading.Lock()
+        self._latencies = collections.deque(maxlen=latency_window)
+        # counters
+        self.submitted = 0
+        self.dispatched = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.failed = 0
+
+    def start(self) -> None:
+        for i, shard in enumerate(self._shards):
+            t = threading.Thread(target=self._run, args=(shard,), name=f"wizsmith-cmd-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Stop the workers after they drain what is already queued."""
+        self._stopping = True
+        for shard in self._shards:
+            with shard.cond:
+                shard.cond.notify_all()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    def submit(self, device_id: str, action: str, payload: Any) -> bool:
+        """Queue a command without blocking; returns False if it was dropped."""
+        shard = self._shards[hash(device_id) % len(self._shards)]
+        item = [device_id, action, payload, time.monotonic()]
+        with shard.cond:
+            if len(shard.queue) >= shard.maxlen:
+                if self.policy == POLICY_COALESCE and self._coalesce(shard, item):
+                    return True
+                if self.policy == POLICY_DROP_NEWEST:
+                    self._count_drop(device_id)
+                    return False
+                dropped = shard.queue.popleft()
+                self._count_drop(dropped[0])
+            shard.queue.append(item)
+            shard.cond.notify()
+        with self._lock:
+            self.submitted += 1
+        return True
+
+    def _coalesce(self, shard: _Shard, item: list) -> bool:
+        # latest value wins; the pending entry keeps its place and enqueue time
+        for pending in reversed(shard.queue):
+            if pending[0] == item[0] and pending[1] == item[1]:
+                pending[2] = item[2]
+                with self._lock:
+                    self.coalesced += 1
+                return True
+        return False
+
+    def _count_drop(self, device_id: str) -> None:
+        with self._lock:
+            self.dropped += 1
+        _LOGGER.warning("Command queue full; dropped command for %s", device_id)
+
+    def _run(self, shard: _Shard) -> None:
+        while True:
+            with shard.cond:
+                while not shard.queue and not self._stopping:
+                    shard.cond.wait()
+                if not shard.queue:
+                    return
+                device_id, action, payload, enqueued = shard.queue.popleft()
+            try:
+                self.handler(device_id, action, payload)
+            except Exception:
+                _LOGGER.exception("Command handler failed for %s", device_id)
+                with self._lock:
+                    self.failed += 1
+            latency = time.monotonic() - enqueued
+            with self._lock:
+                self.dispatched += 1
+                self._latencies.append(latency)
+
+    def depth(self) -> int:
+        return sum(len(s.queue) for s in self._shards)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            latencies = sorted(self._latencies)
+            stats = {
+                "submitted": self.submitted,
+                "dispatched": self.dispatched,
+                "dropped": self.dropped,
+                "coalesced": self.coalesced,
+                "failed": self.failed,
+            }
+        stats.update({
+            "depth": self.depth(),
+            "capacity": sum(s.maxlen for s in self._shards),
+            "workers": len(self._shards),
+            "latency_ms_p50": round(_percentile(latencies, 0.5) * 1000, 1),
+            "latency_ms_p99": round(_percentile(latencies, 0.99) * 1000, 1),
+            "latency_ms_max": round(latencies[-1] * 1000, 1) if latencies else 0.0,
+        })
+        return stats
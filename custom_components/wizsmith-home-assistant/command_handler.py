@@ -0,0 +1,182 @@
+"""Run commands for local entities as Home Assistant service calls."""
+
+from __future__ import annotations
+import json
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+from homeassistant.components import mqtt as ha_mqtt
+from homeassistant.core import HomeAssistant
+
+from .command_router import parse_payload
+from .const import *
+
+_LOGGER = logging.getLogger(__name__)
+
+# device id -> entity id mappings kept; the ids come straight from MQTT topics
+_ENTITY_CACHE_SIZE = 1024
+# service data keys that select targets; a command payload may not set them
+_TARGET_KEYS = frozenset(("entity_id", "device_id", "area_id", "floor_id", "label_id"))
+
+
+class LocalCommandHandler:
+    """Execute ``wizsmith/commands/<device_id>/<action>`` on this instance when possible.
+
+    ``device_id`` is an entity id, either as is or in the agent's
+    ``domain_object_id`` form. Commands for entities this instance does not
+    have are forwarded to OpenRemote. The action only selects one of the
+    fixed services in the entity's own domain (DEFAULT_COMMAND_ACTIONS);
+    any other action is rejected, and the payload can add service data but
+    never retarget it at another entity.
+
+    Commands written in OpenRemote to the child asset's ``commands``
+    attribute arrive over the client's event stream and run the same way:
+    the value is a ``{"device_id": ..., "action": ..., "payload": ...}``
+    record, as forwarded commands use, or a list of them.
+    """
+
+    def __init__(self, hass: HomeAssistant, or_client, cfg: Dict[str, Any]):
+        self.hass = hass
+        self.or_client = or_client
+        self.remote_events = bool(cfg.get(CONF_OR_EVENTS, DEFAULT_OR_EVENTS))
+        self.actions = dict(DEFAULT_COMMAND_ACTIONS)
+        for action, service in (cfg.get(CONF_COMMAND_MAP) or {}).items():
+            if action not in self.actions or not isinstance(service, str) or "." in service:
+                _LOGGER.warning("Ignoring command map entry %s -> %s", action, service)
+                continue
+            self.actions[action] = service
+        # only hits are cached: an entity may appear after its first command (HA still starting)
+        self._entity_ids: Dict[str, str] = {}
+        self._unsub = None
+        self._unsub_events = None
+        # counters
+        self.local = 0
+        self.remote = 0
+        self.forwarded = 0
+        self.rejected = 0
+        self.failed = 0
+
+    async def async_start(self) -> None:
+        if self.remote_events:
+            self._unsub_events = self.or_client.subscribe_attribute_events(self._on_attribute_event)
+        if not await ha_mqtt.async_wait_for_mqtt_client(self.hass):
+            _LOGGER.warning("MQTT is not available; local command handling disabled")
+            return
+        self._unsub = await ha_mqtt.async_subscribe(self.hass, f"{TOPIC_COMMANDS}/#", self._async_message_received)
+        _LOGGER.info("Handling %s commands for local entities", TOPIC_COMMANDS)
+
+    def async_stop(self) -> None:
+        if self._unsub is not None:
+            self._unsub()
+            self._unsub = None
+        if self._unsub_events is not None:
+            self._unsub_events()
+            self._unsub_events = None
+
+    def _entity_id(self, device_id: str) -> Optional[str]:
+        """Map a device id to a local entity id; the agent replaces the "." with "_"."""
+        if self.hass.states.get(device_id) is not None:
+            return device_id
+        entity_id = self._entity_ids.get(device_id)
+        if entity_id is not None and self.hass.states.get(entity_id) is not None:
+            return entity_id
+        self._entity_ids.pop(device_id, None)
+        index = device_id.find("_")
+        while index > 0:
+            candidate = f"{device_id[:index]}.{device_id[index + 1:]}"
+            if self.hass.states.get(candidate) is not None:
+                if len(self._entity_ids) >= _ENTITY_CACHE_SIZE:
+                    # drop the oldest mapping
+                    del self._entity_ids[next(iter(self._entity_ids))]
+                self._entity_ids[device_id] = candidate
+                return candidate
+            index = device_id.find("_", index + 1)
+        return None
+
+    def _service(self, entity_id: str, action: str) -> Optional[Tuple[str, str, Optional[str]]]:
+        """(domain, service, value field) for ``action`` on ``entity_id``; None if it has none."""
+        service = self.actions.get(action)
+        if service is None:
+            return None
+        domain = entity_id.split(".", 1)[0]
+        field = None
+        if action == "set":
+            service, field = COMMAND_SET_SERVICES.get(domain, (service, "value"))
+        if self.hass.services.has_service(domain, service):
+            return domain, service, field
+        return None
+
+    async def _async_message_received(self, msg) -> None:
+        parts = msg.topic[len(TOPIC_COMMANDS) + 1:].split("/", 1)
+        device_id = parts[0]
+        action = parts[1] if len(parts) > 1 else ""
+        payload = parse_payload(msg.payload)
+        if not await self._async_run(device_id, action, payload):
+            await self._async_forward(device_id, action, payload)
+
+    def _on_attribute_event(self, asset_id: str, attribute: str, value: Any) -> None:
+        if isinstance(value, str):
+            value = parse_payload(value)
+        if value is None:
+            return  # attribute cleared
+        for command in value if isinstance(value, list) else [value]:
+            if not isinstance(command, dict) or "device_id" not in command or "action" not in command:
+                _LOGGER.warning("Ignoring malformed OpenRemote command %s", command)
+                continue
+            self.hass.async_create_task(
+                self._async_run_remote(str(command["device_id"]), str(command["action"]), command.get("payload"))
+            )
+
+    async def _async_run_remote(self, device_id: str, action: str, payload: Any) -> None:
+        # the change came from OpenRemote, so nothing is forwarded back
+        rejected = self.rejected
+        if await self._async_run(device_id, action, payload):
+            if self.rejected == rejected:
+                self.remote += 1
+        else:
+            _LOGGER.debug("No local service for OpenRemote attribute %s=%s", device_id, action)
+
+    async def _async_run(self, device_id: str, action: str, payload: Any) -> bool:
+        """Call the service for a local entity; False if the command is not local."""
+        entity_id = self._entity_id(device_id) if device_id else None
+        if entity_id is None:
+            return False
+        service = self._service(entity_id, action)
+        if service is None:
+            self.rejected += 1
+            _LOGGER.warning("Rejected command %r for %s: no such action", action, entity_id)
+            return True
+        data = {}
+        if isinstance(payload, dict):
+            data.update((k, v) for k, v in payload.items() if k not in _TARGET_KEYS)
+        elif service[2] and payload not in (None, ""):
+            data[service[2]] = payload
+        # set last so the payload cannot redirect the call
+        data["entity_id"] = entity_id
+        try:
+            await self.hass.services.async_call(service[0], service[1], data, blocking=False)
+            self.local += 1
+            _LOGGER.debug("Ran %s.%s for %s locally", service[0], service[1], entity_id)
+        except Exception as e:
+            self.failed += 1
+            _LOGGER.warning("Local command %s for %s failed: %s", action, entity_id, e)
+        return True
+
+    async def _async_forward(self, device_id: str, action: str, payload: Any) -> None:
+        record = {"device_id": device_id, "action": action, "payload": payload}
+        # buffered on disk by the client while OpenRemote is unreachable
+        if await self.or_client.async_forward_command(record):
+            self.forwarded += 1
+        else:
+            self.failed += 1
+            _LOGGER.warning("Forwarding command %s to OpenRemote failed: %s", device_id, json.dumps(record, default=str))
+
+    def stats(self) -> dict:
+        return {
+            "local": self.local,
+            "remote": self.remote,
+            "forwarded": self.forwarded,
+            "rejected": self.rejected,
+            "failed": self.failed,
+            "events_connected": self.or_client.events_connected,
+        }
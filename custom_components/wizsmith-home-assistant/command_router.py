@@ -0,0 +1,172 @@
+"""MQTT command routing for the add-on agent.
+
+Handlers are registered against MQTT topic patterns, which are compiled into
+a trie once, so resolving an incoming topic walks one node per topic level
+instead of testing every pattern. Besides the usual ``+`` and ``#``
+wildcards, a pattern level may be ``{name}`` (a named ``+``) or ``{name#}``
+(a named ``#``); the ``device_id`` and ``action`` captures are what handlers
+receive. Per-device plug-ins override the pattern handler for one device,
+e.g. to act on a local device without the OpenRemote round trip.
+"""
+
+import importlib
+import json
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+_LOGGER = logging.getLogger("wizsmith_agent")
+
+# handler(device_id, action, payload)
+Handler = Callable[[Optional[str], str, Any], Any]
+
+
+def parse_payload(raw: Any) -> Any:
+    """Decode a payload once: JSON objects/arrays/numbers when it parses, the plain string otherwise."""
+    if isinstance(raw, (bytes, bytearray)):
+        raw = raw.decode("utf-8", "replace")
+    if not isinstance(raw, str):
+        return raw
+    text = raw.strip()
+    if text[:1] in ("{", "[", '"') or text[:1].isdigit() or text[:1] == "-" or text in ("true", "false", "null"):
+        try:
+            return json.loads(text)
+        except ValueError:
+            pass
+    return raw
+
+
+class _Route:
+    __slots__ = ("pattern", "handler", "raw", "captures", "tail", "specificity", "order")
+
+    def __init__(self, pattern: str, handler: Optional[Handler], order: int, raw: bool = False):
+        self.pattern = pattern
+        self.handler = handler
+        self.raw = raw
+        self.order = order
+        self.captures: Dict[int, str] = {}
+        self.tail: Optional[str] = None
+        levels = pattern.split("/")
+        for i, level in enumerate(levels):
+            if level.startswith("{") and level.endswith("#}"):
+                self.tail = level[1:-2]
+            elif level.startswith("{") and level.endswith("}"):
+                self.captures[i] = level[1:-1]
+        # literal levels win over wildcards; among equals the first registered wins
+        self.specificity = sum(1 for level in levels if level not in ("+", "#") and not level.startswith("{"))
+
+    def bind(self, levels: List[str], depth: int) -> Tuple[Optional[str], str]:
+        values = {name: levels[i] for i, name in self.captures.items()}
+        if self.tail:
+            values[self.tail] = "/".join(levels[depth:])
+        return values.get("device_id"), values.get("action", "")
+
+
+class _Node:
+    __slots__ = ("children", "plus", "hash", "routes")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        self.plus: Optional["_Node"] = None
+        self.hash: List[_Route] = []
+        self.routes: List[_Route] = []
+
+
+class CommandRouter:
+    """Resolve command topics to handlers."""
+
+    def __init__(self):
+        self._root = _Node()
+        self._devices: Dict[str, Handler] = {}
+        self._count = 0
+        # counters
+        self.routed = 0
+        self.unrouted = 0
+
+    def route(self, pattern: str, handler: Optional[Handler], raw: bool = False) -> None:
+        """Register ``handler`` for topics matching ``pattern``; None leaves them to device plug-ins.
+
+        ``raw`` handlers get the payload bytes as received instead of the parsed payload.
+        """
+        levels = pattern.split("/")
+        route = _Route(pattern, handler, self._count, raw)
+        self._count += 1
+        node = self._root
+        for i, level in enumerate(levels):
+            multi = level == "#" or (level.startswith("{") and level.endswith("#}"))
+            if multi:
+                if i != len(levels) - 1:
+                    raise ValueError(f"Multi-level wildcard must be last in {pattern!r}")
+                node.hash.append(route)
+                return
+            if level == "+" or (level.startswith("{") and level.endswith("}")):
+                if node.plus is None:
+                    node.plus = _Node()
+                node = node.plus
+            else:
+                node = node.children.setdefault(level, _Node())
+        node.routes.append(route)
+
+    def register_device(self, device_id: str, handler: Handler) -> None:
+        """Handle every command for ``device_id`` with ``handler`` instead of the pattern handler."""
+        self._devices[device_id] = handler
+
+    def load_plugins(self, spec: str) -> None:
+        """Register plug-ins from ``"device_id=module:callable,..."``; bad entries are logged and skipped."""
+        for entry in filter(None, (e.strip() for e in spec.split(","))):
+            try:
+                device_id, target = entry.split("=", 1)
+                module_name, attr = target.split(":", 1)
+                self.register_device(device_id.strip(), getattr(importlib.import_module(module_name.strip()), attr.strip()))
+                _LOGGER.info("Command plug-in %s registered for %s", target.strip(), device_id.strip())
+            except Exception as e:
+                _LOGGER.error("Invalid command plug-in %r: %s", entry, e)
+
+    def _match(self, levels: List[str]) -> Optional[Tuple[_Route, int]]:
+        best: Optional[Tuple[_Route, int]] = None
+
+        def consider(route: _Route, depth: int) -> None:
+            nonlocal best
+            if best is None or (route.specificity, -route.order) > (best[0].specificity, -best[0].order):
+                best = (route, depth)
+
+        nodes = [self._root]
+        for depth, level in enumerate(levels):
+            following = []
+            for node in nodes:
+                for route in node.hash:
+                    consider(route, depth)
+                child = node.children.get(level)
+                if child is not None:
+                    following.append(child)
+                if node.plus is not None:
+                    following.append(node.plus)
+            if not following:
+                break
+            nodes = following
+        else:
+            for node in nodes:
+                for route in node.routes:
+                    consider(route, len(levels))
+                # "a/#" also matches "a"
+                for route in node.hash:
+                    consider(route, len(levels))
+        return best
+
+    def resolve(self, topic: str, payload: Any) -> Optional[Tuple[Handler, Optional[str], str, Any]]:
+        """Return ``(handler, device_id, action, parsed payload)``, or None if nothing handles ``topic``."""
+        levels = topic.split("/")
+        match = self._match(levels)
+        if match is None:
+            self.unrouted += 1
+            return None
+        route, depth = match
+        device_id, action = route.bind(levels, depth)
+        handler = self._devices.get(device_id, route.handler) if device_id is not None else route.handler
+        if handler is None:
+            self.unrouted += 1
+            return None
+        self.routed += 1
+        return handler, device_id, action, payload if route.raw else parse_payload(payload)
+
+    def stats(self) -> dict:
+        return {"routed": self.routed, "unrouted": self.unrouted, "plugins": len(self._devices)}
@@ -4,7 +4,17 @@ from __future__ import annotations
 import voluptuous as vol
 from homeassistant import config_entries
 from homeassistant.core import callback
-from .const import DOMAIN, DEFAULT_OR_REALM, DEFAULT_GITHUB_REPO, DEFAULT_SYNC_INTERVAL
+from .const import (
+    CONF_RATE_LIMIT_BURST,
+    CONF_RATE_LIMITS,
+    DEFAULT_GITHUB_REPO,
+    DEFAULT_OR_REALM,
+    DEFAULT_RATE_LIMIT_BURST,
+    DEFAULT_RATE_LIMITS,
+    DEFAULT_SYNC_INTERVAL,
+    DOMAIN,
+)
+from .rate_limiter import format_rates, parse_rates
 
 class WizSmithConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
     """Handle the configuration flow."""
@@ -52,12 +62,25 @@ class WizSmithOptionsFlowHandler(config_entries.OptionsFlow):
         self.config_entry = config_entry
 
     async def async_step_init(self, user_input=None):
+        errors = {}
         if user_input is not None:
-            return self.async_create_entry(title="", data=user_input)
+            try:
+                parse_rates(user_input.get(CONF_RATE_LIMITS))
+            except ValueError:
+                errors[CONF_RATE_LIMITS] = "invalid_rate_limits"
+            else:
+                return self.async_create_entry(title="", data=user_input)
 
-        data = self.config_entry.data
+        data = {**self.config_entry.data, **self.config_entry.options}
+        rate_limits = data.get(CONF_RATE_LIMITS, DEFAULT_RATE_LIMITS)
+        if not isinstance(rate_limits, str):
+            rate_limits = format_rates(rate_limits)
         data_schema = vol.Schema({
             vol.Optional("sync_interval", default=data.get("sync_interval", 30)): int,
+            vol.Optional(CONF_RATE_LIMITS, default=rate_limits): str,
+            vol.Optional(
+                CONF_RATE_LIMIT_BURST, default=data.get(CONF_RATE_LIMIT_BURST, DEFAULT_RATE_LIMIT_BURST)
+            ): vol.All(vol.Coerce(int), vol.Range(min=1)),
         })
 
-        return self.async_show_form(step_id="init", data_schema=data_schema)
+        return self.async_show_form(step_id="init", data_schema=data_schema, errors=errors)
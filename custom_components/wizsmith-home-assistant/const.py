@@ -2,6 +2,14 @@
 
 DOMAIN = "wizsmith_home_assistant"
 
+PLATFORMS = ["sensor"]
+
+# hass.data key of the per-hub HubPublisher shared by all config entries
+DATA_HUB = f"{DOMAIN}_hub"
+
+# Services
+SERVICE_PROFILE_CYCLE = "profile_cycle"
+
 # Default values
 DEFAULT_SYNC_INTERVAL = 30
 DEFAULT_MQTT_PORT = 1883
@@ -14,6 +22,11 @@ CONF_MQTT_PORT = "mqtt_port"
 CONF_MQTT_USER = "mqtt_user"
 CONF_MQTT_PASS = "mqtt_pass"
 
+# Publish to mqtt_host:mqtt_port over a dedicated connection instead of Home Assistant's
+# MQTT integration; each distinct broker is one sink of the hub publisher
+CONF_MQTT_DIRECT = "mqtt_direct"
+DEFAULT_MQTT_DIRECT = False
+
 # OpenRemote configuration keys
 CONF_OR_URL = "openremote_url"
 CONF_OR_USER = "openremote_user"
@@ -22,6 +35,114 @@ CONF_OR_CLIENT_ID = "openremote_client_id"
 CONF_OR_CLIENT_SECRET = "openremote_client_secret"
 CONF_OR_REALM = "openremote_realm"
 
+# OpenRemote HTTP connection pool
+CONF_OR_POOL_LIMIT = "openremote_pool_limit"
+CONF_OR_DNS_TTL = "openremote_dns_ttl"
+CONF_OR_KEEPALIVE = "openremote_keepalive"
+DEFAULT_OR_POOL_LIMIT = 4
+DEFAULT_OR_DNS_TTL = 300
+DEFAULT_OR_KEEPALIVE = 60
+
+# OpenRemote batched attribute writes
+CONF_OR_BATCH_SIZE = "openremote_batch_size"
+CONF_OR_BATCH_DELAY = "openremote_batch_delay"
+DEFAULT_OR_BATCH_SIZE = 200
+DEFAULT_OR_BATCH_DELAY = 1.0
+
+# OpenRemote attribute events over one WebSocket subscription to the child asset's commands
+# attribute; reconnects back off between the min and max seconds
+CONF_OR_EVENTS = "openremote_events"
+DEFAULT_OR_EVENTS = True
+EVENTS_RETRY_MIN = 1
+EVENTS_RETRY_MAX = 300
+EVENTS_HEARTBEAT = 30
+
+# Store-and-forward buffer for OpenRemote outages
+CONF_BUFFER_MAX_MB = "buffer_max_mb"
+CONF_REPLAY_BATCH_SIZE = "replay_batch_size"
+CONF_REPLAY_INTERVAL = "replay_interval"
+DEFAULT_BUFFER_MAX_MB = 50
+DEFAULT_REPLAY_BATCH_SIZE = 100
+DEFAULT_REPLAY_INTERVAL = 1.0
+# setup retries back off from SETUP_RETRY_MIN up to SETUP_RETRY_MAX seconds
+SETUP_RETRY_MIN = 10
+SETUP_RETRY_MAX = 600
+# failed background token refreshes back off between these (seconds)
+TOKEN_RETRY_MIN = 5
+TOKEN_RETRY_MAX = 300
+
+# Cached OpenRemote provisioning (HA Store)
+STORAGE_VERSION = 1
+STORAGE_KEY_PROVISIONING = f"{DOMAIN}.provisioning"
+CHILD_ASSET_NAME = "HA Sensors"
+SENSORS_ATTRIBUTE = "sensors_json"
+# writeable JSON attribute on the child asset: {"device_id": ..., "action": ..., "payload": ...}
+# records (or a list of them) written in OpenRemote run as commands on the hub
+COMMANDS_ATTRIBUTE = "commands"
+
+# Delta publishing: device_class -> numeric deadband, seconds between full refreshes
+CONF_DELTA_DEADBANDS = "delta_deadbands"
+CONF_FULL_REFRESH_INTERVAL = "full_refresh_interval"
+DEFAULT_FULL_REFRESH_INTERVAL = 300
+
+# Per-entity rate limits: device_class or domain -> updates per second (token bucket of
+# rate_limit_burst); throttled entities publish their latest state once the bucket refills
+CONF_RATE_LIMITS = "rate_limits"
+CONF_RATE_LIMIT_BURST = "rate_limit_burst"
+DEFAULT_RATE_LIMITS = {"power": 1.0, "energy": 1.0}
+DEFAULT_RATE_LIMIT_BURST = 2
+
+# Push publishing from state_changed events; the sync timer becomes a heartbeat
+CONF_PUSH_MODE = "push_mode"
+CONF_PUSH_DOMAINS = "push_domains"
+CONF_PUSH_ENTITY_GLOBS = "push_entity_globs"
+CONF_PUSH_DEBOUNCE = "push_debounce"
+CONF_HEARTBEAT_INTERVAL = "heartbeat_interval"
+DEFAULT_PUSH_MODE = True
+DEFAULT_PUSH_DEBOUNCE = 0.25
+DEFAULT_HEARTBEAT_INTERVAL = 300
+# Push passes only send per-entity deltas; the whole-hub snapshot (MQTT sensors topic and
+# OpenRemote sensors_json) goes out on timer passes and at most this often in between (seconds)
+CONF_SNAPSHOT_INTERVAL = "snapshot_interval"
+DEFAULT_SNAPSHOT_INTERVAL = 10
+
+# Commands on wizsmith/commands/<device_id>/<action> for local entities run as HA service calls
+# in the entity's own domain. Only these actions exist; the command map may rename the service
+# of one of them (a bare service name, never "domain.service"). "set" uses the domain's setter
+# and takes a plain payload as its value field.
+# Local execution replaces the add-on agent's forwarding (FORWARD_COMMANDS): enable only one,
+# or every command runs twice and "toggle" cancels itself out.
+CONF_LOCAL_COMMANDS = "local_commands"
+CONF_COMMAND_MAP = "command_map"
+DEFAULT_LOCAL_COMMANDS = True
+DEFAULT_COMMAND_ACTIONS = {
+    "on": "turn_on",
+    "off": "turn_off",
+    "toggle": "toggle",
+    "open": "open_cover",
+    "close": "close_cover",
+    "set": "set_value",
+}
+# domain -> (service, value field) for "set"; other domains use set_value / value
+COMMAND_SET_SERVICES = {
+    "select": ("select_option", "option"),
+    "input_select": ("select_option", "option"),
+    "light": ("turn_on", "brightness"),
+    "cover": ("set_cover_position", "position"),
+    "fan": ("set_percentage", "percentage"),
+    "climate": ("set_temperature", "temperature"),
+}
+
+# MQTT snapshot encoding: "json" (plain snapshots) or "compact" (dictionary-coded
+# MessagePack deltas, zlib-compressed above compress_min_bytes, and no per-entity
+# state topics); OpenRemote always gets JSON
+CONF_SNAPSHOT_ENCODING = "snapshot_encoding"
+CONF_COMPRESS_MIN_BYTES = "compress_min_bytes"
+SNAPSHOT_ENCODING_JSON = "json"
+SNAPSHOT_ENCODING_COMPACT = "compact"
+DEFAULT_SNAPSHOT_ENCODING = SNAPSHOT_ENCODING_JSON
+DEFAULT_COMPRESS_MIN_BYTES = 1024
+
 # GitHub repo for self-update
 CONF_GITHUB_REPO = "github_repo"
 
@@ -31,4 +152,5 @@ CONF_SYNC_INTERVAL = "sync_interval"
 # MQTT topics
 TOPIC_DISCOVERY = "wizsmith/discovery"
 TOPIC_STATUS = "wizsmith/status"
-TOPIC_EVENTS = "wizsmith/events"
\ No newline at end of file
+TOPIC_EVENTS = "wizsmith/events"
+TOPIC_COMMANDS = "wizsmith/commands"
\ No newline at end of file
@@ -0,0 +1,110 @@
+"""Change detection for state publishing.
+
+Shared by the integration and the add-on agent: remembers the last value
+sent for each entity so publishers can skip values that did not change,
+with an optional numeric deadband per device class and a periodic full
+refresh for subscribers that joined late.
+"""
+
+import math
+import time
+from typing import Any, Dict, Optional
+
+try:
+    from .state_registry import UNSET, StateRegistry
+except ImportError:
+    # loaded as a top-level module by the add-on agent (main.py)
+    from state_registry import UNSET, StateRegistry
+
+# Seconds between full (unfiltered) publishes
+DEFAULT_FULL_REFRESH_INTERVAL = 300
+
+
+def _as_number(value: Any) -> Optional[float]:
+    if isinstance(value, bool):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class DeltaCache:
+    """Last-sent state per entity id plus sent/suppressed counters.
+
+    Values live in columns of a StateRegistry, shared with the rate limiter
+    when both are given the same ``registry``; the last sent number for
+    deadband checks is kept unboxed so it is not parsed again every pass.
+    """
+
+    def __init__(self, deadbands: Optional[Dict[str, float]] = None,
+                 full_refresh_interval: float = DEFAULT_FULL_REFRESH_INTERVAL,
+                 registry: Optional[StateRegistry] = None):
+        self.deadbands = dict(deadbands or {})
+        self.full_refresh_interval = full_refresh_interval
+        self.registry = registry if registry is not None else StateRegistry()
+        self._last = self.registry.column("delta.value")
+        self._last_num = self.registry.column("delta.number", "d", math.nan)
+        self._lock = self.registry.lock
+        self._last_full = None
+        self.sent = 0
+        self.suppressed = 0
+        self.throttled = 0
+
+    def full_refresh_due(self) -> bool:
+        """True if the caller should publish everything this cycle."""
+        now = time.monotonic()
+        if self._last_full is None or now - self._last_full >= self.full_refresh_interval:
+            self._last_full = now
+            return True
+        return False
+
+    def should_publish(self, entity_id: str, value: Any, device_class: Optional[str] = None,
+                       force: bool = False, limiter=None, domain: Optional[str] = None) -> bool:
+        """Record ``value`` and return True if it differs enough from the last one sent.
+
+        A changed value that ``limiter`` (a RateLimiter) throttles is not
+        recorded, so it still counts as changed once the bucket refills.
+        """
+        with self._lock:
+            slot = self.registry.slot(entity_id)
+            deadband = self.deadbands.get(device_class) if device_class and self.deadbands else None
+            new_num = _as_number(value) if deadband else None
+            last = self._last[slot]
+            if not force and last is not UNSET:
+                last_num = self._last_num[slot]
+                if new_num is not None and last_num == last_num:  # not NaN
+                    unchanged = abs(new_num - last_num) < deadband
+                else:
+                    unchanged = value == last
+                if unchanged:
+                    self.suppressed += 1
+                    return False
+            if limiter is not None and not force and not limiter.allow(entity_id, device_class, domain):
+                self.throttled += 1
+                return False
+            # deadbands compare against the last value *sent*, so slow drift still gets through
+            self._last[slot] = value
+            self._last_num[slot] = math.nan if new_num is None else new_num
+            self.sent += 1
+            return True
+
+    def forget(self, entity_id: str) -> None:
+        """Drop ``entity_id``; with a shared registry this clears it for every consumer."""
+        self.registry.discard(entity_id)
+
+    def prune(self, keep) -> None:
+        """Forget every entity id not in ``keep`` (e.g. after a full pass)."""
+        self.registry.prune(keep)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Copy of the last value sent for every tracked entity."""
+        last = self._last
+        with self._lock:
+            return {entity_id: last[slot] for slot, entity_id in self.registry.items() if last[slot] is not UNSET}
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            tracked = len(self._last) - self._last.count(UNSET)
+            return {"sent": self.sent, "suppressed": self.suppressed, "throttled": self.throttled,
+                    "tracked": tracked}
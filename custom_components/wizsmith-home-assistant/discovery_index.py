@@ -0,0 +1,70 @@
+"""Index of published MQTT discovery configs for the add-on agent.
+
+Maps each retained discovery topic to a hash of the payload last published
+there and persists it, so restarts and reconnects only publish configs that
+were added or changed, and clear the ones that disappeared.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+_LOGGER = logging.getLogger("wizsmith_agent")
+
+
+def _digest(payload: str) -> str:
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class DiscoveryIndex:
+    """topic -> content hash of the published discovery config."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._hashes: Dict[str, str] = {}
+        self._dirty = False
+        if path:
+            try:
+                with open(path, "r") as f:
+                    self._hashes = json.load(f)
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                _LOGGER.warning("Ignoring unreadable discovery index %s: %s", path, e)
+
+    def diff(self, current: Dict[str, str]) -> Tuple[List[Tuple[str, str]], List[str]]:
+        """Return (added or changed (topic, payload) pairs, removed topics)."""
+        with self._lock:
+            changed = [(t, p) for t, p in current.items() if self._hashes.get(t) != _digest(p)]
+            removed = [t for t in self._hashes if t not in current]
+        return changed, removed
+
+    def mark(self, topic: str, payload: str) -> None:
+        """Record a publish; an empty payload records the removal of the config."""
+        with self._lock:
+            if payload:
+                self._hashes[topic] = _digest(payload)
+            else:
+                self._hashes.pop(topic, None)
+            self._dirty = True
+
+    def save(self) -> None:
+        with self._lock:
+            if not self.path or not self._dirty:
+                return
+            data = dict(self._hashes)
+            self._dirty = False
+        try:
+            tmp = self.path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            _LOGGER.warning("Could not save discovery index %s: %s", self.path, e)
+
+    def __len__(self) -> int:
+        return len(self._hashes)
@@ -0,0 +1,206 @@
+# fleet.py - bulk OpenRemote provisioning for many WizSmith Pis
+#
+# Provisions the same assets OpenRemoteClient creates for a single hub
+# (a "wizsmith-pi-<pi_id>" agent with an "HA Sensors" child holding the
+# sensors_json attribute) for a whole list of pi_ids at once:
+#
+#   python3 fleet.py --file pi_ids.txt --concurrency 16 --rate 20
+#
+# Existing assets are fetched with one paged asset query; only missing or
+# outdated agents/children are created or updated, concurrently but bounded
+# by --concurrency and a --rate requests/second limit. 429/5xx responses are
+# retried with jittered backoff (honouring Retry-After).
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+
+import aiohttp
+
+from backoff import Backoff
+from const import CHILD_ASSET_NAME, COMMANDS_ATTRIBUTE, DEFAULT_MQTT_PORT, DEFAULT_OR_REALM, SENSORS_ATTRIBUTE
+from rate_limiter import RateLimiter
+from token_manager import TokenCache
+
+_LOGGER = logging.getLogger("wizsmith_fleet")
+
+AGENT_PREFIX = "wizsmith-pi-"
+MAX_ATTEMPTS = 5
+# every request shares one token bucket
+RATE_KEY = "fleet.requests"
+
+
+class FleetProvisioner:
+    def __init__(self, session, args):
+        self.session = session
+        self.base_url = args.url.rstrip("/")
+        self.realm = args.realm
+        self.args = args
+        self.tokens = TokenCache()
+        # a bucket of one spaces requests 1/rate apart; a rate of 0 leaves them unlimited
+        self.limiter = RateLimiter({"fleet": args.rate}, burst=1)
+        self._limiter_lock = asyncio.Lock()
+        self.semaphore = asyncio.Semaphore(args.concurrency)
+        self.counts = {"existing": 0, "created_agents": 0, "updated_agents": 0, "created_children": 0, "failed": 0}
+
+    async def _token(self):
+        token = self.tokens.get()
+        if token:
+            return token
+        data = {"grant_type": "password", "client_id": "admin-cli",
+                "username": self.args.user, "password": self.args.password}
+        token_url = f"{self.base_url}/auth/realms/{self.realm}/protocol/openid-connect/token"
+        async with self.session.post(token_url, data=data, timeout=10) as resp:
+            resp.raise_for_status()
+            return self.tokens.update(await resp.json(), client_id="admin-cli")
+
+    async def _throttle(self):
+        async with self._limiter_lock:
+            while not self.limiter.allow(RATE_KEY):
+                await asyncio.sleep(self.limiter.next_due(RATE_KEY) or 0)
+
+    async def request(self, method, path, body=None):
+        """Rate-limited API call with retries on 401/429/5xx; returns the decoded JSON (or None)."""
+        backoff = Backoff(base=1, cap=60)
+        url = f"{self.base_url}/api/{self.realm}/{path}"
+        for attempt in range(MAX_ATTEMPTS):
+            await self._throttle()
+            try:
+                headers = {"Authorization": f"Bearer {await self._token()}"}
+                async with self.session.request(method, url, json=body, headers=headers, timeout=30) as resp:
+                    if resp.status < 300:
+                        return await resp.json(content_type=None) if resp.content_length != 0 else None
+                    if resp.status == 401:
+                        self.tokens.invalidate()
+                    elif resp.status != 429 and resp.status < 500:
+                        raise RuntimeError(f"{method} {path} failed {resp.status}: {await resp.text()}")
+                    retry_after = resp.headers.get("Retry-After")
+                    error = f"HTTP {resp.status}"
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                retry_after, error = None, str(e) or type(e).__name__
+            delay = float(retry_after) if retry_after and retry_after.isdigit() else backoff.next_delay()
+            _LOGGER.debug("%s %s: %s, retry %d in %.1fs", method, path, error, attempt + 1, delay)
+            await asyncio.sleep(delay)
+        raise RuntimeError(f"{method} {path} failed after {MAX_ATTEMPTS} attempts")
+
+    async def query_existing(self):
+        """Fetch every fleet agent and child asset with one paged query."""
+        query = {
+            "names": [
+                {"predicateType": "string", "match": "BEGIN", "value": AGENT_PREFIX},
+                {"predicateType": "string", "match": "EXACT", "value": CHILD_ASSET_NAME},
+            ],
+            "limit": self.args.page_size,
+        }
+        assets = []
+        offset = 0
+        while True:
+            page = await self.request("POST", "asset/query", dict(query, offset=offset)) or []
+            if isinstance(page, dict):
+                page = page.get("items") or []
+            assets.extend(page)
+            if len(page) < self.args.page_size:
+                break
+            offset += len(page)
+        agents = {a["name"]: a for a in assets if a.get("name", "").startswith(AGENT_PREFIX)}
+        children = {a.get("parentId"): a for a in assets if a.get("name") == CHILD_ASSET_NAME}
+        return agents, children
+
+    def _agent_config(self):
+        return {"host": self.args.mqtt_host, "port": self.args.mqtt_port}
+
+    async def provision(self, pi_id, agents, children):
+        name = f"{AGENT_PREFIX}{pi_id}"
+        async with self.semaphore:
+            try:
+                agent = agents.get(name)
+                if agent is None:
+                    if self.args.dry_run:
+                        _LOGGER.info("[dry-run] would create %s", name)
+                        return
+                    agent = await self.request("POST", "asset", {
+                        "name": name,
+                        "description": "WizSmith auto-provisioned MQTTAgent for Pi",
+                        "configuration": self._agent_config(),
+                    })
+                    self.counts["created_agents"] += 1
+                elif agent.get("configuration") != self._agent_config():
+                    if not self.args.dry_run:
+                        await self.request("PUT", f"asset/{agent['id']}", dict(agent, configuration=self._agent_config()))
+                    self.counts["updated_agents"] += 1
+                child = children.get(agent["id"])
+                if child is None:
+                    if self.args.dry_run:
+                        _LOGGER.info("[dry-run] would create child for %s", name)
+                        return
+                    child = await self.request("POST", "asset", {"name": CHILD_ASSET_NAME, "parent": {"id": agent["id"]}})
+                    self.counts["created_children"] += 1
+                for attribute in (SENSORS_ATTRIBUTE, COMMANDS_ATTRIBUTE):
+                    if attribute not in (child.get("attributes") or {}) and not self.args.dry_run:
+                        await self.request("POST", f"asset/{child['id']}/attribute", {
+                            "name": attribute, "type": "json", "writeable": True, "readable": True,
+                        })
+                if name in agents and agent["id"] in children:
+                    self.counts["existing"] += 1
+            except Exception as e:
+                self.counts["failed"] += 1
+                _LOGGER.error("Provisioning %s failed: %s", name, e)
+
+    async def run(self, pi_ids):
+        started = time.monotonic()
+        agents, children = await self.query_existing()
+        _LOGGER.info("Found %d agents and %d children in %.1fs", len(agents), len(children), time.monotonic() - started)
+        await asyncio.gather(*(self.provision(pi_id, agents, children) for pi_id in pi_ids))
+        _LOGGER.info("Provisioned %d Pis in %.1fs: %s", len(pi_ids), time.monotonic() - started, self.counts)
+        return self.counts["failed"] == 0
+
+
+def _read_pi_ids(args):
+    pi_ids = list(args.pi_ids)
+    if args.file:
+        with open(args.file, "r") as f:
+            pi_ids.extend(line.strip() for line in f if line.strip() and not line.startswith("#"))
+    # keep order, drop duplicates
+    return list(dict.fromkeys(pi_ids))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Provision OpenRemote assets for a fleet of WizSmith Pis")
+    parser.add_argument("pi_ids", nargs="*", help="pi_ids to provision")
+    parser.add_argument("--file", help="file with one pi_id per line")
+    parser.add_argument("--url", default=os.getenv("OPENREMOTE_URL", ""))
+    parser.add_argument("--user", default=os.getenv("OPENREMOTE_USER", ""))
+    parser.add_argument("--password", default=os.getenv("OPENREMOTE_PASS", ""))
+    parser.add_argument("--realm", default=DEFAULT_OR_REALM)
+    parser.add_argument("--mqtt-host", default=os.getenv("MQTT_HOST", "core-mosquitto"))
+    parser.add_argument("--mqtt-port", type=int, default=int(os.getenv("MQTT_PORT", DEFAULT_MQTT_PORT)))
+    parser.add_argument("--concurrency", type=int, default=16, help="max Pis provisioned at once")
+    parser.add_argument("--rate", type=float, default=20.0, help="max requests per second (0 = unlimited)")
+    parser.add_argument("--page-size", type=int, default=500, help="asset query page size")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would be created")
+    return parser.parse_args(argv)
+
+
+async def async_main(args):
+    pi_ids = _read_pi_ids(args)
+    if not pi_ids:
+        _LOGGER.error("No pi_ids given")
+        return False
+    connector = aiohttp.TCPConnector(limit_per_host=args.concurrency, ttl_dns_cache=300)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        return await FleetProvisioner(session, args).run(pi_ids)
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    args = parse_args(argv)
+    if not args.url or not args.user or not args.password:
+        _LOGGER.error("OpenRemote URL and credentials are required (--url/--user/--password or OPENREMOTE_* env)")
+        return 2
+    return 0 if asyncio.run(async_main(args)) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,13 +1,29 @@
 # main.py - WizSmith Home Integration Add-on agent
 import os
 import time
+import asyncio
+import types
+import functools
 import json
 import logging
 import signal
 import requests
 import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 import paho.mqtt.client as mqtt
 
+from backoff import Backoff
+from command_dispatcher import CommandDispatcher
+from command_router import CommandRouter
+from delta_cache import DeltaCache
+from discovery_index import DiscoveryIndex
+from metrics import Metrics
+from rate_limiter import DEFAULT_BURST, DEFAULT_RATE_LIMITS, RateLimiter, parse_rates
+from snapshot import SnapshotDecoder
+from state_registry import Device, StateRegistry
+from store_forward import open_buffer
+from token_manager import TokenCache
+
 _LOGGER = logging.getLogger("wizsmith_agent")
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
 
@@ -22,68 +38,236 @@ OPENREMOTE_USER = os.getenv("OPENREMOTE_USER", "")
 OPENREMOTE_PASS = os.getenv("OPENREMOTE_PASS", "")
 SYNC_INTERVAL = int(os.getenv("SYNC_INTERVAL", "30"))
 
+# Delta publishing: seconds between full refreshes, JSON map of device_class -> numeric deadband
+FULL_REFRESH_INTERVAL = int(os.getenv("FULL_REFRESH_INTERVAL", "300"))
+DELTA_DEADBANDS = json.loads(os.getenv("DELTA_DEADBANDS") or "{}")
+# Per-device token buckets: "device_class_or_domain=updates_per_second,..." (or JSON) and burst size
+RATE_LIMITS = parse_rates(os.getenv("RATE_LIMITS") or DEFAULT_RATE_LIMITS)
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", str(DEFAULT_BURST)))
+
+# Command forwarding pool: worker threads, total queue size, full-queue policy
+COMMAND_WORKERS = int(os.getenv("COMMAND_WORKERS", "4"))
+COMMAND_QUEUE_SIZE = int(os.getenv("COMMAND_QUEUE_SIZE", "1000"))
+COMMAND_QUEUE_POLICY = os.getenv("COMMAND_QUEUE_POLICY", "coalesce")
+# Commands on this pattern go to OpenRemote unless a plug-in handles the device locally;
+# plug-ins are "device_id=module:callable" entries separated by commas
+COMMAND_TOPIC_PATTERN = "wizsmith/commands/{device_id}/{action#}"
+COMMAND_PLUGINS = os.getenv("COMMAND_PLUGINS", "")
+# Hub snapshots published by the integration, plain JSON or compact (see snapshot.py)
+SNAPSHOT_TOPIC = "wizsmith/+/sensors"
+# Only one command path may be active: the integration runs commands locally and forwards
+# the rest itself by default (its local_commands option), so forwarding here is off unless
+# that option is disabled; with both on every command runs twice and a toggle undoes itself
+FORWARD_COMMANDS = os.getenv("FORWARD_COMMANDS", "false").lower() in ("1", "true", "yes")
+
+# Store-and-forward buffer for outages: directory, disk cap, replay batch size and pacing
+BUFFER_DIR = os.getenv("BUFFER_DIR", "/config/wizsmith_buffer")
+BUFFER_MAX_MB = int(os.getenv("BUFFER_MAX_MB", "50"))
+REPLAY_BATCH_SIZE = int(os.getenv("REPLAY_BATCH_SIZE", "50"))
+REPLAY_INTERVAL = float(os.getenv("REPLAY_INTERVAL", "1"))
+
+# "threads" (paho + requests) or "asyncio" (aiomqtt + aiohttp on a single event loop)
+AGENT_MODE = os.getenv("AGENT_MODE", "threads")
+
+# Reconnect backoff caps (seconds) for the broker and OpenRemote
+MQTT_BACKOFF_MAX = float(os.getenv("MQTT_BACKOFF_MAX", "300"))
+OPENREMOTE_BACKOFF_MAX = float(os.getenv("OPENREMOTE_BACKOFF_MAX", "300"))
+
+# Home Assistant REST API used to enumerate entities (the Supervisor proxies it for add-ons)
+HA_API_URL = os.getenv("HA_API_URL", "http://supervisor/core/api")
+HA_TOKEN = os.getenv("HA_TOKEN") or os.getenv("SUPERVISOR_TOKEN", "")
+DISCOVERY_DOMAINS = [d.strip() for d in os.getenv("DISCOVERY_DOMAINS", "sensor,binary_sensor").split(",") if d.strip()]
+# Hashes of the retained discovery configs already on the broker; delete the file to force a full republish
+DISCOVERY_INDEX_PATH = os.getenv("DISCOVERY_INDEX_PATH", "/config/wizsmith_discovery_index.json")
+
+# Port for the Prometheus text endpoint (GET /metrics); 0 disables it
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
 CLIENT_ID = f"wizsmith-addon-{int(time.time())}"
 
-# Simple in-memory fake device list (replace with discovery from HA core if desired)
-DEVICES = [
-    {"id": "rpi_power_status", "name": "RPi Power status", "domain": "binary_sensor", "device_class": "problem"},
-    # Add other static devices here or dynamically build from HA state if you prefer
+# The hub's own devices: always published and the only ones announced through MQTT discovery.
+# Entities enumerated from Home Assistant by refresh_devices() only get their states mirrored;
+# announcing them would make HA create a copy of each, which the next refresh would mirror again.
+STATIC_DEVICES = [
+    Device("rpi_power_status", "RPi Power status", "binary_sensor", "problem"),
 ]
+DEVICES = list(STATIC_DEVICES)
+
+DISCOVERY_INDEX = DiscoveryIndex(DISCOVERY_INDEX_PATH)
+
+# Publish-path stage timings and counters
+METRICS = Metrics(prefix="wizsmith_agent")
+
+# Undelivered MQTT messages and OpenRemote commands; opened in main()
+MQTT_BUFFER = None
+COMMAND_BUFFER = None
+# topic -> time of its last live publish while an MQTT backlog is pending; live messages do
+# not wait behind the backlog, so replay skips buffered ones they have superseded
+_LIVE_PUBLISHED = {}
+
+# Cached OpenRemote token shared by all forwards; _TOKEN_LOCK serialises fetches
+_TOKEN_CACHE = TokenCache()
+_TOKEN_LOCK = threading.Lock()
+
+def _request_token(data, refreshed=False):
+    login_url = f"{OPENREMOTE_URL}/auth/realms/master/protocol/openid-connect/token"
+    resp = requests.post(login_url, data=data, timeout=10)
+    resp.raise_for_status()
+    return _TOKEN_CACHE.update(resp.json(), client_id=data.get("client_id"), refreshed=refreshed)
 
 # OpenRemote token helper (basic username/password -> token for manager API)
 def get_openremote_token():
     if not OPENREMOTE_URL or not OPENREMOTE_USER or not OPENREMOTE_PASS:
         _LOGGER.debug("OpenRemote credentials missing; skipping token fetch")
         return None
-    try:
-        login_url = f"{OPENREMOTE_URL}/auth/realms/master/protocol/openid-connect/token"
-        data = {"grant_type": "password", "username": OPENREMOTE_USER, "password": OPENREMOTE_PASS, "client_id": "admin-cli"}
-        resp = requests.post(login_url, data=data, timeout=10)
-        resp.raise_for_status()
-        token = resp.json().get("access_token")
-        _LOGGER.info("Obtained OpenRemote token")
+    token = _TOKEN_CACHE.get()
+    if token:
         return token
-    except Exception as e:
-        _LOGGER.exception("Failed to obtain OpenRemote token: %s", e)
-        return None
+    with _TOKEN_LOCK:
+        # another thread may have fetched a token while we waited for the lock
+        token = _TOKEN_CACHE.get()
+        if token:
+            return token
+        try:
+            data = {"grant_type": "password", "username": OPENREMOTE_USER, "password": OPENREMOTE_PASS, "client_id": "admin-cli"}
+            token = _request_token(data)
+            _LOGGER.info("Obtained OpenRemote token")
+            return token
+        except Exception as e:
+            _LOGGER.exception("Failed to obtain OpenRemote token: %s", e)
+            return None
+
+def refresh_openremote_token():
+    """Renew the cached token via its refresh token, falling back to a fresh login."""
+    data = _TOKEN_CACHE.refresh_data()
+    with _TOKEN_LOCK:
+        if data:
+            try:
+                token = _request_token(data, refreshed=True)
+                if token:
+                    _LOGGER.debug("Refreshed OpenRemote token (%s)", _TOKEN_CACHE.stats())
+                    return token
+            except Exception as e:
+                _LOGGER.warning("OpenRemote token refresh failed, logging in again: %s", e)
+        _TOKEN_CACHE.invalidate()
+    return get_openremote_token()
+
+def token_refresh_loop(stop_event):
+    """Refresh the OpenRemote token in the background shortly before it expires."""
+    backoff = Backoff(base=5, cap=OPENREMOTE_BACKOFF_MAX)
+    delay = 0
+    while not stop_event.wait(delay):
+        if refresh_openremote_token() is None:
+            delay = backoff.next_delay()
+            _LOGGER.warning("No OpenRemote token; retrying in %.0fs", delay)
+        else:
+            backoff.reset()
+            delay = _TOKEN_CACHE.refresh_delay()
+
+MQTT_BACKOFF = Backoff(base=1, cap=MQTT_BACKOFF_MAX)
 
 # MQTT callbacks
 def on_connect(client, userdata, flags, rc):
     if rc == 0:
         _LOGGER.info("Connected to MQTT broker %s:%s (client_id=%s)", MQTT_HOST, MQTT_PORT, CLIENT_ID)
-        # subscribe to commands from OpenRemote or other control channels
-        client.subscribe("wizsmith/commands/#", qos=0)
+        MQTT_BACKOFF.reset()
+        # clean sessions lose subscriptions, so (re)subscribe and republish discovery on every connect
+        client.subscribe([("wizsmith/commands/#", 0), (SNAPSHOT_TOPIC, 0)])
+        publish_discovery_messages(client)
     else:
         _LOGGER.error("MQTT connection failed with rc=%s", rc)
 
 def on_message(client, userdata, msg):
+    _LOGGER.debug("MQTT message received: %s -> %r", msg.topic, msg.payload)
+    command = COMMAND_ROUTER.resolve(msg.topic, msg.payload)
+    if command:
+        handler, device_id, action, payload = command
+        if handler is receive_snapshot:
+            # every delta must be applied in order, so never queue (and maybe coalesce) them
+            receive_snapshot(device_id, action, payload)
+            return
+        # never block paho's network thread on the handler
+        COMMAND_DISPATCHER.submit(device_id, action, (handler, payload))
+
+def _run_command(device_id, action, command):
+    handler, payload = command
+    handler(device_id, action, payload)
+
+# Latest states per hub, rebuilt from the snapshots on SNAPSHOT_TOPIC
+SNAPSHOT_DECODER = SnapshotDecoder()
+HUB_STATES = {}
+
+def receive_snapshot(pi_id, action, payload):
     try:
-        payload = msg.payload.decode("utf-8")
-    except Exception:
-        payload = str(msg.payload)
-    _LOGGER.info("MQTT message received: %s -> %s", msg.topic, payload)
-    # Forward commands to OpenRemote REST API (simple mapping)
-    if msg.topic.startswith("wizsmith/commands/"):
-        # Example: wizsmith/commands/<device_id>/<action>
-        parts = msg.topic.split("/")
-        if len(parts) >= 3:
-            device_id = parts[2]
-            action_path = "/".join(parts[3:]) if len(parts) > 3 else ""
-            forward_command_to_openremote(device_id, action_path, payload)
-
-def safe_publish(mqtt_client, topic, payload, qos=0, retain=False):
+        pi_id, states = SNAPSHOT_DECODER.decode(payload)
+    except Exception as e:
+        METRICS.inc("snapshot_decode_errors")
+        _LOGGER.debug("Could not decode snapshot from %s: %s", pi_id, e)
+        return
+    HUB_STATES[pi_id] = states
+    METRICS.inc("snapshots_decoded")
+    METRICS.inc("snapshot_bytes", len(payload))
+    METRICS.set_gauge("hubs", len(HUB_STATES))
+
+def build_command_router(forward):
+    router = CommandRouter()
+    # without forwarding the pattern only serves the plug-ins
+    router.route(COMMAND_TOPIC_PATTERN, forward if FORWARD_COMMANDS else None)
+    router.route(SNAPSHOT_TOPIC.replace("+", "{device_id}"), receive_snapshot, raw=True)
+    router.load_plugins(COMMAND_PLUGINS)
+    return router
+
+def safe_publish(mqtt_client, topic, payload, qos=0, retain=False, spool=True):
+    record = {"topic": topic, "payload": payload, "qos": qos, "retain": retain, "ts": time.time()}
     try:
-        mqtt_client.publish(topic, payload, qos=qos, retain=retain)
+        with METRICS.time("mqtt_publish"):
+            info = mqtt_client.publish(topic, payload, qos=qos, retain=retain)
+        if info.rc != mqtt.MQTT_ERR_SUCCESS:
+            raise RuntimeError(mqtt.error_string(info.rc))
+        _mark_live(topic, record["ts"])
+        METRICS.inc("mqtt_bytes", len(payload) if payload else 0)
         _LOGGER.debug("Published %s -> %s", topic, payload if len(str(payload)) < 200 else "<long>")
     except Exception as e:
-        _LOGGER.exception("Publish failed for %s: %s", topic, e)
+        METRICS.inc("mqtt_errors")
+        _LOGGER.warning("Publish failed for %s: %s", topic, e)
+        if spool and MQTT_BUFFER is not None:
+            MQTT_BUFFER.append(json.dumps(record).encode("utf-8"))
+
+def _mark_live(topic, ts):
+    if MQTT_BUFFER is not None and not MQTT_BUFFER.empty:
+        _LIVE_PUBLISHED[topic] = ts
+
+def _superseded(record):
+    """True if a live publish on the record's topic went out after it was buffered."""
+    return _LIVE_PUBLISHED.get(record["topic"], 0) > record.get("ts", 0)
+
+def _replay_mqtt(deliver):
+    def _deliver(r):
+        if _superseded(r):
+            METRICS.inc("replay_superseded")
+            return True
+        return deliver(r)
 
-# Forward a command to OpenRemote manager (example implementation)
+    _replay(MQTT_BUFFER, _deliver)
+    if MQTT_BUFFER.empty:
+        _LIVE_PUBLISHED.clear()
+
+# Forward a command to OpenRemote manager, buffering it on disk if OpenRemote is unreachable
 def forward_command_to_openremote(device_id, action_path, payload):
+    record = {"device_id": device_id, "action": action_path, "payload": payload}
+    if COMMAND_BUFFER is not None and not COMMAND_BUFFER.empty:
+        COMMAND_BUFFER.append(json.dumps(record).encode("utf-8"))
+        return
+    if not _send_command(device_id, action_path, payload) and COMMAND_BUFFER is not None:
+        COMMAND_BUFFER.append(json.dumps(record).encode("utf-8"))
+        _LOGGER.info("Buffered command for %s until OpenRemote is reachable", device_id)
+
+def _send_command(device_id, action_path, payload):
+    """POST one command; returns False if it should be retried later."""
     token = get_openremote_token()
     if not token:
         _LOGGER.warning("No token to forward command for %s", device_id)
-        return
+        return False
     url = f"{OPENREMOTE_URL}/api/master/asset/attribute/update"
     headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
     body = {
@@ -92,49 +276,498 @@ def forward_command_to_openremote(device_id, action_path, payload):
         "payload": payload
     }
     try:
-        resp = requests.post(url, json=body, headers=headers, timeout=10)
+        with METRICS.time("openremote_write"):
+            resp = requests.post(url, json=body, headers=headers, timeout=10)
+        if resp.status_code == 401:
+            # token revoked or expired server-side; next forward logs in again
+            _TOKEN_CACHE.invalidate()
         if resp.status_code >= 300:
+            METRICS.inc("openremote_errors")
             _LOGGER.error("OpenRemote command failed %s: %s", resp.status_code, resp.text)
-        else:
-            _LOGGER.info("OpenRemote command forwarded for %s", device_id)
+            # other client errors would fail again on replay
+            return resp.status_code < 500 and resp.status_code not in (401, 429)
+        METRICS.inc("openremote_commands")
+        _LOGGER.info("OpenRemote command forwarded for %s", device_id)
+        return True
     except Exception as e:
-        _LOGGER.exception("Forward to OpenRemote failed: %s", e)
+        METRICS.inc("openremote_errors")
+        _LOGGER.warning("Forward to OpenRemote failed: %s", e)
+        return False
 
-# Publish HA-style discovery messages for simple sensors
-def publish_discovery_messages(mqtt_client):
-    for d in DEVICES:
-        topic = f"homeassistant/{d['domain']}/{d['id']}/config"
+COMMAND_ROUTER = build_command_router(forward_command_to_openremote)
+
+COMMAND_DISPATCHER = CommandDispatcher(
+    _run_command,
+    workers=COMMAND_WORKERS,
+    max_queue=COMMAND_QUEUE_SIZE,
+    policy=COMMAND_QUEUE_POLICY,
+)
+
+# one interned id and slot per device, shared by the delta cache and rate limiter
+STATE_REGISTRY = StateRegistry()
+DELTA_CACHE = DeltaCache(deadbands=DELTA_DEADBANDS, full_refresh_interval=FULL_REFRESH_INTERVAL,
+                         registry=STATE_REGISTRY)
+RATE_LIMITER = RateLimiter(RATE_LIMITS, RATE_LIMIT_BURST, registry=STATE_REGISTRY)
+
+def _replay(buffer, deliver):
+    """Deliver buffered records in order; returns False if a delivery failed."""
+    # stop at the first failure; committed records are not resent
+    position = None
+    count = 0
+    ok = True
+    for line, pos in buffer.read(REPLAY_BATCH_SIZE):
+        try:
+            record = json.loads(line)
+        except ValueError:
+            _LOGGER.warning("Skipping corrupt buffered record")
+            position = pos
+            continue
+        if not deliver(record):
+            ok = False
+            break
+        position = pos
+        count += 1
+    if position is not None:
+        buffer.commit(position, count)
+    METRICS.inc("replayed", count)
+    if not ok:
+        METRICS.inc("replay_retries")
+    if count:
+        _LOGGER.info("Replayed %d buffered records from %s", count, buffer.directory)
+    return ok
+
+def replay_loop(mqtt_client, stop_event):
+    """Drain the store-and-forward buffers, at most REPLAY_BATCH_SIZE records per REPLAY_INTERVAL each."""
+    def _publish(r):
+        return mqtt_client.publish(r["topic"], r["payload"], qos=r["qos"], retain=r["retain"]).rc == mqtt.MQTT_ERR_SUCCESS
+
+    def _command(r):
+        return _send_command(r["device_id"], r["action"], r["payload"])
+
+    # OpenRemote may stay down for a while; back off instead of retrying every interval
+    backoff = Backoff(base=5, cap=OPENREMOTE_BACKOFF_MAX)
+    next_command_try = 0
+    while not stop_event.wait(REPLAY_INTERVAL):
+        try:
+            if MQTT_BUFFER is not None and not MQTT_BUFFER.empty and mqtt_client.is_connected():
+                _replay_mqtt(_publish)
+            if COMMAND_BUFFER is not None and not COMMAND_BUFFER.empty and time.monotonic() >= next_command_try:
+                if _replay(COMMAND_BUFFER, _command):
+                    backoff.reset()
+                else:
+                    next_command_try = time.monotonic() + backoff.next_delay()
+        except Exception as e:
+            _LOGGER.exception("Replay loop error: %s", e)
+
+def refresh_devices():
+    """Rebuild DEVICES from Home Assistant's entity states; keeps the old list on failure."""
+    global DEVICES
+    if not HA_TOKEN:
+        return
+    try:
+        resp = requests.get(f"{HA_API_URL}/states", headers={"Authorization": f"Bearer {HA_TOKEN}"}, timeout=10)
+        resp.raise_for_status()
+        states = resp.json()
+    except Exception as e:
+        _LOGGER.warning("Could not enumerate Home Assistant entities: %s", e)
+        return
+    devices = list(STATIC_DEVICES)
+    own = {d.id for d in STATIC_DEVICES}
+    for st in states:
+        entity_id = st.get("entity_id", "")
+        domain, _, object_id = entity_id.partition(".")
+        if domain not in DISCOVERY_DOMAINS:
+            continue
+        # skip the entities HA created from our own discovery configs (HA may add a _2 suffix)
+        if object_id in own or object_id.rsplit("_", 1)[0] in own:
+            continue
+        attrs = st.get("attributes") or {}
+        devices.append(Device(
+            entity_id.replace(".", "_"),
+            attrs.get("friendly_name", entity_id),
+            domain,
+            attrs.get("device_class"),
+            st.get("state"),
+        ))
+    DEVICES = devices
+    # clears the rate limiter's buckets too
+    STATE_REGISTRY.prune({d.id for d in devices})
+
+# HA-style discovery configs for the hub's own devices that changed since last published:
+# (topic, payload); "" clears a config, including ones older versions published for HA entities
+def _discovery_messages():
+    current = {}
+    for d in STATIC_DEVICES:
+        topic = f"homeassistant/{d.domain}/{d.id}/config"
         payload = {
-            "name": d["name"],
-            "uniq_id": d["id"],
-            "state_topic": f"wizsmith/{d['id']}/state",
+            "name": d.name,
+            "uniq_id": d.id,
+            "state_topic": f"wizsmith/{d.id}/state",
             "qos": 0
         }
-        if "device_class" in d:
-            payload["device_class"] = d["device_class"]
-        safe_publish(mqtt_client, topic, json.dumps(payload), qos=0, retain=True)
-        _LOGGER.info("Published discovery for %s", d["id"])
+        if d.device_class:
+            payload["device_class"] = d.device_class
+        current[topic] = json.dumps(payload, sort_keys=True)
+    changed, removed = DISCOVERY_INDEX.diff(current)
+    for topic, payload in changed:
+        yield topic, payload
+    for topic in removed:
+        yield topic, ""
+
+def publish_discovery_messages(mqtt_client):
+    count = 0
+    for topic, payload in _discovery_messages():
+        safe_publish(mqtt_client, topic, payload, qos=0, retain=True)
+        DISCOVERY_INDEX.mark(topic, payload)
+        count += 1
+    if count:
+        DISCOVERY_INDEX.save()
+        _LOGGER.info("Published %d discovery updates (%d configs indexed)", count, len(DISCOVERY_INDEX))
+
+# Changed device states since the last cycle: (topic, payload)
+def _state_messages():
+    full_refresh = DELTA_CACHE.full_refresh_due()
+    for d in DEVICES:
+        if d.state is not None:
+            state_val = d.state
+        # placeholder states for static devices
+        elif d.domain == "binary_sensor":
+            state_val = "OFF"
+        else:
+            state_val = "unknown"
+        # only publish changes, except on the periodic full refresh; throttled
+        # devices are picked up with their latest state on a later cycle
+        if DELTA_CACHE.should_publish(d.id, state_val, d.device_class, force=full_refresh,
+                                      limiter=RATE_LIMITER, domain=d.domain):
+            yield f"wizsmith/{d.id}/state", state_val
+
+# Agent health: delta counters, command queue depth/latency, buffer usage
+def _status_messages(command_stats):
+    buffers = {"mqtt": MQTT_BUFFER, "commands": COMMAND_BUFFER}
+    METRICS.set_gauge("command_queue_depth", command_stats.get("depth", 0))
+    for name, buffer in buffers.items():
+        if buffer is not None:
+            METRICS.set_gauge(f"{name}_buffer_pending_bytes", buffer.pending_bytes())
+    yield "wizsmith/status/publish", json.dumps(
+        dict(DELTA_CACHE.stats(), rate_limit=RATE_LIMITER.stats(), registry=STATE_REGISTRY.stats())
+    )
+    yield "wizsmith/status/commands", json.dumps(command_stats)
+    yield "wizsmith/status/buffer", json.dumps({k: b.stats() for k, b in buffers.items() if b})
+    yield "wizsmith/status/metrics", json.dumps(METRICS.snapshot())
 
 # Publish periodic states (replace fetches with real sensor reads)
 def publish_states_loop(mqtt_client, stop_event):
+    backoff = Backoff(base=5, cap=SYNC_INTERVAL * 10)
+    while not stop_event.is_set():
+        try:
+            with METRICS.time("cycle"):
+                with METRICS.time("snapshot"):
+                    refresh_devices()
+                if mqtt_client.is_connected():
+                    publish_discovery_messages(mqtt_client)
+                for topic, payload in _state_messages():
+                    safe_publish(mqtt_client, topic, payload, qos=0, retain=False)
+            for topic, payload in _status_messages(dict(COMMAND_DISPATCHER.stats(), **COMMAND_ROUTER.stats())):
+                safe_publish(mqtt_client, topic, payload, spool=False)
+            backoff.reset()
+            stop_event.wait(SYNC_INTERVAL)
+        except Exception as e:
+            METRICS.inc("cycle_errors")
+            delay = backoff.next_delay()
+            _LOGGER.exception("State publish loop error, retrying in %.0fs: %s", delay, e)
+            stop_event.wait(delay)
+
+def mqtt_supervisor(client, stop_event):
+    """Run the MQTT network loop, reconnecting with jittered exponential backoff."""
     while not stop_event.is_set():
         try:
-            # Normally query Home Assistant via REST or listen to entity updates; for now publish sample states
-            for d in DEVICES:
-                st_topic = f"wizsmith/{d['id']}/state"
-                # sample placeholder states
-                if d["domain"] == "binary_sensor":
-                    state_val = "OFF"
+            # connect_async() stored the broker address; reconnect() performs the connect
+            client.reconnect()
+        except Exception as e:
+            delay = MQTT_BACKOFF.next_delay()
+            _LOGGER.warning("MQTT connect to %s:%s failed (%s); retrying in %.1fs", MQTT_HOST, MQTT_PORT, e, delay)
+            stop_event.wait(delay)
+            continue
+        rc = mqtt.MQTT_ERR_SUCCESS
+        while rc == mqtt.MQTT_ERR_SUCCESS and not stop_event.is_set():
+            rc = client.loop(timeout=1.0)
+        if stop_event.is_set():
+            return
+        delay = MQTT_BACKOFF.next_delay()
+        _LOGGER.warning("MQTT connection lost (%s); reconnecting in %.1fs", mqtt.error_string(rc), delay)
+        stop_event.wait(delay)
+
+# ---- asyncio mode (AGENT_MODE=asyncio) ----
+# One event loop runs MQTT (aiomqtt), command forwarding and token refresh, reusing the
+# integration's OpenRemoteClient (aiohttp) instead of requests and extra threads.
+
+class _AgentRuntime:
+    """The parts of HomeAssistant that OpenRemoteClient uses, backed by a plain event loop."""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.config = types.SimpleNamespace(path=lambda *parts: os.path.join(BUFFER_DIR, *parts))
+        self._tasks = set()
+
+    def async_create_task(self, coro):
+        task = self.loop.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def async_create_background_task(self, coro, name):
+        return self.async_create_task(coro)
+
+    def async_add_executor_job(self, func, *args):
+        return self.loop.run_in_executor(None, func, *args)
+
+async def _wait(stop, delay):
+    # sleep for delay seconds; True if stop was set meanwhile
+    try:
+        await asyncio.wait_for(stop.wait(), delay)
+        return True
+    except asyncio.TimeoutError:
+        return False
+
+async def async_safe_publish(state, topic, payload, qos=0, retain=False, spool=True):
+    loop = asyncio.get_running_loop()
+    ts = time.time()
+    record = json.dumps({"topic": topic, "payload": payload, "qos": qos, "retain": retain, "ts": ts}).encode("utf-8")
+    client = state["mqtt"]
+    if client is None:
+        if spool and MQTT_BUFFER is not None:
+            await loop.run_in_executor(None, MQTT_BUFFER.append, record)
+        return
+    try:
+        with METRICS.time("mqtt_publish"):
+            await client.publish(topic, payload, qos=qos, retain=retain)
+        _mark_live(topic, ts)
+        METRICS.inc("mqtt_bytes", len(payload) if payload else 0)
+    except Exception as e:
+        METRICS.inc("mqtt_errors")
+        _LOGGER.warning("Publish failed for %s: %s", topic, e)
+        if spool and MQTT_BUFFER is not None:
+            await loop.run_in_executor(None, MQTT_BUFFER.append, record)
+
+async def async_forward_command(or_client, device_id, action_path, payload):
+    record = {"device_id": device_id, "action": action_path, "payload": payload}
+    loop = asyncio.get_running_loop()
+    if COMMAND_BUFFER is not None and not COMMAND_BUFFER.empty:
+        await loop.run_in_executor(None, COMMAND_BUFFER.append, json.dumps(record).encode("utf-8"))
+        return
+    with METRICS.time("openremote_write"):
+        ok = await or_client.async_post("asset/attribute/update", record)
+    if ok:
+        METRICS.inc("openremote_commands")
+        _LOGGER.info("OpenRemote command forwarded for %s", device_id)
+        return
+    METRICS.inc("openremote_errors")
+    if COMMAND_BUFFER is not None:
+        await loop.run_in_executor(None, COMMAND_BUFFER.append, json.dumps(record).encode("utf-8"))
+        _LOGGER.info("Buffered command for %s until OpenRemote is reachable", device_id)
+
+async def _async_command_worker(queue):
+    # one queue per worker, sharded by device id, keeps each device's commands in order
+    loop = asyncio.get_running_loop()
+    while True:
+        handler, device_id, action_path, payload = await queue.get()
+        try:
+            if asyncio.iscoroutinefunction(handler):
+                await handler(device_id, action_path, payload)
+            else:
+                # plug-ins are plain functions and may block
+                await loop.run_in_executor(None, handler, device_id, action_path, payload)
+        except Exception:
+            _LOGGER.exception("Command handler failed for %s", device_id)
+
+async def async_mqtt_loop(state, router, queues, stop):
+    import aiomqtt
+
+    while not stop.is_set():
+        try:
+            async with aiomqtt.Client(
+                MQTT_HOST, MQTT_PORT, identifier=CLIENT_ID, keepalive=60,
+                username=MQTT_USER or None, password=MQTT_PASS or None,
+            ) as client:
+                _LOGGER.info("Connected to MQTT broker %s:%s (client_id=%s)", MQTT_HOST, MQTT_PORT, CLIENT_ID)
+                MQTT_BACKOFF.reset()
+                state["mqtt"] = client
+                await client.subscribe([("wizsmith/commands/#", 0), (SNAPSHOT_TOPIC, 0)])
+                await async_publish_discovery(state)
+                async for message in client.messages:
+                    command = router.resolve(message.topic.value, message.payload)
+                    if not command:
+                        continue
+                    if command[0] is receive_snapshot:
+                        receive_snapshot(*command[1:])
+                        continue
+                    queue = queues[hash(command[1]) % len(queues)]
+                    try:
+                        queue.put_nowait(command)
+                    except asyncio.QueueFull:
+                        state["dropped"] += 1
+                        _LOGGER.warning("Command queue full; dropped command for %s", command[1])
+        except aiomqtt.MqttError as e:
+            state["mqtt"] = None
+            delay = MQTT_BACKOFF.next_delay()
+            _LOGGER.warning("MQTT connection to %s:%s lost (%s); reconnecting in %.1fs", MQTT_HOST, MQTT_PORT, e, delay)
+            if await _wait(stop, delay):
+                return
+
+async def async_publish_discovery(state):
+    count = 0
+    for topic, payload in _discovery_messages():
+        await async_safe_publish(state, topic, payload, retain=True)
+        DISCOVERY_INDEX.mark(topic, payload)
+        count += 1
+    if count:
+        await asyncio.get_running_loop().run_in_executor(None, DISCOVERY_INDEX.save)
+        _LOGGER.info("Published %d discovery updates (%d configs indexed)", count, len(DISCOVERY_INDEX))
+
+async def async_publish_states_loop(state, queues, stop):
+    loop = asyncio.get_running_loop()
+    backoff = Backoff(base=5, cap=SYNC_INTERVAL * 10)
+    while not stop.is_set():
+        delay = SYNC_INTERVAL
+        try:
+            with METRICS.time("cycle"):
+                with METRICS.time("snapshot"):
+                    await loop.run_in_executor(None, refresh_devices)
+                if state["mqtt"] is not None:
+                    await async_publish_discovery(state)
+                for topic, payload in _state_messages():
+                    await async_safe_publish(state, topic, payload)
+            command_stats = {"depth": sum(q.qsize() for q in queues), "workers": len(queues), "dropped": state["dropped"], **state["router"].stats()}
+            for topic, payload in _status_messages(command_stats):
+                await async_safe_publish(state, topic, payload, spool=False)
+            backoff.reset()
+        except Exception as e:
+            METRICS.inc("cycle_errors")
+            delay = backoff.next_delay()
+            _LOGGER.exception("State publish loop error, retrying in %.0fs: %s", delay, e)
+        if await _wait(stop, delay):
+            return
+
+async def async_replay_loop(state, or_client, stop):
+    """asyncio counterpart of replay_loop; file I/O runs in the default executor."""
+    loop = asyncio.get_running_loop()
+
+    async def _publish(r):
+        try:
+            await state["mqtt"].publish(r["topic"], r["payload"], qos=r["qos"], retain=r["retain"])
+            return True
+        except Exception:
+            return False
+
+    def _blocking(coro_fn):
+        # _replay runs in a worker thread and waits for each delivery on the loop
+        return lambda r: asyncio.run_coroutine_threadsafe(coro_fn(r), loop).result()
+
+    backoff = Backoff(base=5, cap=OPENREMOTE_BACKOFF_MAX)
+    next_command_try = 0
+    while not await _wait(stop, REPLAY_INTERVAL):
+        try:
+            if MQTT_BUFFER is not None and not MQTT_BUFFER.empty and state["mqtt"] is not None:
+                await loop.run_in_executor(None, _replay_mqtt, _blocking(_publish))
+            if COMMAND_BUFFER is not None and not COMMAND_BUFFER.empty and time.monotonic() >= next_command_try:
+                ok = await loop.run_in_executor(
+                    None, _replay, COMMAND_BUFFER, _blocking(lambda r: or_client.async_post("asset/attribute/update", r))
+                )
+                if ok:
+                    backoff.reset()
                 else:
-                    state_val = "unknown"
-                payload = state_val
-                safe_publish(mqtt_client, st_topic, payload, qos=0, retain=False)
-            time.sleep(SYNC_INTERVAL)
+                    next_command_try = time.monotonic() + backoff.next_delay()
         except Exception as e:
-            _LOGGER.exception("State publish loop error: %s", e)
-            time.sleep(5)
+            _LOGGER.exception("Replay loop error: %s", e)
+
+async def async_authenticate_loop(or_client, stop):
+    # OpenRemoteClient refreshes the token itself once the first login succeeded
+    backoff = Backoff(base=5, cap=OPENREMOTE_BACKOFF_MAX)
+    while not await or_client.async_authenticate():
+        delay = backoff.next_delay()
+        _LOGGER.warning("OpenRemote authentication failed; retrying in %.0fs", delay)
+        if await _wait(stop, delay):
+            return
+
+async def async_main():
+    from const import CONF_OR_URL, CONF_OR_USER, CONF_OR_PASS, CONF_OR_REALM
+    from openremote_client import OpenRemoteClient
+
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+
+    cfg = {CONF_OR_URL: OPENREMOTE_URL, CONF_OR_USER: OPENREMOTE_USER, CONF_OR_PASS: OPENREMOTE_PASS, CONF_OR_REALM: "master"}
+    or_client = OpenRemoteClient(_AgentRuntime(loop), cfg, CLIENT_ID)
+    state = {"mqtt": None, "dropped": 0}
+    queue_size = max(1, COMMAND_QUEUE_SIZE // max(1, COMMAND_WORKERS))
+    queues = [asyncio.Queue(maxsize=queue_size) for _ in range(max(1, COMMAND_WORKERS))]
+
+    router = build_command_router(functools.partial(async_forward_command, or_client))
+    state["router"] = router
+
+    tasks = [loop.create_task(_async_command_worker(q)) for q in queues]
+    tasks.append(loop.create_task(async_mqtt_loop(state, router, queues, stop)))
+    tasks.append(loop.create_task(async_publish_states_loop(state, queues, stop)))
+    tasks.append(loop.create_task(async_replay_loop(state, or_client, stop)))
+    if OPENREMOTE_URL and OPENREMOTE_USER and OPENREMOTE_PASS:
+        tasks.append(loop.create_task(async_authenticate_loop(or_client, stop)))
+
+    await stop.wait()
+    _LOGGER.info("Stopping")
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await or_client.async_close()
+    _LOGGER.info("OpenRemote token stats: %s", or_client.tokens.stats())
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = METRICS.prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        _LOGGER.debug("metrics: " + format, *args)
+
+def start_metrics_server():
+    """Serve METRICS at http://<host>:METRICS_PORT/metrics from a daemon thread."""
+    if not METRICS_PORT:
+        return None
+    try:
+        server = ThreadingHTTPServer(("", METRICS_PORT), _MetricsHandler)
+    except OSError as e:
+        _LOGGER.error("Could not start metrics endpoint on port %s: %s", METRICS_PORT, e)
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="wizsmith-metrics", daemon=True).start()
+    _LOGGER.info("Prometheus metrics on port %s", METRICS_PORT)
+    return server
 
 def main():
+    global MQTT_BUFFER, COMMAND_BUFFER
+    # the disk cap is split between the two buffers
+    buffer_bytes = BUFFER_MAX_MB * 1024 * 1024 // 2
+    MQTT_BUFFER = open_buffer(os.path.join(BUFFER_DIR, "mqtt"), buffer_bytes)
+    COMMAND_BUFFER = open_buffer(os.path.join(BUFFER_DIR, "commands"), buffer_bytes)
+    start_metrics_server()
+
+    if AGENT_MODE == "asyncio":
+        try:
+            asyncio.run(async_main())
+        finally:
+            for buffer in (MQTT_BUFFER, COMMAND_BUFFER):
+                if buffer is not None:
+                    buffer.close()
+        return
+
     client = mqtt.Client(client_id=CLIENT_ID, clean_session=True)
     if MQTT_USER:
         client.username_pw_set(MQTT_USER, MQTT_PASS)
@@ -142,19 +775,21 @@ def main():
     client.on_message = on_message
 
     _LOGGER.info("Connecting to MQTT broker %s:%s", MQTT_HOST, MQTT_PORT)
-    try:
-        client.connect(MQTT_HOST, MQTT_PORT, 60)
-    except Exception as e:
-        _LOGGER.exception("Failed to connect to MQTT broker: %s", e)
-        return
+    client.connect_async(MQTT_HOST, MQTT_PORT, 60)
 
     stop_event = threading.Event()
+    mqtt_thread = threading.Thread(target=mqtt_supervisor, args=(client, stop_event), daemon=True)
     state_thread = threading.Thread(target=publish_states_loop, args=(client, stop_event), daemon=True)
+    token_thread = threading.Thread(target=token_refresh_loop, args=(stop_event,), daemon=True)
+    replay_thread = threading.Thread(target=replay_loop, args=(client, stop_event), daemon=True)
 
     try:
-        client.loop_start()
-        publish_discovery_messages(client)
+        COMMAND_DISPATCHER.start()
+        mqtt_thread.start()
         state_thread.start()
+        replay_thread.start()
+        if OPENREMOTE_URL and OPENREMOTE_USER and OPENREMOTE_PASS:
+            token_thread.start()
         # Run until killed
         while True:
             time.sleep(1)
@@ -162,8 +797,13 @@ def main():
         _LOGGER.info("Stopping (KeyboardInterrupt)")
     finally:
         stop_event.set()
-        client.loop_stop()
         client.disconnect()
+        mqtt_thread.join(5)
+        COMMAND_DISPATCHER.stop()
+        for buffer in (MQTT_BUFFER, COMMAND_BUFFER):
+            if buffer is not None:
+                buffer.close()
+        _LOGGER.info("OpenRemote token stats: %s", _TOKEN_CACHE.stats())
 
 if __name__ == "__main__":
     main()
@@ -1,11 +1,40 @@
 """Helper for OpenRemote API interactions."""
 
+import asyncio
 import aiohttp
+import hashlib
+import json
 import logging
-from .const import *
+import time
+
+try:
+    from .const import *
+    from .backoff import Backoff
+    from .metrics import Metrics
+    from .snapshot import dumps, encode_attribute_state, encode_attribute_states
+    from .store_forward import open_buffer
+    from .token_manager import TokenCache
+except ImportError:
+    # loaded as a top-level module by the add-on agent (main.py)
+    from const import *
+    from backoff import Backoff
+    from metrics import Metrics
+    from snapshot import dumps, encode_attribute_state, encode_attribute_states
+    from store_forward import open_buffer
+    from token_manager import TokenCache
 
 _LOGGER = logging.getLogger(__name__)
 
+
+# where commands for devices outside this hub are forwarded
+COMMAND_PATH = "asset/attribute/update"
+
+
+def _should_retry(status):
+    # other client errors would be rejected again
+    return status >= 500 or status in (401, 429)
+
+
 class OpenRemoteClient:
     """OpenRemote API wrapper."""
 
@@ -13,32 +42,245 @@ class OpenRemoteClient:
         self.hass = hass
         self.cfg = cfg
         self.pi_id = pi_id
+        self.session = None
         self.token = None
+        self.tokens = TokenCache()
+        # publish-path timings and counters; replaced by the hub publisher's shared Metrics
+        self.metrics = Metrics()
+        self._refresh_task = None
         self.agent_id = None
         self.child_id = None
         self.child_attr = None
+        self._store = None
+        # set once the hub's assets are provisioned (setup runs in the background)
+        self.ready = asyncio.Event()
+        # pending attribute writes: (asset_id, attribute) -> latest value
+        self._pending_attrs = {}
+        self._flush_handle = None
+        self._flush_lock = asyncio.Lock()
+        self.batch_size = int(cfg.get(CONF_OR_BATCH_SIZE, DEFAULT_OR_BATCH_SIZE))
+        self.batch_delay = float(cfg.get(CONF_OR_BATCH_DELAY, DEFAULT_OR_BATCH_DELAY))
+        # on-disk backlogs of writes and forwarded commands that could not be delivered; opened in setup
+        self.buffer = None
+        self.command_buffer = None
+        self._replay_task = None
+        # pending retry timer and the setup() it started; both end with async_close
+        self._setup_retry = None
+        self._setup_retry_task = None
+        self._closed = False
+        self._setup_backoff = Backoff(SETUP_RETRY_MIN, SETUP_RETRY_MAX)
+        self.replay_batch_size = int(cfg.get(CONF_REPLAY_BATCH_SIZE, DEFAULT_REPLAY_BATCH_SIZE))
+        self.replay_interval = float(cfg.get(CONF_REPLAY_INTERVAL, DEFAULT_REPLAY_INTERVAL))
+        # attribute event stream from OpenRemote; started by the first listener
+        self._event_listeners = []
+        self._event_task = None
+        self._events_backoff = Backoff(EVENTS_RETRY_MIN, EVENTS_RETRY_MAX)
+        self.events_connected = False
+
+    def _get_session(self):
+        """Return the client's long-lived pooled session, creating it on first use."""
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(
+                limit_per_host=int(self.cfg.get(CONF_OR_POOL_LIMIT, DEFAULT_OR_POOL_LIMIT)),
+                ttl_dns_cache=int(self.cfg.get(CONF_OR_DNS_TTL, DEFAULT_OR_DNS_TTL)),
+                keepalive_timeout=int(self.cfg.get(CONF_OR_KEEPALIVE, DEFAULT_OR_KEEPALIVE)),
+            )
+            self.session = aiohttp.ClientSession(connector=connector)
+        return self.session
 
     async def setup(self):
+        if self._closed:
+            return
         url = self.cfg.get(CONF_OR_URL)
-        realm = self.cfg.get(CONF_OR_REALM, DEFAULT_OR_REALM)
+        session = self._get_session()
+        self._setup_retry = None
+        if self._replay_task is None:
+            max_bytes = int(self.cfg.get(CONF_BUFFER_MAX_MB, DEFAULT_BUFFER_MAX_MB)) * 1024 * 1024
+            path = self.hass.config.path("wizsmith_buffer", "openremote")
+            self.buffer = await self.hass.async_add_executor_job(open_buffer, path, max_bytes)
+            path = self.hass.config.path("wizsmith_buffer", "openremote_commands")
+            self.command_buffer = await self.hass.async_add_executor_job(open_buffer, path, max_bytes)
+            if self.buffer is not None or self.command_buffer is not None:
+                self._replay_task = self.hass.async_create_background_task(
+                    self._replay_loop(), "wizsmith OpenRemote replay"
+                )
 
-        async with aiohttp.ClientSession() as session:
-            # Authenticate
-            self.token = await self._get_token(session, url, realm)
-            if not self.token:
-                _LOGGER.warning("OpenRemote authentication failed")
-                return
+        # Authenticate
+        if not await self.async_authenticate():
+            self._schedule_setup_retry("OpenRemote authentication failed")
+            return
+
+        # Reuse the assets provisioned by a previous start if config and server still match
+        if await self._load_provisioning(session, url):
+            self._setup_backoff.reset()
+            self.ready.set()
+            return
+
+        # Ensure MQTTAgent
+        self.agent_id = await self._ensure_agent(session, url)
+        if self.agent_id:
+            child = await self._create_child(session, url)
+            if child:
+                self.child_id = child["child_id"]
+                self.child_attr = child["attribute"]
+        if self.child_id:
+            self._setup_backoff.reset()
+            await self._save_provisioning()
+            self.ready.set()
+            _LOGGER.info("OpenRemote provisioning complete (agent=%s child=%s)", self.agent_id, self.child_id)
+        else:
+            self._schedule_setup_retry("OpenRemote provisioning incomplete")
+
+    def _realm(self):
+        return self.cfg.get(CONF_OR_REALM, DEFAULT_OR_REALM)
+
+    def _api_url(self, base_url, path):
+        return f"{base_url.rstrip('/')}/api/{self._realm()}/{path}"
+
+    def _config_hash(self):
+        # anything that changes which assets we should be using invalidates the cache
+        keys = (CONF_OR_URL, CONF_OR_REALM, CONF_MQTT_HOST, CONF_MQTT_PORT)
+        data = {k: self.cfg.get(k) for k in keys}
+        data["pi_id"] = self.pi_id
+        return hashlib.sha1(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()
+
+    async def _load_provisioning(self, session, base_url):
+        """Adopt cached asset ids after verifying them with one asset query."""
+        if self._store is None:
+            from homeassistant.helpers.storage import Store
+            # one client per OpenRemote URL and realm, each with its own assets
+            target = hashlib.sha1(f"{base_url}:{self._realm()}".encode()).hexdigest()[:12]
+            self._store = Store(self.hass, STORAGE_VERSION, f"{STORAGE_KEY_PROVISIONING}.{self.pi_id}.{target}")
+        cached = await self._store.async_load()
+        if not cached or cached.get("config_hash") != self._config_hash():
+            return False
+        agent_id, child_id, attribute = cached.get("agent_id"), cached.get("child_id"), cached.get("attribute")
+        assets = await self._query_assets(session, base_url, {"ids": [agent_id, child_id]})
+        if assets is None:
+            # server unreachable: trust the cache rather than re-provisioning blindly
+            found = {agent_id: {}, child_id: {}}
+        else:
+            found = {a.get("id"): a for a in assets}
+        child = found.get(child_id)
+        if agent_id not in found or child is None:
+            _LOGGER.info("Cached OpenRemote assets are gone; provisioning again")
+            return False
+        if child.get("attributes") and attribute not in child["attributes"]:
+            _LOGGER.info("Cached OpenRemote attribute %s is gone; provisioning again", attribute)
+            return False
+        if child.get("attributes") and COMMANDS_ATTRIBUTE not in child["attributes"]:
+            # provisioned before commands were read from OpenRemote
+            await self._create_attributes(session, base_url, child_id, [COMMANDS_ATTRIBUTE])
+        self.agent_id, self.child_id, self.child_attr = agent_id, child_id, attribute
+        _LOGGER.debug("Using cached OpenRemote provisioning (agent=%s child=%s)", agent_id, child_id)
+        return True
+
+    async def _save_provisioning(self):
+        await self._store.async_save({
+            "agent_id": self.agent_id,
+            "child_id": self.child_id,
+            "attribute": self.child_attr,
+            "config_hash": self._config_hash(),
+        })
+
+    async def async_authenticate(self):
+        """Fetch a token and start refreshing it in the background; False if auth failed."""
+        url = self.cfg.get(CONF_OR_URL)
+        realm = self._realm()
+        self.token = await self._get_token(self._get_session(), url, realm)
+        if not self.token:
+            return False
+        if self._refresh_task is None:
+            self._refresh_task = self.hass.async_create_background_task(
+                self._token_refresh_loop(url, realm), "wizsmith OpenRemote token refresh"
+            )
+        return True
+
+    def _schedule_setup_retry(self, reason):
+        if self._closed:
+            return
+        delay = self._setup_backoff.next_delay()
+        self.metrics.inc("setup_retries")
+        _LOGGER.warning("%s; retrying in %.0fs", reason, delay)
+        self._setup_retry = self.hass.loop.call_later(delay, self._retry_setup)
+
+    def _retry_setup(self):
+        self._setup_retry_task = self.hass.async_create_background_task(
+            self.setup(), "wizsmith OpenRemote provisioning"
+        )
+
+    async def async_close(self):
+        self._closed = True
+        if self._setup_retry:
+            self._setup_retry.cancel()
+            self._setup_retry = None
+        if self._setup_retry_task:
+            self._setup_retry_task.cancel()
+            self._setup_retry_task = None
+        if self._replay_task:
+            self._replay_task.cancel()
+            self._replay_task = None
+        if self._pending_attrs:
+            await self.async_flush_attributes()
+        if self._flush_handle:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._refresh_task:
+            self._refresh_task.cancel()
+            self._refresh_task = None
+        if self._event_task:
+            self._event_task.cancel()
+            self._event_task = None
+        for buffer in (self.buffer, self.command_buffer):
+            if buffer is not None:
+                await self.hass.async_add_executor_job(buffer.close)
+        self.buffer = self.command_buffer = None
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
 
-            # Ensure MQTTAgent
-            self.agent_id = await self._ensure_agent(session, url)
-            if self.agent_id:
-                child = await self._create_child(session, url)
-                if child:
-                    self.child_id = child["child_id"]
-                    self.child_attr = child["attribute"]
+    async def _token_refresh_loop(self, base_url, realm):
+        """Keep self.token fresh by refreshing shortly before it expires."""
+        backoff = Backoff(TOKEN_RETRY_MIN, TOKEN_RETRY_MAX)
+        delay = self.tokens.refresh_delay()
+        while True:
+            await asyncio.sleep(delay)
+            token = await self._refresh_token(self._get_session(), base_url, realm)
+            if token:
+                self.token = token
+                backoff.reset()
+                delay = self.tokens.refresh_delay()
+                _LOGGER.debug("OpenRemote token refreshed (%s)", self.tokens.stats())
+            else:
+                delay = backoff.next_delay()
+                _LOGGER.warning("OpenRemote token refresh failed; retrying in %.0fs", delay)
+
+    async def _refresh_token(self, session, base_url, realm):
+        from urllib.parse import urljoin
+        client_secret = None
+        if self.tokens.client_id and self.tokens.client_id == self.cfg.get(CONF_OR_CLIENT_ID):
+            client_secret = self.cfg.get(CONF_OR_CLIENT_SECRET)
+        data = self.tokens.refresh_data(client_secret)
+        if data:
+            token_url = urljoin(base_url, f"/auth/realms/{realm}/protocol/openid-connect/token")
+            try:
+                async with session.post(token_url, data=data, timeout=10) as resp:
+                    if resp.status == 200:
+                        r = await resp.json()
+                        token = self.tokens.update(r, refreshed=True)
+                        if token:
+                            return token
+            except Exception as e:
+                _LOGGER.warning("Refresh token error: %s", e)
+        # refresh token missing or rejected: log in again
+        self.tokens.invalidate()
+        return await self._get_token(session, base_url, realm)
 
     async def _get_token(self, session, base_url, realm):
         from urllib.parse import urljoin
+        token = self.tokens.get()
+        if token:
+            return token
         # client_credentials first
         client_id = self.cfg.get(CONF_OR_CLIENT_ID)
         client_secret = self.cfg.get(CONF_OR_CLIENT_SECRET)
@@ -53,7 +295,7 @@ class OpenRemoteClient:
                 async with session.post(token_url, data=data, timeout=10) as resp:
                     if resp.status == 200:
                         r = await resp.json()
-                        return r.get("access_token")
+                        return self.tokens.update(r, client_id=client_id)
             except Exception as e:
                 _LOGGER.warning("Client credentials token error: %s", e)
         # password grant
@@ -71,27 +313,35 @@ class OpenRemoteClient:
                 async with session.post(token_url, data=data, timeout=10) as resp:
                     if resp.status == 200:
                         r = await resp.json()
-                        return r.get("access_token")
+                        return self.tokens.update(r, client_id="admin-cli")
             except Exception as e:
                 _LOGGER.warning("Password grant token error: %s", e)
         return None
 
-    async def _ensure_agent(self, session, base_url):
-        name = f"wizsmith-pi-{self.pi_id}"
-        # Query or create asset
-        query_url = f"{base_url.rstrip('/')}/api/master/asset/query"
+    async def _query_assets(self, session, base_url, payload):
+        """Run an asset query; returns the matching assets, or None if the query failed."""
+        query_url = self._api_url(base_url, "asset/query")
         headers = {"Authorization": f"Bearer {self.token}", "Content-Type": "application/json"}
-        payload = {"names": [name]}
         try:
             async with session.post(query_url, json=payload, headers=headers, timeout=10) as resp:
                 if resp.status == 200:
                     res = await resp.json()
-                    if isinstance(res, dict) and res.get("items"):
-                        return res["items"][0].get("id")
-        except Exception:
-            pass
+                    if isinstance(res, dict):
+                        return res.get("items") or []
+                    return res or []
+        except Exception as e:
+            _LOGGER.debug("Asset query failed: %s", e)
+        return None
+
+    async def _ensure_agent(self, session, base_url):
+        name = f"wizsmith-pi-{self.pi_id}"
+        # Query or create asset
+        headers = {"Authorization": f"Bearer {self.token}", "Content-Type": "application/json"}
+        assets = await self._query_assets(session, base_url, {"names": [name]})
+        if assets:
+            return assets[0].get("id")
         # fallback: create
-        create_url = f"{base_url.rstrip('/')}/api/master/asset"
+        create_url = self._api_url(base_url, "asset")
         payload = {
             "name": name,
             "description": "WizSmith auto-provisioned MQTTAgent for Pi",
@@ -108,17 +358,326 @@ class OpenRemoteClient:
 
     async def _create_child(self, session, base_url):
         headers = {"Authorization": f"Bearer {self.token}", "Content-Type": "application/json"}
-        child_payload = {"name": "HA Sensors", "parent": {"id": self.agent_id}}
-        create_url = f"{base_url.rstrip('/')}/api/master/asset"
+        # reuse an existing child so restarts do not pile up duplicate assets
+        existing = await self._query_assets(
+            session, base_url, {"parents": [{"id": self.agent_id}], "names": [CHILD_ASSET_NAME]}
+        )
+        if existing:
+            child = existing[0]
+            present = child.get("attributes") or {}
+            missing = [a for a in (SENSORS_ATTRIBUTE, COMMANDS_ATTRIBUTE) if a not in present]
+            return await self._create_attributes(session, base_url, child.get("id"), missing)
+        child_payload = {"name": CHILD_ASSET_NAME, "parent": {"id": self.agent_id}}
+        create_url = self._api_url(base_url, "asset")
         try:
             async with session.post(create_url, json=child_payload, headers=headers, timeout=10) as resp:
                 if resp.status in (200, 201):
                     res = await resp.json()
-                    child_id = res.get("id")
-                    attr_payload = {"name": "sensors_json", "type": "json", "writeable": True, "readable": True}
-                    attr_url = f"{base_url.rstrip('/')}/api/master/asset/{child_id}/attribute"
-                    async with session.post(attr_url, json=attr_payload, headers=headers, timeout=10):
-                        return {"child_id": child_id, "attribute": "sensors_json"}
+                    return await self._create_attributes(
+                        session, base_url, res.get("id"), [SENSORS_ATTRIBUTE, COMMANDS_ATTRIBUTE]
+                    )
         except Exception as e:
             _LOGGER.warning("Create child/attribute failed: %s", e)
         return None
+
+    async def _create_attributes(self, session, base_url, child_id, names):
+        headers = {"Authorization": f"Bearer {self.token}", "Content-Type": "application/json"}
+        attr_url = self._api_url(base_url, f"asset/{child_id}/attribute")
+        try:
+            for name in names:
+                attr_payload = {"name": name, "type": "json", "writeable": True, "readable": True}
+                async with session.post(attr_url, json=attr_payload, headers=headers, timeout=10):
+                    pass
+            return {"child_id": child_id, "attribute": SENSORS_ATTRIBUTE}
+        except Exception as e:
+            _LOGGER.warning("Create child/attribute failed: %s", e)
+        return None
+
+    def queue_attribute(self, asset_id, attribute, value):
+        """Queue an attribute write for the next bulk flush.
+
+        Must be called from the event loop. Writes to the same attribute
+        coalesce, so only the latest value is sent.
+        """
+        self._pending_attrs[(asset_id, attribute)] = value
+        if len(self._pending_attrs) >= self.batch_size:
+            self._schedule_flush(0)
+        elif self._flush_handle is None:
+            self._schedule_flush(self.batch_delay)
+
+    def queue_sensors_json(self, value):
+        """Queue a write of the hub's sensors_json attribute."""
+        if self.child_id and self.child_attr:
+            self.queue_attribute(self.child_id, self.child_attr, value)
+        elif self.buffer is not None:
+            # not provisioned yet: keep it on disk, the asset id is filled in on replay
+            line = encode_attribute_state(None, SENSORS_ATTRIBUTE, value)
+            self.hass.async_add_executor_job(self.buffer.append, line)
+
+    def _schedule_flush(self, delay):
+        if self._flush_handle:
+            self._flush_handle.cancel()
+        self._flush_handle = self.hass.loop.call_later(
+            delay, lambda: self.hass.async_create_task(self.async_flush_attributes())
+        )
+
+    async def async_flush_attributes(self):
+        """Send all pending attribute writes as bulk PUTs of at most batch_size states."""
+        async with self._flush_lock:
+            if self._flush_handle:
+                self._flush_handle.cancel()
+                self._flush_handle = None
+            while self._pending_attrs:
+                keys = list(self._pending_attrs)[:self.batch_size]
+                batch = {k: self._pending_attrs.pop(k) for k in keys}
+                # while a backlog is replayed, new writes go behind it so old values never win
+                if self.buffer is not None and not self.buffer.empty:
+                    await self.hass.async_add_executor_job(self._spool, batch)
+                    continue
+                if await self._put_attributes(batch):
+                    continue
+                if self.buffer is not None:
+                    await self.hass.async_add_executor_job(self._spool, batch)
+                    continue
+                # no disk buffer: keep the values for the next flush unless newer ones arrived meanwhile
+                for k, v in batch.items():
+                    self._pending_attrs.setdefault(k, v)
+                self._schedule_flush(self.batch_delay)
+                return
+
+    def _spool(self, batch):
+        self.metrics.inc("openremote_spooled", len(batch))
+        for (asset_id, attribute), value in batch.items():
+            self.buffer.append(encode_attribute_state(asset_id, attribute, value))
+
+    async def _replay_loop(self):
+        """Replay the on-disk backlogs in order, replay_batch_size records per replay_interval each."""
+        while True:
+            await asyncio.sleep(self.replay_interval)
+            try:
+                if self.buffer is not None and not self.buffer.empty:
+                    await self._replay_batch()
+                if self.command_buffer is not None and not self.command_buffer.empty:
+                    await self._replay_commands()
+            except Exception:
+                _LOGGER.exception("Error replaying buffered OpenRemote writes")
+
+    async def _replay_batch(self):
+        records = await self.hass.async_add_executor_job(self.buffer.read, self.replay_batch_size)
+        lines = []
+        position = None
+        for line, pos in records:
+            if line.startswith(b'{"ref":{"id":null'):
+                if not self.child_id:
+                    break
+                line = line.replace(b'{"ref":{"id":null', b'{"ref":{"id":' + dumps(self.child_id), 1)
+            lines.append(line)
+            position = pos
+        if not lines:
+            return
+        if await self._put_body(b"[" + b",".join(lines) + b"]", len(lines)):
+            await self.hass.async_add_executor_job(self.buffer.commit, position, len(lines))
+            self.metrics.inc("openremote_replayed", len(lines))
+            _LOGGER.info("Replayed %d buffered attribute writes to OpenRemote", len(lines))
+
+    async def _replay_commands(self):
+        records = await self.hass.async_add_executor_job(self.command_buffer.read, self.replay_batch_size)
+        position = None
+        count = 0
+        for line, pos in records:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                _LOGGER.warning("Skipping corrupt buffered command")
+                position = pos
+                continue
+            # stop at the first failure; committed commands are not resent
+            if not await self.async_post(COMMAND_PATH, record):
+                break
+            position = pos
+            count += 1
+        if position is not None:
+            await self.hass.async_add_executor_job(self.command_buffer.commit, position, count)
+        if count:
+            self.metrics.inc("openremote_commands_replayed", count)
+            _LOGGER.info("Replayed %d buffered commands to OpenRemote", count)
+
+    async def _put_attributes(self, batch):
+        # pre-serialized snapshots (RawJSON) are embedded without a second encode
+        return await self._put_body(encode_attribute_states(batch.items()), len(batch))
+
+    async def _put_body(self, body, count):
+        """PUT a serialized attribute state list; returns False if it should be retried."""
+        with self.metrics.time("openremote_write"):
+            ok = await self._put_body_request(body, count)
+        if ok:
+            self.metrics.inc("openremote_bytes", len(body))
+        else:
+            self.metrics.inc("openremote_errors")
+        return ok
+
+    async def _put_body_request(self, body, count):
+        url = self.cfg.get(CONF_OR_URL)
+        realm = self._realm()
+        session = self._get_session()
+        token = await self._get_token(session, url, realm)
+        if not token:
+            return False
+        self.token = token
+        headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+        put_url = self._api_url(url, "asset/attributes")
+        try:
+            async with session.put(put_url, data=body, headers=headers, timeout=10) as resp:
+                if resp.status == 401:
+                    self.tokens.invalidate()
+                if resp.status >= 300:
+                    _LOGGER.warning("Bulk attribute write failed %s: %s", resp.status, await resp.text())
+                    return not _should_retry(resp.status)
+                results = await resp.json(content_type=None)
+        except Exception as e:
+            _LOGGER.warning("Bulk attribute write failed: %s", e)
+            return False
+        failed = [r for r in results or [] if isinstance(r, dict) and r.get("failure")]
+        if failed:
+            _LOGGER.warning("%d of %d attribute writes rejected, e.g. %s", len(failed), count, failed[0])
+        _LOGGER.debug("Wrote %d attributes to OpenRemote in one request", count)
+        return True
+
+    async def async_post(self, path, body):
+        """POST JSON to ``/api/<realm>/<path>``; returns False if it should be retried later."""
+        url = self.cfg.get(CONF_OR_URL)
+        realm = self._realm()
+        session = self._get_session()
+        token = await self._get_token(session, url, realm)
+        if not token:
+            return False
+        headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+        post_url = self._api_url(url, path)
+        try:
+            async with session.post(post_url, json=body, headers=headers, timeout=10) as resp:
+                if resp.status == 401:
+                    self.tokens.invalidate()
+                if resp.status >= 300:
+                    _LOGGER.warning("OpenRemote POST %s failed %s: %s", path, resp.status, await resp.text())
+                    return not _should_retry(resp.status)
+                return True
+        except Exception as e:
+            _LOGGER.warning("OpenRemote POST %s failed: %s", path, e)
+            return False
+
+    async def async_forward_command(self, record):
+        """POST a command for OpenRemote, spooling it to disk while the manager is unreachable.
+
+        Returns False only if the command was neither delivered nor buffered.
+        """
+        line = dumps(record)
+        buffer = self.command_buffer
+        if buffer is not None and not buffer.empty:
+            # keep commands in order behind the backlog
+            await self.hass.async_add_executor_job(buffer.append, line)
+            return True
+        if await self.async_post(COMMAND_PATH, record):
+            return True
+        if buffer is None:
+            return False
+        await self.hass.async_add_executor_job(buffer.append, line)
+        self.metrics.inc("openremote_commands_spooled")
+        _LOGGER.info("Buffered command for %s until OpenRemote is reachable", record.get("device_id"))
+        return True
+
+    def subscribe_attribute_events(self, listener):
+        """Call ``listener(asset_id, attribute, value)`` for writes to the hub's commands attribute.
+
+        Must be called from the event loop. The first listener opens a
+        WebSocket subscription filtered to the child asset's commands
+        attribute once it is provisioned. Returns a callable that removes
+        the listener.
+        """
+        self._event_listeners.append(listener)
+        if self._event_task is None:
+            self._event_task = self.hass.async_create_background_task(
+                self._event_loop(), "wizsmith OpenRemote events"
+            )
+
+        def _remove():
+            if listener in self._event_listeners:
+                self._event_listeners.remove(listener)
+
+        return _remove
+
+    async def _event_loop(self):
+        """Keep one event subscription open, reconnecting and resubscribing with backoff."""
+        await self.ready.wait()
+        while True:
+            try:
+                await self._event_session()
+            except Exception as e:
+                _LOGGER.warning("OpenRemote event stream failed: %s", e)
+            finally:
+                self.events_connected = False
+            delay = self._events_backoff.next_delay()
+            self.metrics.inc("openremote_event_reconnects")
+            _LOGGER.debug("Reconnecting to OpenRemote events in %.1fs", delay)
+            await asyncio.sleep(delay)
+
+    async def _event_session(self):
+        url = self.cfg.get(CONF_OR_URL)
+        realm = self._realm()
+        session = self._get_session()
+        token = await self._get_token(session, url, realm)
+        if not token:
+            _LOGGER.warning("No OpenRemote token for the event stream")
+            return
+        ws_url = url.rstrip("/").replace("http", "ws", 1) + "/websocket/events"
+        params = {"Realm": realm, "Authorization": f"Bearer {token}"}
+        async with session.ws_connect(ws_url, params=params, heartbeat=EVENTS_HEARTBEAT) as ws:
+            # ids can change when setup re-provisions, so the filter is rebuilt on every connect
+            asset_ids = [self.child_id]
+            await ws.send_str("EVENT-SUBSCRIBE:" + json.dumps({
+                "eventType": "attribute",
+                "subscriptionId": f"wizsmith-{self.pi_id}",
+                "filter": {"filterType": "asset", "assetIds": asset_ids, "attributeNames": [COMMANDS_ATTRIBUTE]},
+            }))
+            async for msg in ws:
+                if msg.type != aiohttp.WSMsgType.TEXT:
+                    if msg.type == aiohttp.WSMsgType.ERROR:
+                        raise ws.exception() or ConnectionError("websocket error")
+                    continue
+                prefix, _, data = msg.data.partition(":")
+                if prefix == "EVENT-SUBSCRIBED":
+                    self.events_connected = True
+                    self._events_backoff.reset()
+                    _LOGGER.info("Subscribed to OpenRemote attribute events for %s", asset_ids)
+                elif prefix == "EVENT-SUBSCRIPTION-FAILED":
+                    _LOGGER.warning("OpenRemote event subscription rejected: %s", data)
+                    return
+                elif prefix == "TRIGGERED":
+                    # {"subscriptionId": ..., "events": [...]}, how the manager delivers subscribed events
+                    for event in json.loads(data).get("events") or ():
+                        self._dispatch_event(event)
+                elif prefix == "EVENT":
+                    self._dispatch_event(json.loads(data))
+                elif prefix == "EVENTS":
+                    for event in json.loads(data):
+                        self._dispatch_event(event)
+        _LOGGER.info("OpenRemote event stream closed")
+
+    def _dispatch_event(self, event):
+        if event.get("eventType", "attribute") != "attribute":
+            return
+        # newer managers put ref/value on the event, older ones nest an attributeState
+        state = event.get("attributeState") or event
+        ref = state.get("ref") or state.get("attributeRef") or {}
+        asset_id = ref.get("id") or ref.get("assetId")
+        attribute = ref.get("name") or ref.get("attributeName")
+        if asset_id != self.child_id or attribute != COMMANDS_ATTRIBUTE:
+            return  # our own snapshot writes echoed back, or a filter the manager ignored
+        self.metrics.inc("openremote_events")
+        timestamp = event.get("timestamp")
+        if timestamp:
+            self.metrics.observe("openremote_event_latency", max(0.0, time.time() - timestamp / 1000))
+        for listener in list(self._event_listeners):
+            try:
+                listener(asset_id, attribute, state.get("value"))
+            except Exception:
+                _LOGGER.exception("Error handling OpenRemote event for %s.%s", asset_id, attribute)
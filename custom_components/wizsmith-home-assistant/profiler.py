@@ -0,0 +1,59 @@
+"""Opt-in sampling profiler for a single publish cycle.
+
+A background thread samples the stack of one target thread (the event loop
+or an agent worker) at a fixed interval. Output is in the collapsed-stack
+format ("frame;frame;frame count"), which flamegraph.pl and speedscope read.
+"""
+
+import collections
+import sys
+import threading
+from typing import Counter, List, Optional, Tuple
+
+
+class SamplingProfiler:
+    """Sample ``thread_id``'s stack every ``interval`` seconds between start() and stop()."""
+
+    def __init__(self, thread_id: Optional[int] = None, interval: float = 0.002, max_depth: int = 64):
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples: Counter[Tuple[str, ...]] = collections.Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="wizsmith-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[tuple(reversed(stack))] += 1
+
+    @property
+    def total(self) -> int:
+        return sum(self.samples.values())
+
+    def collapsed(self) -> str:
+        return "\n".join(f"{';'.join(stack)} {n}" for stack, n in self.samples.most_common()) + "\n"
+
+    def top(self, n: int = 10) -> List[Tuple[str, int]]:
+        """Leaf frames with the most samples."""
+        leaves: Counter[str] = collections.Counter()
+        for stack, count in self.samples.items():
+            leaves[stack[-1]] += count
+        return leaves.most_common(n)
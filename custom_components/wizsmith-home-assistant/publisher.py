@@ -0,0 +1,478 @@
+"""One publishing core per hub, fanned out to every configured destination.
+
+The first config entry to load creates the HubPublisher: it owns the delta
+cache, rate limiter, push listener and timer, collects and serializes each
+snapshot once, and hands the result to every sink. Entries only add their
+destinations (Home Assistant's MQTT, a broker of their own, an OpenRemote
+realm) as sinks. Each sink has its own queue and worker, so a slow or
+unreachable destination only delays itself; batches that pile up behind it
+merge into one, latest state winning.
+"""
+
+from __future__ import annotations
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Callable, Dict, Optional, Set, Tuple
+
+from homeassistant.components import mqtt as ha_mqtt
+from homeassistant.core import HomeAssistant, callback
+
+from .const import *
+from .delta_cache import DeltaCache
+from .metrics import Metrics
+from .rate_limiter import RateLimiter, parse_rates
+from .snapshot import dumps, encode_snapshot
+from .state_registry import StateRegistry
+from .state_listener import CoalescedFlush, EntityFilter, StatePushListener
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class Batch:
+    """Changed states of one publish pass, serialized once for every sink.
+
+    ``snapshot`` is None on passes that only carry per-entity deltas.
+    """
+
+    __slots__ = ("changed", "messages", "snapshot", "full")
+
+    def __init__(self, changed: Dict[str, Any], messages: Dict[str, bytes], snapshot, full: bool):
+        self.changed = changed
+        # per-entity state topic -> payload
+        self.messages = messages
+        self.snapshot = snapshot
+        self.full = full
+
+    def merge(self, newer: "Batch") -> "Batch":
+        """Fold ``newer`` into this batch for a sink that has not sent it yet."""
+        return Batch(
+            {**self.changed, **newer.changed},
+            {**self.messages, **newer.messages},
+            newer.snapshot if newer.snapshot is not None else self.snapshot,
+            self.full or newer.full,
+        )
+
+
+class Sink:
+    """A destination with its own pending batch and worker task."""
+
+    def __init__(self, hass: HomeAssistant, key: str):
+        self.hass = hass
+        self.key = key
+        self.metrics: Optional[Metrics] = None
+        self._pending: Optional[Batch] = None
+        self._wake = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._task = None
+        self.sent = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    def start(self, metrics: Metrics) -> None:
+        self.metrics = metrics
+        self._task = self.hass.async_create_background_task(self._run(), f"{DOMAIN} {self.key} sink")
+
+    async def async_stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def put(self, batch: Batch) -> None:
+        if self._pending is None:
+            self._pending = batch
+        else:
+            self._pending = self._pending.merge(batch)
+            self.coalesced += 1
+        self._idle.clear()
+        self._wake.set()
+
+    async def async_drain(self) -> None:
+        """Wait until everything queued so far has been sent."""
+        await self._idle.wait()
+
+    async def _run(self) -> None:
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            batch, self._pending = self._pending, None
+            if batch is not None:
+                try:
+                    await self.async_send(batch)
+                    self.sent += 1
+                except Exception:
+                    self.errors += 1
+                    self.metrics.inc("sink_errors")
+                    _LOGGER.exception("Error publishing to %s", self.key)
+            if self._pending is None:
+                self._idle.set()
+
+    async def async_send(self, batch: Batch) -> None:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        return {"sent": self.sent, "coalesced": self.coalesced, "errors": self.errors,
+                "pending": self._pending is not None}
+
+
+class MqttSink(Sink):
+    """Per-entity state topics plus the hub snapshot through Home Assistant's MQTT integration.
+
+    With a compact ``encoder`` only the snapshot topic is sent, carrying just
+    the changed states; the encoder keeps per-stream state, so every sink has
+    its own.
+    """
+
+    def __init__(self, hass: HomeAssistant, key: str, pi_id: str, encoder=None):
+        super().__init__(hass, key)
+        self.snapshot_topic = f"wizsmith/{pi_id}/sensors"
+        self.encoder = encoder
+
+    async def async_publish(self, topic: str, payload) -> None:
+        await ha_mqtt.async_publish(self.hass, topic, payload)
+
+    async def async_send(self, batch: Batch) -> None:
+        if self.encoder is not None:
+            # compact snapshots are deltas already; per-entity JSON would resend every change
+            messages = []
+            if batch.changed or batch.full:
+                messages.append((self.snapshot_topic, self.encoder.encode(batch.changed, full=batch.full)))
+        else:
+            messages = list(batch.messages.items())
+            if batch.snapshot is not None:
+                messages.append((self.snapshot_topic, batch.snapshot))
+        with self.metrics.time("mqtt_publish"):
+            for topic, payload in messages:
+                await self.async_publish(topic, payload)
+        self.metrics.inc("mqtt_messages", len(messages))
+        self.metrics.inc("mqtt_bytes", sum(len(m) for _, m in messages))
+
+
+class BrokerSink(MqttSink):
+    """MqttSink on a dedicated paho connection to a broker other than Home Assistant's."""
+
+    def __init__(self, hass: HomeAssistant, key: str, pi_id: str, cfg: Dict[str, Any], encoder=None):
+        super().__init__(hass, key, pi_id, encoder)
+        self.cfg = cfg
+        self._client = None
+
+    def start(self, metrics: Metrics) -> None:
+        # paho ships with Home Assistant's MQTT integration
+        import paho.mqtt.client as mqtt
+
+        client_id = f"wizsmith-{self.snapshot_topic.split('/')[1][:8]}-{id(self):x}"
+        if hasattr(mqtt, "CallbackAPIVersion"):
+            self._client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, client_id=client_id)
+        else:
+            self._client = mqtt.Client(client_id=client_id)
+        if self.cfg.get(CONF_MQTT_USER):
+            self._client.username_pw_set(self.cfg.get(CONF_MQTT_USER), self.cfg.get(CONF_MQTT_PASS) or None)
+        self._client.connect_async(self.cfg[CONF_MQTT_HOST], int(self.cfg.get(CONF_MQTT_PORT, DEFAULT_MQTT_PORT)))
+        # paho's network thread reconnects on its own
+        self._client.loop_start()
+        super().start(metrics)
+
+    async def async_stop(self) -> None:
+        await super().async_stop()
+        if self._client is not None:
+            client, self._client = self._client, None
+            await self.hass.async_add_executor_job(_stop_paho, client)
+
+    async def async_publish(self, topic: str, payload) -> None:
+        # only queues the message for paho's network thread
+        self._client.publish(topic, payload)
+
+
+def _stop_paho(client) -> None:
+    client.disconnect()
+    client.loop_stop()
+
+
+class OpenRemoteSink(Sink):
+    """The hub snapshot as an OpenRemote realm's sensors_json attribute.
+
+    The sink owns its client and the command handler using it: entries for
+    the same realm share all three, and the client is closed with the sink
+    once the last of those entries unloads.
+    """
+
+    def __init__(self, hass: HomeAssistant, key: str, or_client, command_handler=None):
+        super().__init__(hass, key)
+        self.or_client = or_client
+        self.command_handler = command_handler
+        self._setup_task = None
+
+    def start(self, metrics: Metrics) -> None:
+        super().start(metrics)
+        # its timings and counters land next to the hub's publish metrics
+        self.or_client.metrics = metrics
+        # auth + ensure assets in the background; or_client.ready is set once provisioned
+        self._setup_task = self.hass.async_create_background_task(
+            self.or_client.setup(), f"{DOMAIN} OpenRemote provisioning"
+        )
+        if self.command_handler is not None:
+            self.hass.async_create_background_task(self.command_handler.async_start(), f"{DOMAIN} command subscription")
+
+    async def async_stop(self) -> None:
+        await super().async_stop()
+        if self._setup_task is not None:
+            self._setup_task.cancel()
+            self._setup_task = None
+        if self.command_handler is not None:
+            self.command_handler.async_stop()
+        await self.or_client.async_close()
+
+    async def async_send(self, batch: Batch) -> None:
+        # the client batches and retries the attribute write itself
+        if batch.snapshot is not None:
+            self.or_client.queue_sensors_json(batch.snapshot)
+
+    async def async_drain(self) -> None:
+        await super().async_drain()
+        await self.or_client.async_flush_attributes()
+
+
+class HubPublisher:
+    """Collect, filter and serialize hub states once per pass and fan them out to sinks.
+
+    Publishing settings (filters, deadbands, rate limits, push mode and
+    intervals) come from the entry that created the hub, and are re-read
+    when that entry reloads; later entries only add sinks. The hub stops
+    when its last entry is removed.
+    """
+
+    def __init__(self, hass: HomeAssistant, cfg: Dict[str, Any], pi_id: str, entry_id: str):
+        self.hass = hass
+        self.pi_id = pi_id
+        self.entry_id = entry_id
+        self.metrics = Metrics()
+        # one interned id and slot per entity, shared by the delta cache and rate limiter
+        self.registry = StateRegistry()
+        self._sinks: Dict[str, Sink] = {}
+        self._owners: Dict[str, Set[str]] = {}
+        # extra status topics: name -> (entry id, stats callable), e.g. local command handling
+        self._status_sources: Dict[str, Tuple[str, Callable[[], dict]]] = {}
+        self._push_listener = None
+        self._task = None
+        # trailing snapshot for push passes that skipped it
+        self._snapshot_handle = None
+        self._configure(cfg)
+
+    def _configure(self, cfg: Dict[str, Any]) -> None:
+        self.entity_filter = EntityFilter.from_config(cfg)
+        self.delta = DeltaCache(
+            deadbands=cfg.get(CONF_DELTA_DEADBANDS),
+            full_refresh_interval=int(cfg.get(CONF_FULL_REFRESH_INTERVAL, DEFAULT_FULL_REFRESH_INTERVAL)),
+            registry=self.registry,
+        )
+        # token bucket per entity so chatty meters cannot flood any destination
+        try:
+            rates = parse_rates(cfg.get(CONF_RATE_LIMITS, DEFAULT_RATE_LIMITS))
+        except ValueError as e:
+            _LOGGER.warning("Ignoring invalid rate limits: %s", e)
+            rates = dict(DEFAULT_RATE_LIMITS)
+        self.limiter = RateLimiter(
+            rates, float(cfg.get(CONF_RATE_LIMIT_BURST, DEFAULT_RATE_LIMIT_BURST)), registry=self.registry
+        )
+        # throttled entities go out with their latest state once their bucket refills
+        self.coalesced = CoalescedFlush(self.hass, self.limiter, self._async_publish_changed)
+        self.push_mode = bool(cfg.get(CONF_PUSH_MODE, DEFAULT_PUSH_MODE))
+        self.push_debounce = float(cfg.get(CONF_PUSH_DEBOUNCE, DEFAULT_PUSH_DEBOUNCE))
+        if self.push_mode:
+            # the timer is only a safety heartbeat in push mode
+            self.interval = int(cfg.get(CONF_HEARTBEAT_INTERVAL, DEFAULT_HEARTBEAT_INTERVAL))
+        else:
+            self.interval = int(cfg.get(CONF_SYNC_INTERVAL, DEFAULT_SYNC_INTERVAL))
+        self.snapshot_interval = float(cfg.get(CONF_SNAPSHOT_INTERVAL, DEFAULT_SNAPSHOT_INTERVAL))
+        self._snapshot_at = 0.0
+
+    def async_start(self) -> None:
+        if self.push_mode:
+            self._push_listener = StatePushListener(
+                self.hass, self.entity_filter, self._async_publish_changed, self.push_debounce
+            )
+            self._push_listener.async_start()
+        self._task = self.hass.async_create_background_task(self._publish_loop(), f"{DOMAIN} publish loop")
+
+    def async_reconfigure(self, cfg: Dict[str, Any], entry_id: str) -> None:
+        """Take publishing settings from ``entry_id``'s ``cfg``, keeping sinks and per-entity state."""
+        running = self._task is not None
+        self._stop_publishing()
+        self.entry_id = entry_id
+        self._configure(cfg)
+        if running:
+            self.async_start()
+
+    def _stop_publishing(self) -> None:
+        if self._push_listener is not None:
+            self._push_listener.async_stop()
+            self._push_listener = None
+        self.coalesced.async_stop()
+        if self._snapshot_handle is not None:
+            self._snapshot_handle.cancel()
+            self._snapshot_handle = None
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def async_stop(self) -> None:
+        self._stop_publishing()
+        for sink in self._sinks.values():
+            await sink.async_stop()
+        self._sinks.clear()
+        self._owners.clear()
+
+    def sink(self, key: str) -> Optional[Sink]:
+        return self._sinks.get(key)
+
+    def has_entry(self, entry_id: str) -> bool:
+        return any(entry_id in owners for owners in self._owners.values())
+
+    def add_sink(self, entry_id: str, sink: Sink) -> Sink:
+        """Attach ``sink`` for ``entry_id``; an equal destination already attached is shared instead."""
+        existing = self._sinks.get(sink.key)
+        self._owners.setdefault(sink.key, set()).add(entry_id)
+        if existing is not None:
+            _LOGGER.debug("Sharing %s with another entry", sink.key)
+            return existing
+        self._sinks[sink.key] = sink
+        sink.start(self.metrics)
+        if self._task is not None:
+            # a destination added to a running hub starts from a full snapshot
+            self.hass.async_create_task(self.async_publish(full=True))
+        return sink
+
+    def add_status_source(self, owner: str, name: str, source: Callable[[], dict]) -> None:
+        """Publish ``source()`` on ``wizsmith/status/<name>`` every cycle while ``owner`` is loaded.
+
+        ``owner`` is an entry id or a sink key.
+        """
+        self._status_sources[name] = (owner, source)
+
+    def has_status_source(self, name: str) -> bool:
+        return name in self._status_sources
+
+    async def async_remove_entry(self, entry_id: str) -> bool:
+        """Detach ``entry_id``'s sinks; True once no entry is left."""
+        gone = {entry_id}
+        for key in [k for k, owners in self._owners.items() if entry_id in owners]:
+            owners = self._owners[key]
+            owners.discard(entry_id)
+            if not owners:
+                del self._owners[key]
+                await self._sinks.pop(key).async_stop()
+                gone.add(key)
+        for name in [n for n, (owner, _) in self._status_sources.items() if owner in gone]:
+            del self._status_sources[name]
+        return not self._owners
+
+    async def async_drain(self) -> None:
+        """Wait for every sink to send what is queued."""
+        await asyncio.gather(*(sink.async_drain() for sink in list(self._sinks.values())))
+
+    async def _async_publish_changed(self, entity_ids) -> None:
+        await self.async_publish(entity_ids=entity_ids)
+        self.coalesced.async_schedule()
+
+    async def async_publish(self, entity_ids=None, full=False) -> None:
+        """Run one pass and queue its batch on every sink.
+
+        One pass over the state machine (or just ``entity_ids`` for push
+        updates) feeds the delta cache and rate limiter; changed entities
+        are serialized once. Timer passes also carry the hub snapshot; push
+        passes add it at most every ``snapshot_interval`` seconds and leave
+        a trailing one armed otherwise. ``full`` republishes everything
+        regardless of the delta cache.
+        """
+        metrics = self.metrics
+        start = time.perf_counter()
+        delta, limiter = self.delta, self.limiter
+        full_refresh = entity_ids is None and (full or delta.full_refresh_due())
+        if entity_ids is None:
+            states = self.hass.states.async_all()
+        else:
+            states = []
+            for entity_id in entity_ids:
+                state = self.hass.states.get(entity_id)
+                if state is None:
+                    # clears the entity for the rate limiter too
+                    delta.forget(entity_id)
+                else:
+                    states.append(state)
+
+        changed = {}
+        seen = set()
+        for state in states:
+            entity_id = state.entity_id
+            if not self.entity_filter(entity_id):
+                continue
+            seen.add(entity_id)
+            if delta.should_publish(entity_id, state.state, state.attributes.get("device_class"),
+                                    force=full_refresh, limiter=limiter):
+                changed[entity_id] = state.state
+        if entity_ids is None:
+            # drop entities that disappeared from Home Assistant (registry-wide)
+            delta.prune(seen)
+        metrics.observe("snapshot", time.perf_counter() - start)
+        if not changed:
+            metrics.observe("cycle", time.perf_counter() - start)
+            return
+
+        with metrics.time("serialize"):
+            messages = {f"wizsmith/{entity_id}/state": dumps({"state": value}) for entity_id, value in changed.items()}
+            if entity_ids is None or time.monotonic() - self._snapshot_at >= self.snapshot_interval:
+                payload = self._encode_snapshot()
+            else:
+                payload = None
+                self._schedule_snapshot()
+        batch = Batch(changed, messages, payload, full_refresh)
+        for sink in self._sinks.values():
+            sink.put(batch)
+        metrics.observe("cycle", time.perf_counter() - start)
+        _LOGGER.debug("Queued %d changed entities for %d sinks, snapshot %s bytes",
+                      len(changed), len(self._sinks), len(payload) if payload is not None else "no")
+
+    def _encode_snapshot(self) -> bytes:
+        if self._snapshot_handle is not None:
+            self._snapshot_handle.cancel()
+            self._snapshot_handle = None
+        self._snapshot_at = time.monotonic()
+        return encode_snapshot(self.pi_id, self.delta.snapshot())
+
+    @callback
+    def _schedule_snapshot(self) -> None:
+        if self._snapshot_handle is None:
+            delay = max(0.0, self._snapshot_at + self.snapshot_interval - time.monotonic())
+            self._snapshot_handle = self.hass.loop.call_later(delay, self._publish_snapshot)
+
+    @callback
+    def _publish_snapshot(self) -> None:
+        self._snapshot_handle = None
+        with self.metrics.time("serialize"):
+            batch = Batch({}, {}, self._encode_snapshot(), False)
+        for sink in self._sinks.values():
+            sink.put(batch)
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(
+            self.delta.stats(),
+            rate_limit=self.limiter.stats(),
+            registry=self.registry.stats(),
+            sinks={key: sink.stats() for key, sink in self._sinks.items()},
+        )
+
+    async def _publish_loop(self) -> None:
+        while True:
+            try:
+                await self.async_publish()
+                self.coalesced.async_schedule()
+                await ha_mqtt.async_publish(self.hass, f"{TOPIC_STATUS}/publish", json.dumps(self.stats()))
+                await ha_mqtt.async_publish(self.hass, f"{TOPIC_STATUS}/metrics", json.dumps(self.metrics.snapshot()))
+                for name, (_, source) in list(self._status_sources.items()):
+                    await ha_mqtt.async_publish(self.hass, f"{TOPIC_STATUS}/{name}", json.dumps(source()))
+            except Exception as e:
+                self.metrics.inc("cycle_errors")
+                _LOGGER.exception("Error in publish loop: %s", e)
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,146 @@
+"""Per-entity publish rate limiting.
+
+Shared by the integration and the add-on agent: every entity gets a token
+bucket whose rate comes from its device class or domain, so one chatty
+power meter cannot flood the broker or OpenRemote. Updates that arrive
+with an empty bucket are not dropped but coalesced: the entity is marked
+pending and its latest state goes out once a token is available again.
+"""
+
+import json
+import math
+import time
+from typing import Any, Dict, List, Optional, Set
+
+try:
+    from .state_registry import StateRegistry
+except ImportError:
+    # loaded as a top-level module by the add-on agent (main.py)
+    from state_registry import StateRegistry
+
+# Updates per second allowed for each device class / domain, and bucket size
+DEFAULT_RATE_LIMITS = {"power": 1.0, "energy": 1.0}
+DEFAULT_BURST = 2.0
+
+
+def parse_rates(value: Any) -> Dict[str, float]:
+    """Accept a mapping, a JSON object or a "power=1, sensor=0.5" string (options.json / options flow)."""
+    if not value:
+        return {}
+    if isinstance(value, str) and value.lstrip().startswith("{"):
+        value = json.loads(value)
+    if isinstance(value, str):
+        items = []
+        for part in value.split(","):
+            key, sep, rate = part.partition("=")
+            if not sep or not key.strip():
+                raise ValueError(f"bad rate limit {part.strip()!r}, expected key=updates_per_second")
+            items.append((key.strip(), rate))
+    else:
+        items = dict(value).items()
+    return {key: float(rate) for key, rate in items}
+
+
+def format_rates(rates: Dict[str, float]) -> str:
+    return ", ".join(f"{key}={rate:g}" for key, rate in rates.items())
+
+
+class RateLimiter:
+    """Token bucket per entity id, keyed by device class first and domain second.
+
+    A rate of 0 (or no matching class/domain) leaves an entity unlimited.
+    Buckets are columns of a StateRegistry (shared with the delta cache when
+    both get the same ``registry``): tokens as doubles, refill and due times
+    as integer milliseconds.
+    """
+
+    def __init__(self, rates: Optional[Dict[str, float]] = None, burst: float = DEFAULT_BURST,
+                 registry: Optional[StateRegistry] = None):
+        self.rates = {key: rate for key, rate in (rates or {}).items() if rate > 0}
+        self.burst = max(1.0, float(burst))
+        self.registry = registry if registry is not None else StateRegistry()
+        # NaN until the entity's first update
+        self._tokens = self.registry.column("limiter.tokens", "d", math.nan)
+        self._refilled_ms = self.registry.column("limiter.refilled_ms", "q", 0)
+        # when the next token is available; 0 when nothing is pending
+        self._due_ms = self.registry.column("limiter.due_ms", "q", 0)
+        # slots with a due time (may include slots cleared by the registry since)
+        self._pending: Set[int] = set()
+        self._lock = self.registry.lock
+        self.allowed = 0
+        self.throttled = 0
+
+    def rate_for(self, entity_id: str, device_class: Optional[str] = None,
+                 domain: Optional[str] = None) -> Optional[float]:
+        if device_class and device_class in self.rates:
+            return self.rates[device_class]
+        if domain is None:
+            domain = entity_id.split(".", 1)[0] if "." in entity_id else None
+        return self.rates.get(domain) if domain else None
+
+    def allow(self, entity_id: str, device_class: Optional[str] = None, domain: Optional[str] = None) -> bool:
+        """Take a token for ``entity_id``; False marks it pending until the bucket refills."""
+        rate = self.rate_for(entity_id, device_class, domain) if self.rates else None
+        if rate is None:
+            return True
+        now = _now_ms()
+        with self._lock:
+            slot = self.registry.slot(entity_id)
+            tokens = self._tokens[slot]
+            if tokens != tokens:  # NaN: first update starts with a full bucket
+                tokens = self.burst
+            else:
+                tokens = min(self.burst, tokens + (now - self._refilled_ms[slot]) * rate / 1000)
+            self._refilled_ms[slot] = now
+            if tokens >= 1.0:
+                self._tokens[slot] = tokens - 1.0
+                self._due_ms[slot] = 0
+                self._pending.discard(slot)
+                self.allowed += 1
+                return True
+            self._tokens[slot] = tokens
+            self._due_ms[slot] = now + math.ceil((1.0 - tokens) * 1000 / rate)
+            self._pending.add(slot)
+            self.throttled += 1
+            return False
+
+    def next_due(self, entity_id: Optional[str] = None) -> Optional[float]:
+        """Seconds until the earliest pending entity (or ``entity_id``) may publish; None if none is pending."""
+        with self._lock:
+            if entity_id is not None:
+                slot = self.registry.find(entity_id)
+                due = self._due_ms[slot] if slot is not None else 0
+            else:
+                due = min((self._due_ms[s] for s in self._pending if self._due_ms[s]), default=0)
+            return None if not due else max(0.0, (due - _now_ms()) / 1000)
+
+    def pop_due(self) -> List[str]:
+        """Entity ids whose coalesced update can go out now."""
+        now = _now_ms()
+        due = []
+        with self._lock:
+            for slot in list(self._pending):
+                at = self._due_ms[slot]
+                if at <= now:
+                    self._pending.discard(slot)
+                    if at:
+                        self._due_ms[slot] = 0
+                        due.append(self.registry.entity_id(slot))
+            return due
+
+    def forget(self, entity_id: str) -> None:
+        """Drop ``entity_id``; with a shared registry this clears it for every consumer."""
+        self.registry.discard(entity_id)
+
+    def prune(self, keep) -> None:
+        """Drop buckets for every entity id not in ``keep``."""
+        self.registry.prune(keep)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            pending = sum(1 for slot in self._pending if self._due_ms[slot])
+            return {"allowed": self.allowed, "throttled": self.throttled, "pending": pending}
+
+
+def _now_ms() -> int:
+    return int(time.monotonic() * 1000)
@@ -1,33 +1,45 @@
 """WizSmith Home Integration Sensors with MQTT publishing and debugging."""
 
 import logging
-import json
-from homeassistant.components.sensor import SensorEntity
+from homeassistant.components import mqtt as ha_mqtt
+from homeassistant.components.sensor import SensorEntity, SensorStateClass
 from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import EntityCategory, UnitOfInformation, UnitOfTime
 from homeassistant.core import HomeAssistant
 from homeassistant.helpers.entity import DeviceInfo
-from homeassistant.helpers import mqtt as hass_mqtt
+
+from .const import DOMAIN
+from .snapshot import dumps
 
 _LOGGER = logging.getLogger(__name__)
 
-DOMAIN = "wizsmith_home_integration"
+# publish-path stages and counters exposed as diagnostic sensors
+METRIC_STAGES = ("cycle", "snapshot", "serialize", "mqtt_publish", "openremote_write", "openremote_event_latency")
+METRIC_COUNTERS = ("mqtt_bytes", "openremote_bytes", "openremote_errors", "cycle_errors", "setup_retries",
+                   "sink_errors")
 
-async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry, async_add_entities):
-    mqtt = hass.components.mqtt
 
-    devices = hass.data[DOMAIN][entry.entry_id]["devices"]
+async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry, async_add_entities):
+    data = hass.data[DOMAIN][entry.entry_id]
     entities = []
 
-    for dev in devices:
-        entities.append(WizSmithStateSensor(hass, mqtt, dev))
+    hub = data["hub"]
+    for dev in data.get("devices", []):
+        entities.append(WizSmithStateSensor(hass, dev))
+
+    # one set of diagnostics per hub, owned by the entry that created it
+    if hub.entry_id == entry.entry_id:
+        for stage in METRIC_STAGES:
+            entities.append(WizSmithStageSensor(hub.pi_id, hub.metrics, stage))
+        for counter in METRIC_COUNTERS:
+            entities.append(WizSmithCounterSensor(hub.pi_id, hub.metrics, counter))
 
     async_add_entities(entities)
 
 
 class WizSmithStateSensor(SensorEntity):
-    def __init__(self, hass, mqtt, device):
+    def __init__(self, hass, device):
         self.hass = hass
-        self._mqtt = mqtt
         self._device = device
         self._state = None
         self._attr_name = f"WizSmith {device['id']} State"
@@ -49,7 +61,57 @@ class WizSmithStateSensor(SensorEntity):
 
     async def _publish_state(self):
         topic = f"wizsmith/{self._device['id']}/state"
-        payload = json.dumps({"state": self._state})
+        payload = dumps({"state": self._state})
 
         _LOGGER.debug("Publishing MQTT state to %s: %s", topic, payload)
-        self._mqtt.async_publish(topic, payload, qos=0, retain=False)
+        await ha_mqtt.async_publish(self.hass, topic, payload, qos=0, retain=False)
+
+
+class _WizSmithMetricSensor(SensorEntity):
+    """Diagnostic sensor polled from the hub's publish-path metrics."""
+
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+
+    def __init__(self, pi_id, metrics, name):
+        self._metrics = metrics
+        self._name = name
+        self._attr_unique_id = f"wizsmith_{pi_id}_{name}"
+        self._attr_device_info = DeviceInfo(
+            identifiers={(DOMAIN, pi_id)},
+            name=f"WizSmith Hub {pi_id[:8]}",
+            manufacturer="WizSmith",
+        )
+
+
+class WizSmithStageSensor(_WizSmithMetricSensor):
+    """p99 duration of one publish stage; the full summary is in the attributes."""
+
+    _attr_native_unit_of_measurement = UnitOfTime.MILLISECONDS
+    _attr_state_class = SensorStateClass.MEASUREMENT
+
+    def __init__(self, pi_id, metrics, stage):
+        super().__init__(pi_id, metrics, f"{stage}_p99")
+        self._stage = stage
+        self._attr_name = f"WizSmith {stage.replace('_', ' ')} p99"
+
+    @property
+    def native_value(self):
+        return self._metrics.stage(self._stage)["p99_ms"]
+
+    @property
+    def extra_state_attributes(self):
+        return self._metrics.stage(self._stage)
+
+
+class WizSmithCounterSensor(_WizSmithMetricSensor):
+    _attr_state_class = SensorStateClass.TOTAL_INCREASING
+
+    def __init__(self, pi_id, metrics, counter):
+        super().__init__(pi_id, metrics, counter)
+        self._attr_name = f"WizSmith {counter.replace('_', ' ')}"
+        if counter.endswith("_bytes"):
+            self._attr_native_unit_of_measurement = UnitOfInformation.BYTES
+
+    @property
+    def native_value(self):
+        return self._metrics.counter(self._name)
@@ -0,0 +1,177 @@
+"""Snapshot serialization shared by the integration, the agent and the benchmarks.
+
+Uses orjson when it is installed (Home Assistant always ships it) and falls
+back to the standard library otherwise. Everything returns bytes so a
+snapshot serialized once can be sent to MQTT and OpenRemote as-is.
+
+The optional compact MQTT encoding sends dictionary-coded deltas as
+MessagePack (JSON if msgpack is not installed), zlib-compressed above a
+size threshold. Each payload is framed with its content type, so decoders
+accept compact and plain JSON snapshots on the same topic.
+"""
+
+import json
+import random
+import time
+import zlib
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - depends on the environment
+    msgpack = None
+
+CONTENT_TYPE_JSON = "application/json"
+CONTENT_TYPE_MSGPACK = "application/msgpack"
+# appended to the content type when the body is zlib-compressed
+ZLIB_SUFFIX = "+zlib"
+
+ENCODING_JSON = "json"
+ENCODING_MSGPACK = "msgpack"
+ENCODINGS = (ENCODING_JSON, ENCODING_MSGPACK)
+DEFAULT_COMPRESS_MIN_BYTES = 1024
+
+
+def dumps(obj: Any) -> bytes:
+    """Serialize ``obj`` to compact JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=str)
+    return json.dumps(obj, separators=(",", ":"), default=str).encode("utf-8")
+
+
+class RawJSON(bytes):
+    """Already serialized JSON that encoders embed verbatim."""
+
+
+def encode_snapshot(pi_id: str, states: Dict[str, Any]) -> RawJSON:
+    """Serialize a hub snapshot ``{"pi_id", "ts", "states": {entity_id: state}}`` in one call."""
+    return RawJSON(dumps({"pi_id": pi_id, "ts": int(time.time()), "states": states}))
+
+
+def encode_attribute_state(asset_id: str, attribute: str, value: Any) -> bytes:
+    """Serialize one OpenRemote attribute state, embedding RawJSON values without re-encoding."""
+    ref = dumps({"id": asset_id, "name": attribute})
+    val = value if isinstance(value, RawJSON) else dumps(value)
+    return b'{"ref":' + ref + b',"value":' + val + b"}"
+
+
+def encode_attribute_states(items: Iterable[Tuple[Tuple[str, str], Any]]) -> bytes:
+    """Build an OpenRemote attribute state list."""
+    return b"[" + b",".join(encode_attribute_state(a, n, v) for (a, n), v in items) + b"]"
+
+
+def frame(content_type: str, body: bytes) -> bytes:
+    """Prefix ``body`` with its content type: one length byte, then the ASCII type."""
+    ct = content_type.encode("ascii")
+    # a plain JSON object starts with "{" (123), which a length byte never reaches
+    if len(ct) >= ord("{"):
+        raise ValueError(f"Content type too long: {content_type}")
+    return bytes((len(ct),)) + ct + body
+
+
+def unframe(data: bytes) -> Tuple[str, bytes]:
+    """Split a payload into (content type, body); unframed payloads are plain JSON."""
+    if not data or data[:1] == b"{" or data[0] >= ord("{"):
+        return CONTENT_TYPE_JSON, data
+    n = data[0]
+    return data[1:1 + n].decode("ascii"), data[1 + n:]
+
+
+class CompactSnapshotEncoder:
+    """Encode changed states as dictionary-coded deltas for one hub.
+
+    Entity ids get small integer codes; a delta carries only the codes and
+    values that changed plus any codes that are new since the last payload.
+    Full snapshots carry the whole dictionary and replace the decoder's
+    state; the first payload is always full, and the random epoch tells
+    decoders that a restarted publisher's codes are unrelated to the old ones.
+    """
+
+    def __init__(self, pi_id: str, encoding: str = ENCODING_MSGPACK,
+                 compress_min_bytes: int = DEFAULT_COMPRESS_MIN_BYTES):
+        if encoding not in ENCODINGS:
+            raise ValueError(f"Unknown snapshot encoding: {encoding}")
+        self.pi_id = pi_id
+        self.use_msgpack = encoding == ENCODING_MSGPACK and msgpack is not None
+        self.compress_min_bytes = compress_min_bytes
+        self.epoch = random.getrandbits(31)
+        self._codes: Dict[str, int] = {}
+        self._ids: List[str] = []
+        self._sent_full = False
+
+    def _code(self, entity_id: str, added: List[Tuple[int, str]]) -> int:
+        code = self._codes.get(entity_id)
+        if code is None:
+            code = self._codes[entity_id] = len(self._ids)
+            self._ids.append(entity_id)
+            added.append((code, entity_id))
+        return code
+
+    def encode(self, states: Dict[str, Any], full: bool = False) -> bytes:
+        """Encode ``states`` (all states when ``full``, else just the changed ones)."""
+        full = full or not self._sent_full
+        added: List[Tuple[int, str]] = []
+        codes = [self._code(entity_id, added) for entity_id in states]
+        body: Dict[str, Any] = {"p": self.pi_id, "t": int(time.time()), "e": self.epoch,
+                                "k": codes, "v": list(states.values())}
+        if full:
+            body["f"] = True
+            body["d"] = self._ids
+            self._sent_full = True
+        elif added:
+            body["a"] = added
+        if self.use_msgpack:
+            content_type, packed = CONTENT_TYPE_MSGPACK, msgpack.packb(body, default=str)
+        else:
+            content_type, packed = CONTENT_TYPE_JSON, dumps(body)
+        if len(packed) >= self.compress_min_bytes:
+            content_type, packed = content_type + ZLIB_SUFFIX, zlib.compress(packed, 6)
+        return frame(content_type, packed)
+
+
+class SnapshotDecoder:
+    """Rebuild each hub's states from plain JSON snapshots or compact deltas."""
+
+    def __init__(self):
+        self._hubs: Dict[str, Dict[str, Any]] = {}
+
+    def decode(self, data: bytes) -> Tuple[str, Dict[str, Any]]:
+        """Apply one payload; returns (pi_id, that hub's current states).
+
+        Raises ValueError for a delta whose dictionary has not been seen yet;
+        the hub recovers with its next full snapshot.
+        """
+        content_type, body = unframe(data)
+        if content_type.endswith(ZLIB_SUFFIX):
+            content_type, body = content_type[:-len(ZLIB_SUFFIX)], zlib.decompress(body)
+        if content_type == CONTENT_TYPE_MSGPACK:
+            if msgpack is None:
+                raise ValueError("msgpack snapshot received but msgpack is not installed")
+            obj = msgpack.unpackb(body, strict_map_key=False)
+        elif content_type == CONTENT_TYPE_JSON:
+            obj = json.loads(body)
+        else:
+            raise ValueError(f"Unsupported snapshot content type: {content_type}")
+        if "states" in obj:
+            # plain snapshot from encode_snapshot()
+            hub = self._hubs[obj["pi_id"]] = {"epoch": None, "ids": [], "states": dict(obj["states"])}
+            return obj["pi_id"], hub["states"]
+        pi_id = obj["p"]
+        hub: Optional[Dict[str, Any]] = self._hubs.get(pi_id)
+        if obj.get("f"):
+            hub = self._hubs[pi_id] = {"epoch": obj["e"], "ids": list(obj["d"]), "states": {}}
+        elif hub is None or hub["epoch"] != obj["e"]:
+            raise ValueError(f"Snapshot delta from {pi_id} before its full snapshot")
+        ids = hub["ids"]
+        for code, entity_id in obj.get("a", ()):
+            ids.extend([None] * (code + 1 - len(ids)))
+            ids[code] = entity_id
+        states = hub["states"]
+        for code, value in zip(obj["k"], obj["v"]):
+            states[ids[code]] = value
+        return pi_id, states
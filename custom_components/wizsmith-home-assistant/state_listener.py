@@ -0,0 +1,142 @@
+"""Push publishing driven by Home Assistant ``state_changed`` events."""
+
+from __future__ import annotations
+import fnmatch
+import logging
+import re
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Set
+
+from homeassistant.const import EVENT_STATE_CHANGED
+from homeassistant.core import Event, HomeAssistant, callback
+
+from .const import *
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def _as_list(value: Any) -> list:
+    # options.json may hold comma separated strings instead of lists
+    if not value:
+        return []
+    if isinstance(value, str):
+        return [v.strip() for v in value.split(",") if v.strip()]
+    return list(value)
+
+
+class EntityFilter:
+    """Match entity ids by domain and fnmatch-style globs; no rules matches everything."""
+
+    def __init__(self, domains: Optional[Iterable[str]] = None, globs: Optional[Iterable[str]] = None):
+        self.domains = frozenset(domains or ())
+        globs = list(globs or ())
+        self._glob_re = re.compile("|".join(fnmatch.translate(g) for g in globs)) if globs else None
+
+    @classmethod
+    def from_config(cls, cfg: Dict[str, Any]) -> "EntityFilter":
+        return cls(_as_list(cfg.get(CONF_PUSH_DOMAINS)), _as_list(cfg.get(CONF_PUSH_ENTITY_GLOBS)))
+
+    def __call__(self, entity_id: str) -> bool:
+        if self.domains and entity_id.split(".", 1)[0] not in self.domains:
+            return False
+        if self._glob_re is not None and not self._glob_re.match(entity_id):
+            return False
+        return True
+
+
+class StatePushListener:
+    """Collect changed entity ids and hand them to ``publish`` after a short debounce.
+
+    Repeated changes of one entity inside the debounce window collapse into a
+    single publish of its latest state.
+    """
+
+    def __init__(self, hass: HomeAssistant, entity_filter: EntityFilter,
+                 publish: Callable[[Set[str]], Awaitable[None]], debounce: float = DEFAULT_PUSH_DEBOUNCE):
+        self.hass = hass
+        self.entity_filter = entity_filter
+        self.publish = publish
+        self.debounce = debounce
+        self._pending: Set[str] = set()
+        self._handle = None
+        self._unsub = None
+
+    @callback
+    def async_start(self) -> None:
+        self._unsub = self.hass.bus.async_listen(
+            EVENT_STATE_CHANGED, self._on_state_changed, event_filter=self._event_filter
+        )
+
+    @callback
+    def async_stop(self) -> None:
+        if self._unsub:
+            self._unsub()
+            self._unsub = None
+        if self._handle:
+            self._handle.cancel()
+            self._handle = None
+
+    @callback
+    def _event_filter(self, event_data) -> bool:
+        return self.entity_filter(event_data["entity_id"])
+
+    @callback
+    def _on_state_changed(self, event: Event) -> None:
+        self._pending.add(event.data["entity_id"])
+        if self._handle is None:
+            self._handle = self.hass.loop.call_later(self.debounce, self._flush)
+
+    @callback
+    def _flush(self) -> None:
+        self._handle = None
+        entity_ids, self._pending = self._pending, set()
+        self.hass.async_create_task(self._publish(entity_ids))
+
+    async def _publish(self, entity_ids: Set[str]) -> None:
+        try:
+            await self.publish(entity_ids)
+        except Exception:
+            _LOGGER.exception("Error publishing %d changed entities", len(entity_ids))
+
+
+class CoalescedFlush:
+    """Publish entities a RateLimiter throttled once their buckets refill.
+
+    Only entity ids are kept, so ``publish`` reads and sends whatever state
+    is current at that point: intermediate values are never sent.
+    """
+
+    def __init__(self, hass: HomeAssistant, limiter, publish: Callable[[Set[str]], Awaitable[None]]):
+        self.hass = hass
+        self.limiter = limiter
+        self.publish = publish
+        self._handle = None
+
+    @callback
+    def async_schedule(self) -> None:
+        """Arm a timer for the earliest pending entity; call after every publish."""
+        delay = self.limiter.next_due()
+        if delay is None or self._handle is not None:
+            return
+        self._handle = self.hass.loop.call_later(delay, self._flush)
+
+    @callback
+    def async_stop(self) -> None:
+        if self._handle:
+            self._handle.cancel()
+            self._handle = None
+
+    @callback
+    def _flush(self) -> None:
+        self._handle = None
+        entity_ids = set(self.limiter.pop_due())
+        if entity_ids:
+            self.hass.async_create_task(self._publish(entity_ids))
+        else:
+            self.async_schedule()
+
+    async def _publish(self, entity_ids: Set[str]) -> None:
+        try:
+            await self.publish(entity_ids)
+        except Exception:
+            _LOGGER.exception("Error publishing %d rate-limited entities", len(entity_ids))
+        self.async_schedule()
@@ -0,0 +1,139 @@
+"""Compact per-entity state for large installations.
+
+Shared by the integration and the add-on agent. A hub with thousands of
+entities used to hold a dict entry (and boxed floats) per entity in every
+consumer: the delta cache, the rate limiter, the agent's device list. The
+registry interns each entity id once and gives it a dense slot number;
+consumers keep their per-entity fields as columns indexed by that slot,
+plain lists for arbitrary values and ``array`` columns for numbers and
+integer millisecond timestamps.
+"""
+
+import array
+import sys
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+class _Unset:
+    __slots__ = ()
+
+    def __repr__(self) -> str:
+        return "UNSET"
+
+
+# marks an empty slot in list columns (entity states may legitimately be None)
+UNSET = _Unset()
+
+
+class StateRegistry:
+    """Interned entity ids mapped to reusable slots, plus the columns consumers register.
+
+    ``lock`` is reentrant and shared: consumers guard their columns with it,
+    so one consumer may call into another (the delta cache consults the
+    rate limiter) while holding it. Discarding or pruning an entity clears
+    its fields in every column.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self._ids: List[Optional[str]] = []
+        self._slots: Dict[str, int] = {}
+        self._free: List[int] = []
+        # name -> (column, fill value)
+        self._columns: Dict[str, Tuple[Any, Any]] = {}
+
+    def column(self, name: str, typecode: Optional[str] = None, fill: Any = UNSET):
+        """Register (or look up) a column; ``typecode`` selects an ``array`` instead of a list."""
+        with self.lock:
+            if name in self._columns:
+                return self._columns[name][0]
+            size = len(self._ids)
+            if typecode is None:
+                col = [fill] * size
+            else:
+                col = array.array(typecode, [fill]) * size
+            self._columns[name] = (col, fill)
+            return col
+
+    def slot(self, entity_id: str) -> int:
+        """Slot of ``entity_id``, allocating one on first sight."""
+        slot = self._slots.get(entity_id)
+        if slot is not None:
+            return slot
+        with self.lock:
+            slot = self._slots.get(entity_id)
+            if slot is not None:
+                return slot
+            entity_id = sys.intern(entity_id)
+            if self._free:
+                slot = self._free.pop()
+                self._ids[slot] = entity_id
+            else:
+                slot = len(self._ids)
+                self._ids.append(entity_id)
+                for col, fill in self._columns.values():
+                    col.append(fill)
+            self._slots[entity_id] = slot
+            return slot
+
+    def find(self, entity_id: str) -> Optional[int]:
+        return self._slots.get(entity_id)
+
+    def entity_id(self, slot: int) -> Optional[str]:
+        return self._ids[slot]
+
+    def items(self) -> Iterator[Tuple[int, str]]:
+        """(slot, entity id) for every live entity."""
+        return ((slot, entity_id) for slot, entity_id in enumerate(self._ids) if entity_id is not None)
+
+    def discard(self, entity_id: str) -> None:
+        with self.lock:
+            slot = self._slots.pop(entity_id, None)
+            if slot is not None:
+                self._release(slot)
+
+    def prune(self, keep: Iterable[str]) -> None:
+        """Discard every entity id not in ``keep``."""
+        with self.lock:
+            for entity_id in [e for e in self._slots if e not in keep]:
+                self._release(self._slots.pop(entity_id))
+
+    def _release(self, slot: int) -> None:
+        self._ids[slot] = None
+        for col, fill in self._columns.values():
+            col[slot] = fill
+        self._free.append(slot)
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def __contains__(self, entity_id: str) -> bool:
+        return entity_id in self._slots
+
+    def nbytes(self) -> int:
+        """Approximate memory held by the id table and columns (not the values they point to)."""
+        with self.lock:
+            total = sys.getsizeof(self._ids) + sys.getsizeof(self._slots) + sys.getsizeof(self._free)
+            for col, _ in self._columns.values():
+                total += sys.getsizeof(col)
+            return total
+
+    def stats(self) -> Dict[str, int]:
+        return {"entities": len(self._slots), "slots": len(self._ids), "bytes": self.nbytes()}
+
+
+class Device:
+    """One entity published by the add-on agent; replaces the per-device dict."""
+
+    __slots__ = ("id", "name", "domain", "device_class", "state")
+
+    def __init__(self, id: str, name: str, domain: str, device_class: Optional[str] = None, state: Any = None):
+        self.id = sys.intern(id)
+        self.name = name
+        self.domain = sys.intern(domain)
+        self.device_class = sys.intern(device_class) if device_class else None
+        self.state = state
+
+    def __repr__(self) -> str:
+        return f"Device({self.id!r}, domain={self.domain!r}, state={self.state!r})"
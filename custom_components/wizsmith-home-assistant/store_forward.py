@@ -0,0 +1,203 @@
+"""Bounded on-disk store-and-forward buffer.
+
+Undeliverable records are appended as lines to numbered segment files.
+Readers replay from the oldest segment and commit what was delivered;
+fully delivered segments are deleted, and when the byte cap is exceeded
+whole segments are evicted oldest first. Shared by the integration and
+the add-on agent, so it only depends on the standard library. All methods
+do blocking file I/O: call them from an executor inside Home Assistant.
+"""
+
+import logging
+import os
+import threading
+from typing import List, Optional, Tuple
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024
+DEFAULT_SEGMENT_BYTES = 1024 * 1024
+SEGMENT_SUFFIX = ".seg"
+CURSOR_FILE = "cursor"
+
+# (segment number, byte offset) just past a record
+Position = Tuple[int, int]
+
+
+class SegmentBuffer:
+    """Append-only segmented write-ahead buffer with a persisted read cursor."""
+
+    def __init__(self, directory: str, max_bytes: int = DEFAULT_MAX_BYTES,
+                 segment_bytes: int = DEFAULT_SEGMENT_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self._lock = threading.RLock()
+        self._segments: List[int] = []
+        self._sizes = {}
+        self._total = 0
+        self._fh = None
+        self._cursor: Position = (0, 0)
+        # counters
+        self.appended = 0
+        self.delivered = 0
+        self.evicted_segments = 0
+        self._load()
+
+    def _path(self, seq: int) -> str:
+        return os.path.join(self.directory, f"{seq:012d}{SEGMENT_SUFFIX}")
+
+    def _load(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        for name in os.listdir(self.directory):
+            if name.endswith(SEGMENT_SUFFIX):
+                seq = int(name[: -len(SEGMENT_SUFFIX)])
+                self._segments.append(seq)
+                self._sizes[seq] = os.path.getsize(self._path(seq))
+        self._segments.sort()
+        # empty segments left behind by earlier starts hold nothing to replay
+        for seq in [s for s in self._segments[:-1] if not self._sizes[s]]:
+            self._segments.remove(seq)
+            self._remove(seq)
+        self._total = sum(self._sizes.values())
+        try:
+            with open(os.path.join(self.directory, CURSOR_FILE), "r") as f:
+                seq, offset = (int(v) for v in f.read().split())
+            if seq in self._sizes:
+                self._cursor = (seq, offset)
+            else:
+                raise ValueError("cursor segment is gone")
+        except (OSError, ValueError):
+            self._cursor = (self._segments[0], 0) if self._segments else (0, 0)
+        if self._segments and self._sizes[self._segments[-1]] < self.segment_bytes:
+            # keep filling the newest segment, minus any torn line a crash left at its end
+            seq = self._segments[-1]
+            self._truncate_torn(seq)
+            self._fh = open(self._path(seq), "ab")
+        else:
+            self._rotate()
+        if not self.empty:
+            _LOGGER.info("Store-and-forward buffer %s holds %d bytes to replay", self.directory, self.pending_bytes())
+
+    def _truncate_torn(self, seq: int) -> None:
+        with open(self._path(seq), "rb+") as f:
+            data = f.read()
+            end = data.rfind(b"\n") + 1
+            if end < len(data):
+                f.truncate(end)
+                self._total -= len(data) - end
+                self._sizes[seq] = end
+                if self._cursor[0] == seq and self._cursor[1] > end:
+                    self._cursor = (seq, end)
+
+    def _rotate(self) -> None:
+        if self._fh:
+            self._fh.close()
+        seq = self._segments[-1] + 1 if self._segments else 0
+        self._fh = open(self._path(seq), "ab")
+        self._segments.append(seq)
+        self._sizes[seq] = 0
+        if len(self._segments) == 1:
+            self._cursor = (seq, 0)
+
+    def _evict(self) -> None:
+        while self._total > self.max_bytes and len(self._segments) > 1:
+            seq = self._segments.pop(0)
+            self._remove(seq)
+            self.evicted_segments += 1
+            if self._cursor[0] <= seq:
+                self._cursor = (self._segments[0], 0)
+            _LOGGER.warning("Store-and-forward buffer full; evicted oldest segment %d", seq)
+
+    def _remove(self, seq: int) -> None:
+        self._total -= self._sizes.pop(seq, 0)
+        try:
+            os.remove(self._path(seq))
+        except OSError:
+            pass
+
+    def append(self, record: bytes) -> None:
+        """Append one record (a single line, without the newline)."""
+        with self._lock:
+            if self._sizes[self._segments[-1]] >= self.segment_bytes:
+                self._rotate()
+            data = record + b"\n"
+            self._fh.write(data)
+            self._fh.flush()
+            self._sizes[self._segments[-1]] += len(data)
+            self._total += len(data)
+            self.appended += 1
+            self._evict()
+
+    def pending_bytes(self) -> int:
+        with self._lock:
+            seq, offset = self._cursor
+            return sum(size for s, size in self._sizes.items() if s >= seq) - offset
+
+    @property
+    def empty(self) -> bool:
+        return self.pending_bytes() <= 0
+
+    def read(self, max_records: int) -> List[Tuple[bytes, Position]]:
+        """Return up to ``max_records`` undelivered records with the position after each."""
+        out = []
+        with self._lock:
+            seq, offset = self._cursor
+            while len(out) < max_records:
+                last = seq == self._segments[-1]
+                with open(self._path(seq), "rb") as f:
+                    f.seek(offset)
+                    while len(out) < max_records:
+                        line = f.readline()
+                        if not line.endswith(b"\n"):
+                            # end of file, or a torn line left by a crash
+                            break
+                        offset += len(line)
+                        if line.strip():
+                            out.append((line[:-1], (seq, offset)))
+                if len(out) >= max_records or last:
+                    break
+                seq, offset = self._segments[self._segments.index(seq) + 1], 0
+        return out
+
+    def commit(self, position: Position, delivered: int = 0) -> None:
+        """Mark everything up to ``position`` as delivered."""
+        with self._lock:
+            self.delivered += delivered
+            seq, offset = position
+            if seq not in self._sizes or position < self._cursor:
+                # evicted while the records were being delivered; _evict moved the cursor past it
+                return
+            for old in [s for s in self._segments if s < seq]:
+                self._segments.remove(old)
+                self._remove(old)
+            self._cursor = (seq, offset)
+            tmp = os.path.join(self.directory, CURSOR_FILE + ".tmp")
+            with open(tmp, "w") as f:
+                f.write(f"{seq} {offset}")
+            os.replace(tmp, os.path.join(self.directory, CURSOR_FILE))
+
+    def close(self) -> None:
+        with self._lock:
+            if self._fh:
+                self._fh.close()
+                self._fh = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "appended": self.appended,
+                "delivered": self.delivered,
+                "evicted_segments": self.evicted_segments,
+                "pending_bytes": self.pending_bytes(),
+                "disk_bytes": self._total,
+            }
+
+
+def open_buffer(directory: str, max_bytes: int = DEFAULT_MAX_BYTES) -> Optional[SegmentBuffer]:
+    """Open a buffer, or return None (buffering disabled) if the directory is unusable."""
+    try:
+        return SegmentBuffer(directory, max_bytes=max_bytes)
+    except OSError as e:
+        _LOGGER.warning("Store-and-forward buffer disabled, cannot use %s: %s", directory, e)
+        return None
@@ -0,0 +1,123 @@
+"""Shared OpenRemote access-token cache.
+
+Used by both the integration (``OpenRemoteClient``) and the add-on agent
+(``main.py``), so it must not depend on Home Assistant or on the HTTP library
+each side uses; callers perform the token requests and hand the responses in.
+"""
+
+import base64
+import json
+import threading
+import time
+from typing import Any, Dict, Optional
+
+# Refresh the token this many seconds before it expires, but after at most this share of its
+# lifetime; short-lived tokens still wait MIN_REFRESH_DELAY seconds between refreshes
+DEFAULT_REFRESH_MARGIN = 30
+REFRESH_LIFETIME_FRACTION = 0.8
+MIN_REFRESH_DELAY = 10
+# Never hand out a token that expires within this many seconds
+EXPIRY_SKEW = 5
+# Lifetime assumed when neither expires_in nor a JWT exp claim is available
+DEFAULT_TOKEN_LIFETIME = 60
+
+
+def decode_token_expiry(token: str) -> Optional[float]:
+    """Return the ``exp`` claim (epoch seconds) of a JWT, or None if unreadable."""
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        claims = json.loads(base64.urlsafe_b64decode(payload))
+        return float(claims["exp"])
+    except Exception:
+        return None
+
+
+class TokenCache:
+    """Thread-safe cache of a Keycloak token endpoint response."""
+
+    def __init__(self, refresh_margin: float = DEFAULT_REFRESH_MARGIN):
+        self.refresh_margin = refresh_margin
+        self._lock = threading.Lock()
+        self.access_token: Optional[str] = None
+        self.refresh_token: Optional[str] = None
+        self.client_id: Optional[str] = None
+        self.issued_at = 0.0
+        self.expires_at = 0.0
+        self.refresh_expires_at = 0.0
+        # counters
+        self.hits = 0
+        self.fetches = 0
+        self.refreshes = 0
+
+    def update(self, response: Dict[str, Any], client_id: Optional[str] = None, refreshed: bool = False) -> Optional[str]:
+        """Store a token response and return its access token."""
+        token = response.get("access_token")
+        if not token:
+            return None
+        now = time.time()
+        expires_at = decode_token_expiry(token)
+        if expires_at is None:
+            expires_at = now + float(response.get("expires_in") or DEFAULT_TOKEN_LIFETIME)
+        refresh_token = response.get("refresh_token")
+        refresh_in = response.get("refresh_expires_in")
+        if not refresh_token:
+            refresh_expires_at = 0.0
+        elif refresh_in:
+            refresh_expires_at = now + float(refresh_in)
+        else:
+            # Keycloak reports 0 for offline tokens that do not expire
+            refresh_expires_at = float("inf")
+
+        with self._lock:
+            self.access_token = token
+            self.issued_at = now
+            self.expires_at = expires_at
+            self.refresh_token = refresh_token
+            self.refresh_expires_at = refresh_expires_at
+            if client_id:
+                self.client_id = client_id
+            if refreshed:
+                self.refreshes += 1
+            else:
+                self.fetches += 1
+        return token
+
+    def get(self) -> Optional[str]:
+        """Return the cached access token if it is still usable."""
+        with self._lock:
+            if self.access_token and time.time() < self.expires_at - EXPIRY_SKEW:
+                self.hits += 1
+                return self.access_token
+        return None
+
+    def invalidate(self) -> None:
+        """Drop the access token, e.g. after the server rejected it."""
+        with self._lock:
+            self.access_token = None
+            self.expires_at = 0.0
+
+    def refresh_delay(self) -> float:
+        """Seconds until the token should be proactively refreshed, never less than MIN_REFRESH_DELAY."""
+        with self._lock:
+            lifetime = self.expires_at - self.issued_at
+            refresh_at = self.issued_at + min(lifetime - self.refresh_margin, lifetime * REFRESH_LIFETIME_FRACTION)
+            return max(float(MIN_REFRESH_DELAY), refresh_at - time.time())
+
+    def refresh_data(self, client_secret: Optional[str] = None) -> Optional[Dict[str, str]]:
+        """Form data for a refresh_token grant, or None if the token cannot be refreshed."""
+        with self._lock:
+            if not self.refresh_token or time.time() >= self.refresh_expires_at - EXPIRY_SKEW:
+                return None
+            data = {
+                "grant_type": "refresh_token",
+                "refresh_token": self.refresh_token,
+                "client_id": self.client_id or "admin-cli",
+            }
+        if client_secret:
+            data["client_secret"] = client_secret
+        return data
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "fetches": self.fetches, "refreshes": self.refreshes}